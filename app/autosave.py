@@ -0,0 +1,178 @@
+'''
+Describes autosave journal of topology model changes, part of main.py
+
+Journal is a file of JSON lines, every line is one record:
+    {"autosave": {"format": "gui-autosave", "version": 1, "project_file": "..."}}
+    {"element": {...element record of project file...}}
+    {"connection": {...connection record of project file...}}
+    {"removed": uid}
+    {"unlinked": [u, v]}
+Journal starts with full snapshot of the model, then only changed elements and
+connections are appended. When appended records outgrow the snapshot, journal
+is compacted: rewritten as a new snapshot. All files are written by one
+background thread in order of submission, so saving never blocks the GUI.
+'''
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from gnpyio import write_lines
+from model import element_records, link_records
+from project import write_project
+
+AUTOSAVE_FORMAT = 'gui-autosave'
+AUTOSAVE_VERSION = 1
+AUTOSAVE_FILE = 'autosave.journal'
+AUTOSAVE_INTERVAL = 30 # seconds between autosaves
+COMPACT_MIN = 1000 # journal is not compacted before this number of appended records
+
+
+# returns journal lines of changed elements and connections of snapshot (element table, connections)
+def change_lines(snapshot, changed, changed_links):
+    table, links = snapshot
+    rows = [table.rows[uid] for uid in changed if uid in table]
+    lines = [json.dumps({'element': record}) for record in element_records(table, rows)]
+    lines.extend(json.dumps({'removed': uid}) for uid in changed if uid not in table)
+    for u, v in changed_links:
+        key = (u, v) if (u, v) in links else (v, u) if (v, u) in links else None
+        if key:
+            record = {'from_node': key[0], 'to_node': key[1], 'conn_dir': links[key]}
+            lines.append(json.dumps({'connection': record}))
+        else:
+            lines.append(json.dumps({'unlinked': [u, v]}))
+
+    return lines
+
+
+# reads journal, returns header and list of ('element', record) and ('connection', record)
+# pairs in the same order as iter_project, so recovered model is loaded as a project
+def read_journal(filepath):
+    header = None
+    elements, links = {}, {}
+    with open(filepath) as f:
+        lines = f.readlines()
+    for i, line in enumerate(lines):
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            if i == len(lines) - 1:
+                break # the last line may be cut by crash while it was written
+            raise
+        if 'autosave' in entry:
+            header = entry['autosave']
+            if header.get('format') != AUTOSAVE_FORMAT:
+                raise ValueError('File is not an autosave journal')
+            if header.get('version', 0) > AUTOSAVE_VERSION:
+                raise ValueError(f'Autosave journal version {header["version"]} is not supported')
+            elements.clear()
+            links.clear()
+        elif 'element' in entry:
+            record = entry['element']
+            elements[record['uid']] = record
+        elif 'removed' in entry:
+            elements.pop(entry['removed'], None)
+        elif 'connection' in entry:
+            record = entry['connection']
+            u, v = record['from_node'], record['to_node']
+            links[(min(u, v), max(u, v))] = record
+        elif 'unlinked' in entry:
+            u, v = entry['unlinked']
+            links.pop((min(u, v), max(u, v)), None)
+    if header is None:
+        raise ValueError('Autosave journal has no header')
+
+    records = [('element', record) for record in elements.values()]
+    records.extend(('connection', record) for record in links.values()
+                   if record['from_node'] in elements and record['to_node'] in elements)
+    return header, records
+
+
+'''
+Background writer of autosave journal, project and exported files
+'''
+class Autosave:
+
+    __slots__ = ('path', 'appended', 'started', '_executor')
+
+    def __init__(self, path):
+        self.path = path # journal file path
+        self.appended = 0 # number of records appended after the last snapshot
+        self.started = False # journal file has a snapshot
+        self._executor = ThreadPoolExecutor(max_workers=1)
+
+    # returns True if the next write has to be a snapshot of whole model,
+    # size is number of elements and connections, changes is number of their changes
+    def needs_snapshot(self, size, changes):
+        return not self.started or self.appended + changes > max(COMPACT_MIN, size)
+
+    # writes snapshot (element table, connections) as a new journal, returns future
+    def compact(self, snapshot, project_file=''):
+        self.started = True
+        self.appended = 0
+        return self._executor.submit(self._write_snapshot, self.path, snapshot, project_file)
+
+    # appends changed elements and connections of snapshot to the journal, returns future
+    def append(self, snapshot, changed, changed_links):
+        self.appended += len(changed) + len(changed_links)
+        return self._executor.submit(self._append, self.path, snapshot, changed, changed_links)
+
+    # removes journal, e.g. when the project is saved, returns future
+    def discard(self):
+        self.started = False
+        self.appended = 0
+        return self._executor.submit(self._remove, self.path)
+
+    # writes snapshot (element table, connections) as project file and removes journal, returns future
+    def save_project(self, filepath, snapshot):
+        self.started = False
+        self.appended = 0
+        return self._executor.submit(self._save_project, filepath, self.path, snapshot)
+
+    # writes lines of exported file, returns future
+    def write_lines(self, filepath, lines):
+        return self._executor.submit(write_lines, filepath, lines)
+
+    # changes journal folder, journal is written again at the next autosave
+    def set_path(self, path):
+        self.discard()
+        self.path = path
+
+    # waits for all submitted writes
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+    # files are written by worker thread, so their paths are passed when write is submitted
+    @staticmethod
+    def _write_snapshot(path, snapshot, project_file):
+        table, links = snapshot
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            header = {'format': AUTOSAVE_FORMAT, 'version': AUTOSAVE_VERSION, 'project_file': project_file}
+            f.write(json.dumps({'autosave': header}) + '\n')
+            for record in element_records(table):
+                f.write(json.dumps({'element': record}) + '\n')
+            for record in link_records(links):
+                f.write(json.dumps({'connection': record}) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _append(path, snapshot, changed, changed_links):
+        lines = change_lines(snapshot, changed, changed_links)
+        with open(path, 'a') as f:
+            f.write('\n'.join(lines) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    @staticmethod
+    def _save_project(filepath, path, snapshot):
+        table, links = snapshot
+        write_project(filepath, element_records(table), link_records(links))
+        # journal is kept if project is not written
+        Autosave._remove(path)
+
+    @staticmethod
+    def _remove(path):
+        if os.path.exists(path):
+            os.remove(path)
@@ -0,0 +1,167 @@
+'''
+Describes headless batch mode, which simulates projects without Kivy, part of main.py
+
+usage: python cli.py [-h] [--mode MODE] [--json-path FOLDER] [--cache-dir FOLDER]
+                     [--output FOLDER] [--jobs N] project [project ...]
+
+Every project file (or imported GNpy network json and Excel workbook) is loaded
+into the same topology model as in application, its elements are verified by
+readiness rules of simulation mode, then paths between all transceivers are
+simulated. Results are written next to the project as json lines, one line per
+path, sorted by source and destination:
+    {"source": "ID1", "destination": "ID2", "required": 12.0, "feasible": "yes", ...result}
+    {"source": "ID1", "destination": "ID3", "error": "No path"}
+Several projects are simulated in parallel worker processes, paths of a single
+project are shared among worker processes instead.
+Exit status is 1 if any project can not be simulated.
+'''
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from config import app_path
+from equipment import load_equipment
+from gnpyio import network_json, iter_import, write_lines
+from model import TopologyModel
+from project import iter_project, is_project_file
+from simulation import SIM_MODES, simulate_all, validate, required_osnr
+
+RESULTS_SUFFIX = '.results.json' # results file is named after the project file
+
+
+# returns topology model of project file, GNpy network json or Excel workbook,
+# readiness of elements is evaluated against equipment library
+def load_model(filepath, equipment):
+    model = TopologyModel()
+    model.set_equipment(equipment)
+    records = iter_project(filepath) if is_project_file(filepath) else iter_import(filepath)
+    for kind, record in records:
+        model.add_record(kind, record)
+    return model
+
+
+# returns element el_id, or uid if el_id is empty
+def _el_name(model, uid):
+    return (uid in model and model.element(uid).info[0]) or str(uid)
+
+
+# returns GNpy network json of topology and reasons why it can not be simulated,
+# verified as in application before simulation, but all reasons are listed
+def simulation_json(model, simmode, equipment):
+    if not len(model):
+        return None, ['Topology has no elements']
+    # in Automatic mode missing configuration is provided by GNpy
+    not_ready = model.not_ready(simmode) if simmode != 'Automatic' else ()
+    if not_ready:
+        return None, ['Elements are not ready: ' + ', '.join(_el_name(model, uid) for uid in not_ready)]
+    json_data = network_json(model, simmode, equipment)
+    return json_data, validate(json_data, equipment)
+
+
+# returns results of simulated paths, (source, destination) -> result or {'error': message}
+def simulate_paths(json_data, equipment, simmode, workers=None):
+    results = {}
+    for kind, *args in simulate_all(json_data, equipment, simmode, workers):
+        if kind == 'result':
+            source, destination, result = args
+            results[(source, destination)] = result
+        elif kind == 'failed':
+            source, destination, message = args
+            results[(source, destination)] = {'error': message}
+    return results
+
+
+# returns results file rows, feasibility is verified against source transceiver mode
+def result_rows(model, equipment, results):
+    rows = []
+    for (source, destination), result in sorted(results.items()):
+        row = {'source': _el_name(model, source), 'destination': _el_name(model, destination)}
+        if 'error' not in result:
+            required = None
+            if source in model and model.element(source).el_type == 'GTransceiver':
+                required = required_osnr(equipment, *model.element(source).params)
+            # GNpy does not compute SNR of signal without noise power
+            snr = result.get('snr_01nm')
+            row['required'] = required
+            row['feasible'] = None if required is None or snr is None else \
+                              'yes' if snr >= required else 'no'
+        row.update(result)
+        rows.append(row)
+    return rows
+
+
+# returns path of results file in output folder, or next to the project file
+def results_file(filepath, output=None):
+    name = os.path.splitext(os.path.basename(filepath))[0] + RESULTS_SUFFIX
+    return os.path.join(output or os.path.dirname(os.path.abspath(filepath)), name)
+
+
+# simulates project and writes its results, returns (project file, error or summary, success),
+# runs in worker process, so failure of one project does not stop the others
+def run_project(filepath, simmode, json_path, cache_dir=None, output=None, workers=None):
+    try:
+        equipment = load_equipment(os.path.join(json_path, 'eqpt_config.json'), cache_dir)
+        model = load_model(filepath, equipment)
+        json_data, errors = simulation_json(model, simmode, equipment)
+        if errors:
+            return filepath, '\n'.join(errors), False
+        results = simulate_paths(json_data, equipment, simmode, workers)
+        rows = result_rows(model, equipment, results)
+        write_lines(results_file(filepath, output), (json.dumps(row) for row in rows))
+    except Exception as err:
+        # any GNpy failure is reported as result of the project
+        return filepath, f'{type(err).__name__}: {err}', False
+
+    failed = sum(1 for row in rows if 'error' in row)
+    feasible = sum(1 for row in rows if row.get('feasible') == 'yes')
+    return filepath, f'{len(rows)} paths, {feasible} feasible, {failed} failed', True
+
+
+# returns command line arguments parser
+def _parser():
+    parser = argparse.ArgumentParser(description='Simulates paths between all transceivers of projects '
+                                                 'without GUI')
+    parser.add_argument('projects', nargs='+', metavar='project',
+                        help='project file, GNpy network json or Excel workbook')
+    parser.add_argument('--mode', choices=SIM_MODES, default='Advanced', help='simulation mode')
+    parser.add_argument('--json-path', default=os.path.join(app_path, 'json'),
+                        help='folder of equipment library eqpt_config.json')
+    parser.add_argument('--cache-dir', help='folder of parsed equipment library cache')
+    parser.add_argument('--output', help='folder of results files, project folder by default')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count(),
+                        help='number of worker processes')
+    return parser
+
+
+# prints result of project simulation, returns its success
+def _report(filepath, message, ok):
+    print(f'{filepath}: {message}', file=sys.stdout if ok else sys.stderr)
+    return ok
+
+
+# simulates projects of command line arguments, returns exit status
+def main(argv=None):
+    args = _parser().parse_args(argv)
+    if args.output:
+        os.makedirs(args.output, exist_ok=True)
+    options = (args.mode, args.json_path, args.cache_dir, args.output)
+
+    success = True
+    if len(args.projects) == 1 or args.jobs < 2:
+        # paths of every project are shared among worker processes
+        workers = args.jobs if args.jobs > 1 else 0
+        for filepath in args.projects:
+            success &= _report(*run_project(filepath, *options, workers))
+    else:
+        # one project per worker process, its paths are simulated in that process
+        with ProcessPoolExecutor(args.jobs) as executor:
+            futures = [executor.submit(run_project, filepath, *options, 0) for filepath in args.projects]
+            for future in futures:
+                success &= _report(*future.result())
+    return 0 if success else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
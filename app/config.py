@@ -15,6 +15,9 @@ cfg_defaults = (('DefaultPath', {'theme_path': os.path.join(app_path, 'themes',
                 ('ColorTheme', {'color': '0.2 0.2 0.2 1'
                                 }
                 ),
+                ('Performance', {'virtual_map': '0'
+                                 }
+                ),
 )
 
 # panelview layout
@@ -49,6 +52,15 @@ cfg_panels = (('Configuration',
                      "desc": "Color of application window expressed in RGBA format, like '0.2 0.2 0.2 1'",
                      "section": "ColorTheme",
                      "key": "color"
+                     },
+                     {"type": "title",
+                      "title": "Performance"
+                      },
+                    {"type": "bool",
+                     "title": "Virtual topology map",
+                     "desc": "Creates widgets only for elements in visible part of topology map, for large networks",
+                     "section": "Performance",
+                     "key": "virtual_map"
                      }
                     ]'''
                 ),
@@ -2,15 +2,21 @@
 Describes topology map element objects, part of main.py
 '''
 from kivy.app import App
+from kivy.clock import Clock
+from kivy.event import EventDispatcher
+from kivy.graphics import InstructionGroup, Color, Mesh
 from kivy.uix.behaviors.drag import DragBehavior
 from kivy.uix.image import Image
-from kivy.uix.widget import Widget
 from kivy.properties import (StringProperty, NumericProperty, ListProperty,
                              OptionProperty, ReferenceListProperty,
                              BooleanProperty)
 
-import random
 from collections import namedtuple
+from math import hypot
+
+from model import PARAM_NAMES, INFO_NAMES, EL_SIDE, is_ready
+from history import link_state
+from spatial import segment_distance, TOUCH_DISTANCE
 
 '''
 Draggable element Baseclass
@@ -27,6 +33,8 @@ class TopomapIcon(DragBehavior, Image):
     el_region = StringProperty()
     el_latitude = NumericProperty()
     el_longitude = NumericProperty()
+    info = ReferenceListProperty(el_id, el_site, el_region, el_latitude, el_longitude)
+    info_names = INFO_NAMES
 
     def __init__(self, active_obj, **kwargs):
         super().__init__(**kwargs)
@@ -34,8 +42,8 @@ class TopomapIcon(DragBehavior, Image):
         self.img_down = active_obj.img_down
         self.el_type = active_obj.el_type
         self.source = self.img
-        # default values
-        self.el_id = 'ID' + ''.join((str(random.randrange(0,9)) for i in range(3)))
+        self.el_uid = None # element uid in TopologyMap.model
+        # default values, el_id is allocated by topology model
         self.el_latitude = round(self.y, 2)
         self.el_longitude = round(self.x, 2)
         # 'automatic' simulation mode
@@ -48,27 +56,7 @@ class TopomapIcon(DragBehavior, Image):
 
             # removes element and all its connections from map and topology graph
             if getattr(self.parent.active_icon, 'el_type', None) == 'REMOVE':
-                # removes related TopomapConnect objects from TopologyMap
-                if self.parent.topology.in_edges(self) or self.parent.topology.out_edges(self):
-                    edges = tuple(self.parent.topology.in_edges(self, data=True)) + \
-                                tuple(self.parent.topology.out_edges(self, data=True))
-                    for u, v, c in edges:
-                        uniq = []
-                        if c not in uniq:
-                            # ensures that connection is removed once
-                            uniq.append(c)
-                            self.parent.remove_widget(c['obj'])
-
-                # clears TabbedPanel tabs Content
-                app = App.get_running_app()
-                if app.root.ids['topomap'].selected is self:
-                    app.root.ids['paramtab'].content = None
-                    app.root.ids['topomap']._refresh_paramtab()
-                    app.root.ids['basictabcontent']._clear_form()
-
-                # related DiGraph edges are removed automatically
-                self.parent.topology.remove_node(self)
-                self.parent.remove_widget(self)
+                self.parent._remove_elements([self])
 
                 return True
 
@@ -97,17 +85,6 @@ class TopomapIcon(DragBehavior, Image):
 
     def on_pos(self, instance, value):
         if self.parent:
-            # updates connection lines
-            if self.parent.topology.in_edges(self) or self.parent.topology.out_edges(self):
-                edges = tuple(self.parent.topology.in_edges(self, data=True)) + \
-                            tuple(self.parent.topology.out_edges(self, data=True))
-                for u, v, c in edges:
-                    uniq = []
-                    if c not in uniq:
-                        # ensures that connection is moved once
-                        uniq.append(c)
-                        c['obj']._update(u, v)
-
             # allows movement only inside visible part of TopologyMap
             dx, dy = self.parent.pos
             # X axis
@@ -121,12 +98,43 @@ class TopomapIcon(DragBehavior, Image):
             elif (self.y + self.height + dy) > (self.parent.y + self.parent.height):
                 self.y = (self.parent.y + self.parent.height) - self.height - dy
 
+            # connection lines and model are updated once per frame
+            self.parent._element_moved(self)
+
     def on_ready(self, instance, value):
         self._ensure_ready(App.get_running_app().simmode.text)
 
-    # verifies that all required parameters are entered
+    def on_params(self, instance, value):
+        if self.parent:
+            # group changes are applied to model by topology map at once
+            if self.parent._group_batch:
+                return
+            # typed value is one undo entry
+            self.parent.history.record([('params', self.el_uid, self.parent.model.element(self.el_uid).params,
+                                         tuple(value))], key=('params', self.el_uid))
+            self.parent.model.set_params(self.el_uid, value)
+            self.parent._element_changed(self.el_uid)
+            self.parent._trigger_counts()
+        self._ensure_ready(App.get_running_app().simmode.text)
+
+    def on_info(self, instance, value):
+        if self.parent:
+            self.parent.history.record([('info', self.el_uid, self.parent.model.element(self.el_uid).info,
+                                         tuple(value))], key=('info', self.el_uid))
+            self.parent.model.set_info(self.el_uid, value)
+
+    # verifies that all required parameters are entered, rules are described in model.py
     def _ensure_ready(self, simmode):
-        raise NotImplementedError('Implementation left for derivative classes')
+        app = App.get_running_app()
+        if self.parent and self.el_uid in self.parent.model:
+            # readiness of attached element is already evaluated by model
+            self.ready = self.parent.model.is_ready(self.el_uid)
+        else:
+            self.ready = is_ready(self.el_type, self.params, simmode, app.equipment)
+
+        # updates 'Parameters' tab
+        if app.root.ids['topomap'].selected is self:
+            app.root.ids['paramtab'].content.items[0].active = self.ready
 
 
 '''
@@ -136,18 +144,7 @@ class GRoadm(TopomapIcon):
 
     loss = NumericProperty(17)
     params = ReferenceListProperty(loss)
-
-    def on_params(self, instance, value):
-        self._ensure_ready(App.get_running_app().simmode.text)
-
-    # verifies that all required parameters are entered
-    def _ensure_ready(self, simmode):
-        # any attenuation value allowed
-        self.ready = True
-        # updates 'Parameters' tab
-        app = App.get_running_app()
-        if app.root.ids['topomap'].selected is self:
-            app.root.ids['paramtab'].content.items[0].active = self.ready
+    param_names = PARAM_NAMES['GRoadm']
 
 
 '''
@@ -159,27 +156,7 @@ class GEdfa(TopomapIcon):
     tilt_target = NumericProperty(0)
     type_variety = StringProperty('-- select --')
     params = ReferenceListProperty(gain_target, tilt_target, type_variety)
-
-    def on_params(self, instance, value):
-        self._ensure_ready(App.get_running_app().simmode.text)
-
-    # verifies that all required parameters are entered correctly
-    def _ensure_ready(self, simmode):
-        app = App.get_running_app()
-        if simmode == 'Automatic' and self.type_variety != '-- select --':
-            self.ready = True
-        elif simmode in ('Advanced', 'Mixed') and self.type_variety != '-- select --':
-            amp = app.root.ids['paramtab'].equipment['Edfa'][self.type_variety]
-            if amp.gain_flatmax >= self.gain_target >= amp.gain_min:
-                self.ready = True
-            else:
-                self.ready = False
-        else:
-            self.ready = False
-
-        # updates 'Parameters' tab
-        if app.root.ids['topomap'].selected is self:
-            app.root.ids['paramtab'].content.items[0].active = self.ready
+    param_names = PARAM_NAMES['GEdfa']
 
 
 '''
@@ -190,21 +167,7 @@ class GTransceiver(TopomapIcon):
     type_variety = StringProperty('-- select --')
     trx_format = StringProperty('-- select --')
     params = ReferenceListProperty(type_variety, trx_format)
-
-    def on_params(self, instance, value):
-        self._ensure_ready(App.get_running_app().simmode.text)
-
-    # verifies that all required parameters are entered
-    def _ensure_ready(self, simmode):
-        if self.type_variety != '-- select --' and self.trx_format != '-- select --':
-            self.ready = True
-        else:
-            self.ready = False
-
-        # updates 'Parameters' tab
-        app = App.get_running_app()
-        if app.root.ids['topomap'].selected is self:
-            app.root.ids['paramtab'].content.items[0].active = self.ready
+    param_names = PARAM_NAMES['GTransceiver']
 
 
 '''
@@ -214,18 +177,7 @@ class GFused(TopomapIcon):
 
     loss = NumericProperty(0.5)
     params = ReferenceListProperty(loss)
-
-    def on_params(self, instance, value):
-        self._ensure_ready(App.get_running_app().simmode.text)
-
-    # verifies that all required parameters are entered
-    def _ensure_ready(self, simmode):
-        # any attenuation value allowed
-        self.ready = True
-        # updates 'Parameters' tab
-        app = App.get_running_app()
-        if app.root.ids['topomap'].selected is self:
-            app.root.ids['paramtab'].content.items[0].active = self.ready
+    param_names = PARAM_NAMES['GFused']
 
 
 '''
@@ -237,27 +189,15 @@ class GFiber(TopomapIcon):
     loss_coef = NumericProperty(0.2)
     type_variety = StringProperty('-- select --')
     params = ReferenceListProperty(length, loss_coef, type_variety)
-
-    def on_params(self, instance, value):
-        self._ensure_ready(App.get_running_app().simmode.text)
-
-    # verifies that all required parameters are entered
-    def _ensure_ready(self, simmode):
-        if self.length > 0:
-            self.ready = True
-        else:
-            self.ready = False
-
-        # updates 'Parameters' tab
-        app = App.get_running_app()
-        if app.root.ids['topomap'].selected is self:
-            app.root.ids['paramtab'].content.items[0].active = self.ready
+    param_names = PARAM_NAMES['GFiber']
 
 
 '''
-Draggable elements connection
+Draggable elements connection, drawn by TopologyMap ConnectionLayer
 '''
-class TopomapConnect(Widget):
+class TopomapConnect(EventDispatcher):
+
+    __events__ = ('on_touch_down', 'on_touch_move', 'on_touch_up')
 
     conn_dir = OptionProperty('bidir', options=['bidir', 'unidir'])
     conn_color = ListProperty()
@@ -266,99 +206,95 @@ class TopomapConnect(Widget):
     def __init__(self, coord, **kwargs):
         super().__init__(**kwargs)
 
-        self.size = (max(abs(coord[0] - coord[2]), 4),
-                     max(abs(coord[1] - coord[3]), 4)
-                     )
-        self.pos = (min(coord[0], coord[2]),
-                    min(coord[1], coord[3])
-                    )
+        self.parent = None # TopologyMap, set when connection is drawn on it
+        self._slot = None # place in ConnectionLayer, managed by the layer
         self.conn_color = [0, 0.6, 0, 1]
-        self.conn_points = coord
+        self._set_coord(coord)
+        # connected topomap icons (A, B), for 'unidir' A is the source,
+        # TopologyMap.topology edges give the opposite lookup
+        self.el_pair = None
 
     def on_touch_down(self, touch):
-        if self.collide_point(*touch.pos):
-            # returns True if touch position is closer than distance value
-            # assumes: A and B are poins of connection Line, C is touch point
-            def _very_close(A, B, C=touch.pos, distance=2):
-                Vector = namedtuple('Vector', 'x y')
-                vec_AB = Vector(B[0] - A[0], B[1] - A[1])
-                vec_AC = Vector(C[0] - A[0], C[1] - A[1])
-                len_AB = pow(vec_AB.x**2 + vec_AB.y**2, 1/2)
-                len_AC = pow(vec_AC.x**2 + vec_AC.y**2, 1/2)
-                mult = vec_AB.x * vec_AC.x + vec_AB.y * vec_AC.y
-                cosA = mult / (len_AB * len_AC)
-                sinA = pow(1-cosA**2, 1/2)
-
-                return True if (len_AC * sinA) <= distance else False
-
-            pos_A = self.conn_points[:2]
-            pos_B = self.conn_points[-2:]
-            # checks for collision in smaller region
-            if _very_close(pos_A, pos_B):
-                self.conn_color = [1, 0, 0, 1]
-
-                # removes connections from map and topology graph
-                if getattr(self.parent.active_icon, 'el_type', None) == 'REMOVE':
-                    # removes all DiGraph edges with associated TopomapConnect object
-                    edges = [(u, v)
-                             for u, v, c in self.parent.topology.edges(data=True)
-                             if c['obj'] is self]
-                    for edge in edges:
-                        self.parent.topology.remove_edge(*edge)
-                    # removes TopomapConnect object from TopologyMap
-                    self.parent.remove_widget(self)
+        pos_A = self.conn_points[:2]
+        pos_B = self.conn_points[-2:]
+        # checks for collision with the Line
+        if segment_distance(*touch.pos, *pos_A, *pos_B) <= TOUCH_DISTANCE:
+            self.conn_color = [1, 0, 0, 1]
 
-                return True
-        return super().on_touch_down(touch)
+            # removes connections from map and topology graph
+            if getattr(self.parent.active_icon, 'el_type', None) == 'REMOVE':
+                # removes DiGraph edges with associated TopomapConnect object
+                A, B = self.el_pair
+                self.parent.topology.remove_edge(A, B)
+                if self.parent.topology.has_edge(B, A):
+                    self.parent.topology.remove_edge(B, A)
+                target, state = link_state(self.parent.model, A.el_uid, B.el_uid)
+                self.parent.model.remove_link(A.el_uid, B.el_uid)
+                self.parent.history.record([('link', target, state, None)])
+                App.get_running_app().root.relink(A.el_uid, B.el_uid)
+                # removes TopomapConnect object from TopologyMap
+                self.parent._remove_connection(self)
+
+            return True
+        return False
+
+    def on_touch_move(self, touch):
+        return False
 
     def on_touch_up(self, touch):
         if not self.conn_color == [0, 0.6, 0, 1]:
             self.conn_color = [0, 0.6, 0, 1]
-        return super().on_touch_up(touch)
+        return False
+
+    def on_conn_color(self, instance, value):
+        if self.parent:
+            self.parent.conn_layer.recolor(self)
+
+    def on_conn_points(self, instance, value):
+        if self.parent:
+            self.parent.conn_layer.update(self)
 
     def on_conn_dir(self, instance, value):
+        A, B = self.el_pair
         if value == 'bidir':
             # adds opposite direction, as connection was unidirectional
-            # assumes one node pair - edge
-            edge = [(u, v)
-                     for u, v, c in self.parent.topology.edges(data=True)
-                     if c['obj'] is self]
-            assert len(edge) == 1, f'For some reason "unidir" connection has {len(edge)} edges'
-            self.parent.topology.add_edge(*edge[0][::-1], obj=self)
+            assert not self.parent.topology.has_edge(B, A), 'For some reason "unidir" connection has 2 edges'
+            self.parent.topology.add_edge(B, A, obj=self)
+            self.parent.model.set_link(A.el_uid, B.el_uid, 'bidir')
 
         elif value == 'unidir':
-            # removes opposite direction, as connection was bidirectional
-            # assumes two node pairs - edges
-            edges = [(u, v)
-                     for u, v, c in self.parent.topology.edges(data=True)
-                     if c['obj'] is self]
-            assert len(edges) == 2, f'For some reason "bidir" connection has {len(edges)} edges'
-            self.parent.topology.remove_edge(*edges[1])
+            # removes opposite direction, as connection was bidirectional, A stays the source
+            assert self.parent.topology.has_edge(B, A), 'For some reason "bidir" connection has 1 edge'
+            self.parent.topology.remove_edge(B, A)
+            self.parent.model.set_link(A.el_uid, B.el_uid, 'unidir')
 
     # changes direction value
     def _change_dir(self):
+        A, B = self.el_pair
+        target, old = link_state(self.parent.model, A.el_uid, B.el_uid)
         self.conn_dir = 'bidir' if self.conn_dir == 'unidir' else 'unidir'
+        self.parent.history.record([('link', target, old, link_state(self.parent.model, A.el_uid, B.el_uid)[1])])
+        App.get_running_app().root.relink(A.el_uid, B.el_uid)
 
     # swaps connection source, used for unidirectional connection
     def _change_dir_src(self):
         if self.conn_dir == 'unidir':
-            # assumes one node pair - edge
-            edge = [(u, v)
-                     for u, v, c in self.parent.topology.edges(data=True)
-                     if c['obj'] is self]
-            assert len(edge) == 1, f'For some reason "unidir" connection has {len(edge)} edges'
-            self.parent.topology.add_edge(*edge[0][::-1], obj=self)
-            self.parent.topology.remove_edge(*edge[0])
+            A, B = self.el_pair
+            target, old = link_state(self.parent.model, A.el_uid, B.el_uid)
+            self.parent.topology.add_edge(B, A, obj=self)
+            self.parent.topology.remove_edge(A, B)
+            self.el_pair = (B, A)
+            self.parent.model.set_link(B.el_uid, A.el_uid, 'unidir')
+            self.parent.history.record([('link', target, old, link_state(self.parent.model, A.el_uid, B.el_uid)[1])])
+            App.get_running_app().root.relink(A.el_uid, B.el_uid)
 
     # updates connection position after TopomapIcon movement
     def _update(self, A, B):
-        self.conn_points = self.get_coord(A, B)
-        self.pos = (min(self.conn_points[0], self.conn_points[2]),
-                    min(self.conn_points[1], self.conn_points[3])
-                    )
-        self.size = (max(abs(self.conn_points[0] - self.conn_points[2]), 4),
-                     max(abs(self.conn_points[1] - self.conn_points[3]), 4)
-                     )
+        self._set_coord(self.get_coord(A, B))
+
+    # sets connection Line coordinates
+    def _set_coord(self, coord):
+        self.conn_points = coord
 
     # calculates and returns connection Line coordinates based on two involved TopomapIcon objects
     @staticmethod
@@ -437,3 +373,159 @@ class TopomapConnect(Widget):
                         pos_B = pos_B._replace(x=x, y=pos_B.y + dy)
 
                     return pos_A + pos_B
+
+    # calculates connection Line coordinates for many connections at once, the same way as
+    # get_coord, but from arrays of A and B icon positions, returns array of rows (xA, yA, xB, yB)
+    @staticmethod
+    def get_coords(x_A, y_A, x_B, y_B, el_side=EL_SIDE):
+        import numpy as np
+
+        dx = dy = el_side / 2
+        # based on calculation from/to center of the icon
+        x_A = np.asarray(x_A, dtype=float) + dx
+        y_A = np.asarray(y_A, dtype=float) + dy
+        x_B = np.asarray(x_B, dtype=float) + dx
+        y_B = np.asarray(y_B, dtype=float) + dy
+        len_x = x_B - x_A
+        len_y = y_B - y_A
+
+        # Line parallel to Y axis or steep Line is cut at top/bottom icon sides,
+        # Line parallel to X axis or flat Line is cut at left/right icon sides
+        vertical = len_x == 0
+        with np.errstate(divide='ignore', invalid='ignore'):
+            a = np.where(vertical, np.inf, len_y / np.where(vertical, 1, len_x))
+        c = y_A - a * x_A
+        flat = np.abs(a) <= 1
+
+        # direction to B: 1 - right/above, -1 - left/below, 0 - icons are too close
+        step_x = np.where(len_x >= dx, 1, np.where(len_x <= -dx, -1, 0))
+        step_y = np.where(len_y >= dy, 1, np.where(len_y <= -dy, -1, 0))
+        step_x = np.where(flat, step_x, 0)
+        step_y = np.where(flat, 0, step_y)
+
+        x1 = x_A + step_x * dx
+        x2 = x_B - step_x * dx
+        y1 = y_A + step_y * dy
+        y2 = y_B - step_y * dy
+        # sloped Line end points stay on the Line (y = ax + c)
+        sloped = ~vertical & (a != 0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            cut_x = sloped & (step_x != 0)
+            y1 = np.where(cut_x, a * x1 + c, y1)
+            y2 = np.where(cut_x, a * x2 + c, y2)
+            cut_y = sloped & (step_y != 0)
+            x1 = np.where(cut_y, (y1 - c) / a, x1)
+            x2 = np.where(cut_y, (y2 - c) / a, x2)
+
+        return np.column_stack((x1, y1, x2, y2))
+
+
+'''
+Connection Lines of topology map drawn from few vertex buffers, Mesh per color
+'''
+class ConnectionLayer:
+
+    line_width = 3
+    chunk_size = 8192 # connections per Mesh, Mesh indices are limited to 2^16 vertices
+
+    def __init__(self):
+        self.canvas = InstructionGroup()
+        self._colors = {} # color -> (InstructionGroup, list of _MeshChunk)
+        self._dirty = set() # chunks with changed vertices
+        self._trigger = Clock.create_trigger(self._flush)
+
+    def __len__(self):
+        return sum(len(chunk.connections) for group, chunks in self._colors.values() for chunk in chunks)
+
+    # draws connection
+    def add(self, connection):
+        color = tuple(connection.conn_color)
+        if color not in self._colors:
+            group = InstructionGroup()
+            group.add(Color(*color))
+            self.canvas.add(group)
+            self._colors[color] = (group, [])
+        group, chunks = self._colors[color]
+        if not chunks or len(chunks[-1].connections) >= self.chunk_size:
+            chunks.append(_MeshChunk())
+            group.add(chunks[-1].mesh)
+
+        chunk = chunks[-1]
+        connection._slot = (chunk, len(chunk.connections))
+        chunk.connections.append(connection)
+        chunk.vertices.extend(self._quad(connection.conn_points))
+        self._changed(chunk)
+
+    # stops drawing connection, the last connection of Mesh takes its place
+    def remove(self, connection):
+        chunk, index = connection._slot
+        connection._slot = None
+        last = chunk.connections.pop()
+        if last is not connection:
+            chunk.connections[index] = last
+            last._slot = (chunk, index)
+            chunk.vertices[index * 16:(index + 1) * 16] = chunk.vertices[-16:]
+        del chunk.vertices[-16:]
+        self._changed(chunk)
+
+    # redraws connection after its Line coordinates are changed
+    def update(self, connection):
+        if connection._slot:
+            chunk, index = connection._slot
+            chunk.vertices[index * 16:(index + 1) * 16] = self._quad(connection.conn_points)
+            self._changed(chunk)
+
+    # moves connection to Mesh of its new color
+    def recolor(self, connection):
+        if connection._slot:
+            self.remove(connection)
+            self.add(connection)
+
+    def clear(self):
+        for connection in [c for group, chunks in self._colors.values()
+                           for chunk in chunks for c in chunk.connections]:
+            connection._slot = None
+        self.canvas.clear()
+        self._colors.clear()
+        self._dirty.clear()
+
+    def _changed(self, chunk):
+        self._dirty.add(chunk)
+        self._trigger()
+
+    # uploads changed vertices, once per frame
+    def _flush(self, *args):
+        for chunk in self._dirty:
+            chunk.upload()
+        self._dirty.clear()
+
+    # returns Mesh vertices of the Line drawn as quad (x, y, u, v per vertex)
+    def _quad(self, points):
+        x1, y1, x2, y2 = points
+        length = hypot(x2 - x1, y2 - y1) or 1
+        # half width normal to the Line
+        nx = (y1 - y2) / length * self.line_width / 2
+        ny = (x2 - x1) / length * self.line_width / 2
+
+        return [x1 + nx, y1 + ny, 0, 0, x2 + nx, y2 + ny, 0, 0,
+                x2 - nx, y2 - ny, 0, 0, x1 - nx, y1 - ny, 0, 0]
+
+
+'''
+Mesh with Lines of up to ConnectionLayer.chunk_size connections
+'''
+class _MeshChunk:
+
+    __slots__ = ('mesh', 'vertices', 'connections', 'quads')
+
+    def __init__(self):
+        self.mesh = Mesh(mode='triangles')
+        self.vertices = [] # 16 values per connection
+        self.connections = [] # TopomapConnect per quad
+        self.quads = 0 # number of quads in uploaded indices
+
+    def upload(self):
+        self.mesh.vertices = self.vertices
+        if self.quads != len(self.connections):
+            self.quads = len(self.connections)
+            self.mesh.indices = [4 * q + i for q in range(self.quads) for i in (0, 1, 2, 2, 3, 0)]
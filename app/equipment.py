@@ -0,0 +1,145 @@
+'''
+Describes cached loading of GNpy equipment library, part of main.py
+
+Parsed equipment library is pickled to the cache folder together with size and
+modification time of every json file it was built from, next load reuses the
+snapshot while none of these files is changed. Lookups used by tab contents and
+readiness rules are indexed once per loaded library.
+'''
+import hashlib
+import importlib.util
+import json
+import os
+import pickle
+
+CACHE_VERSION = 1
+NOT_SELECTED = '-- select --'
+INDEXED_TYPES = ('Transceiver', 'Fiber', 'Edfa')
+
+_loaded = {} # equipment file -> (stamps, equipment), already loaded in this process
+_index = None # index of the last indexed equipment library
+
+
+# returns equipment library from eqpt_config.json file, cache_dir keeps snapshots between launches
+def load_equipment(filepath, cache_dir=None):
+    filepath = os.path.abspath(filepath)
+    if filepath in _loaded:
+        stamps, equipment = _loaded[filepath]
+        if _is_valid(stamps):
+            return equipment
+
+    cache_file = _cache_file(filepath, cache_dir) if cache_dir else None
+    if cache_file:
+        equipment = _read_cache(cache_file)
+        if equipment is not None:
+            return equipment
+
+    from gnpy.core.equipment import equipment_from_json
+
+    with open(filepath) as f:
+        json_data = json.load(f)
+    # dependencies are collected first, equipment_from_json changes json_data
+    files = [filepath] + _edfa_files(filepath, json_data)
+    stamps = _stamps(files)
+    equipment = equipment_from_json(json_data, filepath)
+    _loaded[filepath] = (stamps, equipment)
+    if cache_file:
+        _write_cache(cache_file, stamps, equipment)
+
+    return equipment
+
+
+'''
+Lookup tables of equipment library, built once instead of on every spinner change
+'''
+class EquipmentIndex:
+
+    __slots__ = ('equipment', 'values', 'trx_modes', 'trx_formats', 'gain_ranges')
+
+    def __init__(self, equipment):
+        self.equipment = equipment
+        # equipment type -> spinner values of type varieties
+        self.values = {eq_type: (NOT_SELECTED,) + tuple(equipment[eq_type])
+                       for eq_type in INDEXED_TYPES}
+        # transceiver type variety -> format -> mode
+        self.trx_modes = {variety: {mode['format']: mode for mode in trx.mode}
+                          for variety, trx in equipment['Transceiver'].items()}
+        # transceiver type variety -> spinner values of formats
+        self.trx_formats = {variety: (NOT_SELECTED,) + tuple(modes)
+                            for variety, modes in self.trx_modes.items()}
+        # amplifier type variety -> (gain_min, gain_flatmax)
+        self.gain_ranges = {variety: (amp.gain_min, amp.gain_flatmax)
+                            for variety, amp in equipment['Edfa'].items()}
+
+    # returns transceiver mode, or None if type variety or format is unknown
+    def trx_mode(self, type_variety, trx_format):
+        return self.trx_modes.get(type_variety, {}).get(trx_format)
+
+
+# returns index of equipment library, it is built again only for other library
+def index_equipment(equipment):
+    global _index
+    if _index is None or _index.equipment is not equipment:
+        _index = EquipmentIndex(equipment)
+    return _index
+
+
+# returns Edfa configuration files used by equipment library
+def _edfa_files(filepath, json_data):
+    folder = os.path.dirname(filepath)
+    files = set()
+    for entry in json_data.get('Edfa', ()):
+        files.add(os.path.join(folder, entry.get('advanced_config_from_json', 'default_edfa_config.json')))
+
+    return sorted(files)
+
+
+# returns (file, size, mtime) of every file, including GNpy module which classes are pickled
+def _stamps(files):
+    spec = importlib.util.find_spec('gnpy.core.equipment')
+    stamps = []
+    for path in [spec.origin] + list(files):
+        stat = os.stat(path)
+        stamps.append((path, stat.st_size, stat.st_mtime_ns))
+
+    return tuple(stamps)
+
+
+# verifies that none of stamped files is changed
+def _is_valid(stamps):
+    try:
+        return _stamps(path for path, size, mtime in stamps[1:]) == stamps
+    except OSError:
+        return False
+
+
+# returns cache file name, unique for equipment file path
+def _cache_file(filepath, cache_dir):
+    name = hashlib.sha1(filepath.encode()).hexdigest()[:16]
+    return os.path.join(cache_dir, f'eqpt_{name}.pickle')
+
+
+# returns equipment from snapshot, or None if snapshot is missing or outdated
+def _read_cache(cache_file):
+    try:
+        with open(cache_file, 'rb') as f:
+            version, stamps, equipment = pickle.load(f)
+    except (OSError, EOFError, ValueError, TypeError, AttributeError, ImportError, pickle.UnpicklingError):
+        return None
+    if version != CACHE_VERSION or not _is_valid(stamps):
+        return None
+
+    _loaded[stamps[1][0]] = (stamps, equipment)
+    return equipment
+
+
+# saves snapshot, failed save only means that cache is not used next time
+def _write_cache(cache_file, stamps, equipment):
+    tmp_path = cache_file + '.tmp'
+    try:
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        with open(tmp_path, 'wb') as f:
+            pickle.dump((CACHE_VERSION, stamps, equipment), f, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_file)
+    except (OSError, pickle.PicklingError):
+        pass
@@ -0,0 +1,528 @@
+'''
+Describes conversion of topology model to GNpy network json and import of GNpy
+network json and Excel workbook, part of main.py
+
+GNpy element uid is model uid as string, element el_id is used as its name.
+Fiber or amplifier used in both directions gets one more GNpy element, which uid
+has REVERSE_SUFFIX.
+Imported GNpy element uid becomes el_id of model element. Files are read as a
+stream of project records, so they are loaded like project files.
+Converted elements are cached while their params and info are the same objects,
+model replaces these tuples on every change, so repeated conversion and export
+only convert and serialise changed elements.
+'''
+import json
+import math
+import os
+from collections import Counter, deque
+
+from model import ELEMENT_TYPES, PARAM_NAMES, INFO_NAMES, EL_SIDE
+
+NOT_SELECTED = '-- select --'
+REVERSE_SUFFIX = '_r' # uid suffix of GNpy element for reverse direction
+# topology map element type -> GNpy element type
+GNPY_TYPES = {'GRoadm': 'Roadm',
+              'GEdfa': 'Edfa',
+              'GTransceiver': 'Transceiver',
+              'GFiber': 'Fiber',
+              'GFused': 'Fused',
+}
+MODEL_TYPES = {gnpy_type: el_type for el_type, gnpy_type in GNPY_TYPES.items()}
+WORKBOOK_TYPES = ('.xls',) # xlrd 2 reads only legacy Excel workbooks
+CHUNK_SIZE = 1 << 16 # characters read from json file at once
+IMPORT_COLUMNS = 100 # imported elements are put in grid of this width until they are arranged
+IMPORT_STEP = 2 * EL_SIDE # distance between imported elements
+# GNpy workbook: the first data row and columns of Nodes, Links and Eqpt sheets
+SHEET_START = 5
+NODES_COLUMNS = 7 # City, State, Country, Region, Latitude, Longitude, Type
+LINKS_COLUMNS = 9 # Node A, Node Z, Distance (km), Fiber type, lineic att, Con_in, Con_out, PMD, Cable id
+EQPT_COLUMNS = 7 # Node A, Node Z, amp type, att_in, amp gain, tilt, att_out
+
+
+# returns GNpy element json of model element
+def element_json(uid, el_type, params, info, simmode='Advanced', equipment=None):
+    params = dict(zip(PARAM_NAMES[el_type], params))
+    info = dict(zip(INFO_NAMES, info))
+    element = {'uid': str(uid),
+               'name': info['el_id'] or str(uid),
+               'type': GNPY_TYPES[el_type],
+               'metadata': {'location': {'city': info['el_site'],
+                                         'region': info['el_region'],
+                                         'latitude': info['el_latitude'],
+                                         'longitude': info['el_longitude']}}}
+
+    if el_type in ('GRoadm', 'GFused'):
+        element['params'] = {'loss': params['loss']}
+    elif el_type == 'GFiber':
+        type_variety = params['type_variety']
+        if type_variety == NOT_SELECTED and simmode == 'Automatic' and equipment:
+            # the first fiber of equipment library is the default one
+            type_variety = next(iter(equipment['Fiber']))
+        element['type_variety'] = type_variety
+        element['params'] = {'length': params['length'],
+                             'loss_coef': params['loss_coef'],
+                             'length_units': 'km'}
+    elif el_type == 'GEdfa':
+        element['type_variety'] = params['type_variety']
+        element['operational'] = {'gain_target': params['gain_target'],
+                                  'tilt_target': params['tilt_target']}
+    elif el_type == 'GTransceiver':
+        if params['type_variety'] != NOT_SELECTED:
+            element['type_variety'] = params['type_variety']
+
+    return element
+
+
+'''
+Converted and serialised GNpy elements of model elements, element is valid
+while model keeps the same params and info tuples, cache keeps them alive,
+so identity of tuples can not be reused by other element
+'''
+class ExportCache:
+
+    __slots__ = ('elements', 'reverses', 'texts', 'simmode', 'equipment')
+
+    def __init__(self):
+        self.elements = {} # uid -> (params, info, element json)
+        self.reverses = {} # GNpy uid -> (element json, reverse direction element json)
+        self.texts = {} # GNpy uid -> (element json, serialised element)
+        self.simmode = None # conversion depends on simulation mode and equipment library
+        self.equipment = None
+
+    def clear(self):
+        self.elements.clear()
+        self.reverses.clear()
+        self.texts.clear()
+
+    # returns GNpy element json of model element, converted again only if element is changed
+    def element(self, uid, el_type, params, info, simmode, equipment):
+        if simmode != self.simmode or equipment is not self.equipment:
+            self.clear()
+            self.simmode, self.equipment = simmode, equipment
+        entry = self.elements.get(uid)
+        if entry and entry[0] is params and entry[1] is info:
+            return entry[2]
+        element = element_json(uid, el_type, params, info, simmode, equipment)
+        self.elements[uid] = (params, info, element)
+        return element
+
+    # returns copy of GNpy element json for reverse direction
+    def reverse(self, element):
+        entry = self.reverses.get(element['uid'])
+        if entry and entry[0] is element:
+            return entry[1]
+        reverse = dict(element, uid=element['uid'] + REVERSE_SUFFIX)
+        self.reverses[element['uid']] = (element, reverse)
+        return reverse
+
+    # returns serialised GNpy element json
+    def text(self, element):
+        entry = self.texts.get(element['uid'])
+        if entry and entry[0] is element:
+            return entry[1]
+        text = json.dumps(element, ensure_ascii=False)
+        self.texts[element['uid']] = (element, text)
+        return text
+
+    # forgets elements, which are not in the model any more, uids are model uids of all elements
+    def prune(self, uids):
+        if len(self.elements) <= len(uids):
+            return
+        # GNpy uid is model uid, reverse direction element has suffix
+        self.elements = {uid: entry for uid, entry in self.elements.items() if uid in uids}
+        self.reverses = {key: entry for key, entry in self.reverses.items() if int(key) in uids}
+        self.texts = {key: entry for key, entry in self.texts.items()
+                      if int(key[:-len(REVERSE_SUFFIX)] if key.endswith(REVERSE_SUFFIX) else key) in uids}
+
+
+# returns GNpy network json of topology model,
+# in Automatic mode amplifiers without type variety are left for GNpy to place,
+# returned elements may be shared with cache and must not be changed
+def network_json(model, simmode='Advanced', equipment=None, name='GUI topology', cache=None):
+    if cache is None:
+        cache = ExportCache()
+    table = model.elements
+    elements = []
+    bypassed = set()
+    for row in range(len(table)):
+        uid, el_type = table.uids[row], ELEMENT_TYPES[table.types[row]]
+        params = table.params[row]
+        if simmode == 'Automatic' and el_type == 'GEdfa' and params[2] == NOT_SELECTED:
+            bypassed.add(uid)
+            continue
+        elements.append(cache.element(uid, el_type, params, table.info[row], simmode, equipment))
+
+    edges = set(model.edges())
+    if bypassed:
+        edges = _bypass(edges, bypassed)
+    edges = {(str(u), str(v)) for u, v in edges}
+    elements.extend(_split_directions(elements, edges, cache))
+    cache.prune(table.rows)
+
+    return {'network_name': name,
+            'elements': elements,
+            'connections': [{'from_node': u, 'to_node': v} for u, v in sorted(edges)]}
+
+
+# GNpy fiber and amplifier work in one direction, element connected in both directions
+# is duplicated for reverse direction, edges are changed in place; returns duplicates
+def _split_directions(elements, edges, cache):
+    succs, preds = {}, {}
+    for u, v in edges:
+        succs.setdefault(u, set()).add(v)
+        preds.setdefault(v, set()).add(u)
+
+    split = {element['uid']: element for element in elements
+             if element['type'] in ('Fiber', 'Edfa') and len(preds.get(element['uid'], ())) == 2
+             and preds[element['uid']] == succs.get(element['uid'])}
+    # adjacent split elements form a line, which has the same forward direction
+    # from its lower uid end neighbor; uid -> (forward predecessor, forward successor)
+    forward = {}
+    for uid in split:
+        if uid in forward:
+            continue
+        line = _split_line(uid, split, preds)
+        first, last = line[0], line[-1]
+        start = next(iter(preds[first] - {line[1]})) if len(line) > 1 else min(preds[first])
+        end = next(iter(preds[last] - {line[-2]})) if len(line) > 1 else max(preds[last])
+        if end < start:
+            line.reverse()
+            start, end = end, start
+        for i, node in enumerate(line):
+            forward[node] = (line[i - 1] if i else start, line[i + 1] if i < len(line) - 1 else end)
+
+    # reverse direction goes through duplicates of split neighbors
+    reverse = {uid: uid + REVERSE_SUFFIX for uid in split}
+    for uid, (a, b) in forward.items():
+        edges.discard((b, uid))
+        edges.discard((uid, a))
+        edges.add((reverse.get(b, b), reverse[uid]))
+        edges.add((reverse[uid], reverse.get(a, a)))
+
+    return [cache.reverse(element) for element in split.values()]
+
+
+# returns split elements of line containing uid in connection order,
+# line is closed at the first not split element or at uid in a ring
+def _split_line(uid, split, preds):
+    a, b = sorted(preds[uid])
+    sides = []
+    for node in (a, b):
+        side, prev = [], uid
+        while node in split and node != uid and node not in side:
+            side.append(node)
+            prev, node = node, next(iter(preds[node] - {prev}))
+        sides.append(side)
+
+    return sides[0][::-1] + [uid] + [node for node in sides[1] if node not in sides[0]]
+
+
+# returns lines of GNpy network json text, every element and connection is on its own line,
+# so the file can be imported as a stream; elements are serialised by cache
+def network_lines(json_data, cache=None):
+    if cache is None:
+        cache = ExportCache()
+    return ['{"network_name": ' + json.dumps(json_data['network_name'], ensure_ascii=False) + ',',
+            '"elements": [',
+            ',\n'.join(cache.text(element) for element in json_data['elements']),
+            '],',
+            '"connections": [',
+            # GNpy uids of model elements are numbers with optional suffix, they are not escaped
+            ',\n'.join(f'{{"from_node": "{connection["from_node"]}", "to_node": "{connection["to_node"]}"}}'
+                        for connection in json_data['connections']),
+            ']}']
+
+
+# writes lines of exported file, temporary file is used as for project file
+def write_lines(filepath, lines):
+    tmp_path = filepath + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        for line in lines:
+            f.write(line + '\n')
+    os.replace(tmp_path, filepath)
+
+
+# returns directed edges, where removed nodes are replaced by direct edges around them
+def _bypass(edges, removed):
+    succs, preds = {}, {}
+    for u, v in edges:
+        succs.setdefault(u, set()).add(v)
+        preds.setdefault(v, set()).add(u)
+    for node in removed:
+        ins, outs = preds.pop(node, set()), succs.pop(node, set())
+        for u in ins:
+            succs[u].discard(node)
+        for v in outs:
+            preds[v].discard(node)
+        for u in ins:
+            for v in outs:
+                if u != v:
+                    succs[u].add(v)
+                    preds[v].add(u)
+
+    return {(u, v) for u, nodes in succs.items() for v in nodes}
+
+
+# returns project record of imported element
+def _record(uid, el_type, el_id, location, params):
+    record = {'uid': uid, 'el_type': el_type,
+              'pos': [uid % IMPORT_COLUMNS * IMPORT_STEP, uid // IMPORT_COLUMNS * IMPORT_STEP],
+              'el_id': el_id,
+              'el_site': location.get('city', ''),
+              'el_region': location.get('region', ''),
+              'el_latitude': location.get('latitude', 0),
+              'el_longitude': location.get('longitude', 0)}
+    # missing value (null in GNpy json) is replaced by default parameter of the model
+    record['params'] = {name: value for name, value in params.items()
+                        if name in PARAM_NAMES[el_type] and value is not None}
+    return record
+
+
+# returns project record of GNpy element json
+def element_record(uid, element):
+    el_type = MODEL_TYPES.get(element.get('type'))
+    if el_type is None:
+        raise ValueError(f'Unknown GNpy element type {element.get("type")} of {element.get("uid")}')
+    params = dict(element.get('params') or {})
+    params.update(element.get('operational') or {})
+    if 'type_variety' in element:
+        params['type_variety'] = element['type_variety']
+    if el_type == 'GFiber' and params.get('length_units') == 'm':
+        params['length'] = params.get('length', 0) / 1000
+
+    return _record(uid, el_type, str(element['uid']),
+                   (element.get('metadata') or {}).get('location') or {}, params)
+
+
+# yields items of top level arrays with keys as (key, item), json file is read by chunks,
+# so arrays are never loaded at once, other top level values are skipped
+def _iter_arrays(f, keys):
+    decoder = json.JSONDecoder()
+    buf, pos = '', 0
+
+    # returns the next not whitespace character, or '' at the end of file
+    def peek():
+        nonlocal buf, pos
+        while True:
+            while pos < len(buf) and buf[pos] in ' \t\r\n':
+                pos += 1
+            if pos < len(buf):
+                return buf[pos]
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                return ''
+            buf, pos = chunk, 0
+
+    # consumes the next character, which is one of expected
+    def take(expected):
+        nonlocal pos
+        char = peek()
+        if not char or char not in expected:
+            raise ValueError(f'Expected one of {expected!r} in json file, found {char!r}')
+        pos += 1
+        return char
+
+    # returns the next json value, text is read until value is complete
+    def value():
+        nonlocal buf, pos
+        peek()
+        while True:
+            try:
+                obj, end = decoder.raw_decode(buf, pos)
+            except ValueError:
+                obj, end = None, None
+            # number at the end of buffer may continue in the next chunk
+            if end is None or end == len(buf):
+                chunk = f.read(CHUNK_SIZE)
+                if chunk:
+                    buf, pos = buf[pos:] + chunk, 0
+                    continue
+                if end is None:
+                    raise ValueError(f'Invalid json value: {buf[pos:pos + 50]}')
+            pos = end
+            return obj
+
+    take('{')
+    if peek() == '}':
+        return
+    while True:
+        key = value()
+        take(':')
+        if key in keys and peek() == '[':
+            take('[')
+            if peek() == ']':
+                take(']')
+            else:
+                while True:
+                    yield key, value()
+                    if take(',]') == ']':
+                        break
+        else:
+            value()
+        if take(',}') == '}':
+            return
+
+
+# reads GNpy network json lazily, yields ('element', record) and ('connection', record) pairs,
+# directed GNpy connections in both directions become one 'bidir' connection
+def iter_network(filepath):
+    uids = {} # GNpy uid -> model uid
+    directed = set()
+    pending = [] # connections read before their elements
+
+    def connection(item):
+        u, v = uids[item['from_node']], uids[item['to_node']]
+        directed.add((u, v))
+        conn_dir = 'bidir' if (v, u) in directed else 'unidir'
+        return 'connection', {'from_node': u, 'to_node': v, 'conn_dir': conn_dir}
+
+    with open(filepath) as f:
+        for key, item in _iter_arrays(f, ('elements', 'connections')):
+            if key == 'elements':
+                if item['uid'] in uids:
+                    raise ValueError(f'Duplicate GNpy element {item["uid"]}')
+                uids[item['uid']] = len(uids)
+                yield 'element', element_record(uids[item['uid']], item)
+            elif item['from_node'] in uids and item['to_node'] in uids:
+                yield connection(item)
+            else:
+                pending.append(item)
+    for item in pending:
+        if item['from_node'] not in uids or item['to_node'] not in uids:
+            raise KeyError(f'Connection {item["from_node"]} - {item["to_node"]} refers to unknown element')
+        yield connection(item)
+
+
+# returns values of sheet rows with data, rows are padded to number of columns
+def _sheet_rows(sheet, columns):
+    for row in range(SHEET_START, sheet.nrows):
+        values = sheet.row_values(row, 0, columns)
+        values += [''] * (columns - len(values))
+        if str(values[0]).strip():
+            yield [value.strip() if isinstance(value, str) else value for value in values]
+
+
+# returns number value of workbook cell, or default for empty cell
+def _number(value, default=0):
+    return default if value == '' else float(value)
+
+
+# reads GNpy Excel workbook lazily, yields ('element', record) and ('connection', record) pairs:
+# ROADM node becomes roadm with transceiver, ILA node amplifier, FUSED node fused element
+# and link bidirectional fiber, which has east parameters of the link
+def iter_workbook(filepath):
+    import xlrd
+
+    try:
+        workbook = xlrd.open_workbook(filepath, on_demand=True)
+    except xlrd.XLRDError as err:
+        raise ValueError(f'Workbook can not be read: {err}')
+    with workbook:
+        nodes, links = workbook.sheet_by_name('Nodes'), workbook.sheet_by_name('Links')
+        # ILA node needs exactly two links, as in GNpy
+        degree = Counter()
+        for values in _sheet_rows(links, 2):
+            degree.update(str(city) for city in values[:2])
+        amplifiers = {} # city -> amplifier parameters of Eqpt sheet
+        if 'Eqpt' in workbook.sheet_names():
+            for city, to_city, amp_type, att_in, gain, tilt, att_out in \
+                    _sheet_rows(workbook.sheet_by_name('Eqpt'), EQPT_COLUMNS):
+                if amp_type:
+                    amplifiers.setdefault(str(city), {'type_variety': amp_type, 'gain_target': _number(gain),
+                                                      'tilt_target': _number(tilt)})
+
+        uid = 0
+        locations, cities = {}, {} # city -> location, city -> uid of element connected to fibers
+        for city, state, country, region, latitude, longitude, node_type in _sheet_rows(nodes, NODES_COLUMNS):
+            city, node_type = str(city), str(node_type).upper()
+            if node_type not in ('ROADM', 'ILA', 'FUSED') or node_type == 'ILA' and degree[city] != 2:
+                node_type = 'ROADM' if degree[city] != 2 else 'ILA'
+            location = locations[city] = {'city': city, 'region': region,
+                                          'latitude': _number(latitude), 'longitude': _number(longitude)}
+            cities[city] = uid
+            if node_type == 'ROADM':
+                yield 'element', _record(uid, 'GRoadm', f'roadm {city}', location, {})
+                yield 'element', _record(uid + 1, 'GTransceiver', f'trx {city}', location, {})
+                yield 'connection', {'from_node': uid + 1, 'to_node': uid, 'conn_dir': 'bidir'}
+                uid += 2
+            elif node_type == 'FUSED':
+                yield 'element', _record(uid, 'GFused', f'fused {city}', location, {})
+                uid += 1
+            else:
+                yield 'element', _record(uid, 'GEdfa', f'edfa {city}', location, amplifiers.get(city, {}))
+                uid += 1
+
+        for values in _sheet_rows(links, LINKS_COLUMNS):
+            city_a, city_z, distance, fiber_type, lineic = str(values[0]), str(values[1]), *values[2:5]
+            if city_a not in cities or city_z not in cities:
+                raise KeyError(f'Link {city_a} - {city_z} refers to unknown node')
+            a, z = locations[city_a], locations[city_z]
+            location = {'latitude': (a['latitude'] + z['latitude']) / 2,
+                        'longitude': (a['longitude'] + z['longitude']) / 2}
+            params = {'length': _number(distance, 80), 'loss_coef': _number(lineic, 0.2),
+                      'type_variety': fiber_type or 'SSMF'}
+            yield 'element', _record(uid, 'GFiber', f'fiber ({city_a} → {city_z})-{values[8]}', location, params)
+            yield 'connection', {'from_node': cities[city_a], 'to_node': uid, 'conn_dir': 'bidir'}
+            yield 'connection', {'from_node': uid, 'to_node': cities[city_z], 'conn_dir': 'bidir'}
+            uid += 1
+
+
+# returns import records of GNpy network json or Excel workbook
+def iter_import(filepath):
+    if filepath.lower().endswith(WORKBOOK_TYPES):
+        return iter_workbook(filepath)
+    return iter_network(filepath)
+
+
+# returns uid -> position on topology map according to latitude and longitude of elements,
+# element without location is put to location of the nearest connected element,
+# elements at the same place are put side by side; None if no element has location,
+# edges (u, v) are connections of model if they are not provided
+def geo_positions(model, edges=None):
+    table = model.elements
+    adjacency = model.adjacency
+    if edges is not None:
+        adjacency = {}
+        for u, v in edges:
+            adjacency.setdefault(u, []).append(v)
+            adjacency.setdefault(v, []).append(u)
+    located = {} # uid -> (longitude, latitude)
+    for row in range(len(table)):
+        latitude, longitude = table.info[row][3:5]
+        if latitude or longitude:
+            located[table.uids[row]] = (float(longitude), float(latitude))
+    if not located:
+        return None
+
+    queue = deque(located)
+    while queue:
+        uid = queue.popleft()
+        for n in adjacency.get(uid, ()):
+            if n not in located and n in table:
+                located[n] = located[uid]
+                queue.append(n)
+
+    longitudes = [lon for lon, lat in located.values()]
+    latitudes = [lat for lon, lat in located.values()]
+    west, south = min(longitudes), min(latitudes)
+    span = max(max(longitudes) - west, max(latitudes) - south) or 1
+    # map side grows with number of elements, so they have similar density in any network
+    scale = max(20, math.sqrt(len(table))) * IMPORT_STEP / span
+    placed = Counter() # map cell -> number of elements in it
+    positions = {}
+    for uid, (lon, lat) in located.items():
+        x, y = (lon - west) * scale, (lat - south) * scale
+        cell = (round(x / IMPORT_STEP), round(y / IMPORT_STEP))
+        # elements at the same place form rows of 4 elements
+        k = placed[cell]
+        placed[cell] += 1
+        positions[uid] = (cell[0] * IMPORT_STEP + k % 4 * (EL_SIDE + 10) + EL_SIDE,
+                          cell[1] * IMPORT_STEP + k // 4 * (EL_SIDE + 10) + EL_SIDE)
+
+    # not connected to located elements, put in grid above
+    top = max(y for x, y in positions.values()) + 2 * IMPORT_STEP
+    others = [uid for uid in table.uids if uid not in positions]
+    for i, uid in enumerate(others):
+        positions[uid] = (i % IMPORT_COLUMNS * IMPORT_STEP, top + i // IMPORT_COLUMNS * IMPORT_STEP)
+
+    return positions
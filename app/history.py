@@ -0,0 +1,124 @@
+'''
+Describes undo/redo journal of topology model changes, part of main.py
+
+Journal entry is a list of deltas (kind, target, old, new), where old and new
+are states of one element or connection, None if it does not exist:
+    ('element', uid, record, record) - record is (el_type, x, y, params, info)
+    ('link', (u, v), link, link) - link is ((source, destination), conn_dir), u < v
+    ('params', uid, params, params)
+    ('info', uid, info, info)
+    ('pos', uid, (x, y), (x, y))
+Only changed parts of the model are stored, so history is cheap on large networks.
+'''
+import time
+from collections import deque
+
+HISTORY_SIZE = 1000 # max number of undo entries
+COALESCE_TIME = 1.0 # seconds, changes of the same target merge into one entry meanwhile
+
+
+# returns state of element for 'element' delta
+def element_state(model, uid):
+    record = model.element(uid)
+    return (record.el_type, record.x, record.y, record.params, record.info)
+
+
+# returns target and state of connection for 'link' delta
+def link_state(model, u, v):
+    key = model.link_key(u, v)
+    return (min(u, v), max(u, v)), (key, model.links[key]) if key else None
+
+
+# changes model to given state of delta target, returns affected uids
+def _set_state(model, kind, target, state):
+    if kind == 'element':
+        if state is None:
+            model.remove_element(target)
+        else:
+            el_type, x, y, params, info = state
+            model.add_element(el_type, (x, y), params, info, uid=target)
+        return (target,)
+    elif kind == 'link':
+        if model.link_key(*target):
+            model.remove_link(*target)
+        if state is not None:
+            (u, v), conn_dir = state
+            model.set_link(u, v, conn_dir)
+        return target
+    elif kind == 'params':
+        model.set_params(target, state)
+    elif kind == 'info':
+        model.set_info(target, state)
+    elif kind == 'pos':
+        model.move_elements({target: state})
+    return (target,)
+
+
+'''
+Bounded undo/redo history of model deltas
+'''
+class History:
+
+    __slots__ = ('undo_entries', 'redo_entries', '_last_key', '_last_time')
+
+    def __init__(self, size=HISTORY_SIZE):
+        self.undo_entries = deque(maxlen=size) # the oldest entries are dropped
+        self.redo_entries = []
+        self._last_key = None # coalescing key of the last entry
+        self._last_time = 0
+
+    def clear(self):
+        self.undo_entries.clear()
+        self.redo_entries.clear()
+        self._last_key = None
+
+    # adds entry of deltas, entry with the same key as the previous one is merged into it,
+    # when changes follow each other faster than COALESCE_TIME (e.g. drag move, typing)
+    def record(self, deltas, key=None):
+        deltas = [delta for delta in deltas if delta[2] != delta[3]]
+        if not deltas:
+            return
+        now = time.monotonic()
+        if key is not None and key == self._last_key and now - self._last_time < COALESCE_TIME \
+                and self.undo_entries:
+            self.undo_entries[-1] = self._merge(self.undo_entries[-1], deltas)
+        else:
+            self.undo_entries.append(deltas)
+        self._last_key = key
+        self._last_time = now
+        self.redo_entries.clear()
+
+    # returns entry, where old state comes from the first and new state from the second entry
+    @staticmethod
+    def _merge(first, second):
+        merged = {(kind, target): [kind, target, old, new] for kind, target, old, new in first}
+        for kind, target, old, new in second:
+            if (kind, target) in merged:
+                merged[(kind, target)][3] = new
+            else:
+                merged[(kind, target)] = [kind, target, old, new]
+        return [tuple(delta) for delta in merged.values()]
+
+    # reverts the last entry, returns affected uids or None if there is nothing to undo
+    def undo(self, model):
+        if not self.undo_entries:
+            return None
+        entry = self.undo_entries.pop()
+        self.redo_entries.append(entry)
+        self._last_key = None
+        uids = set()
+        for kind, target, old, new in reversed(entry):
+            uids.update(_set_state(model, kind, target, old))
+        return uids
+
+    # applies the last reverted entry again, returns affected uids or None
+    def redo(self, model):
+        if not self.redo_entries:
+            return None
+        entry = self.redo_entries.pop()
+        self.undo_entries.append(entry)
+        self._last_key = None
+        uids = set()
+        for kind, target, old, new in entry:
+            uids.update(_set_state(model, kind, target, new))
+        return uids
@@ -31,24 +31,37 @@ from kivy.uix.image import Image
 from kivy.uix.widget import Widget
 from kivy.uix.dropdown import DropDown
 from kivy.uix.label import Label
+from kivy.uix.textinput import TextInput
 from kivy.uix.popup import Popup
 from kivy.uix.settings import SettingsWithSidebar
 from kivy.uix.tabbedpanel import TabbedPanel
 from kivy.uix.spinner import Spinner
 from kivy.uix.checkbox import CheckBox
 from kivy.uix.scrollview import ScrollView
-from kivy.properties import (StringProperty, ObjectProperty, ListProperty,
-                             NumericProperty, ReferenceListProperty)
+from kivy.properties import (StringProperty, ObjectProperty, ListProperty, NumericProperty,
+                             ReferenceListProperty, BooleanProperty, AliasProperty)
 from kivy.core.window import Window
 from kivy.factory import Factory
+from kivy.clock import Clock
+from kivy.graphics import InstructionGroup, Color, Line
 
-import networkx as nx
-import platform, os.path
-from collections import namedtuple
+import os.path, sys, time, threading, multiprocessing
+from collections import namedtuple, deque
+from functools import partial
 
-from popups import InfoPopup, OpenProject, SaveProject, QuestionPopup, QuestionMultiPopup
+from popups import InfoPopup, OpenProject, SaveProject, QuestionPopup, QuestionMultiPopup, SimResults
 from config import cfg_defaults, cfg_panels
-from elements import TopomapConnect, GRoadm, GEdfa, GTransceiver, GFiber, GFused
+from project import iter_project, is_project_file
+from autosave import Autosave, AUTOSAVE_FILE, AUTOSAVE_INTERVAL, read_journal
+from equipment import load_equipment, index_equipment
+from model import TopologyModel, EL_SIDE
+from search import SEARCH_LIMIT
+from history import History, element_state, link_state
+from gnpyio import ExportCache, network_json, network_lines, iter_import, geo_positions
+from simulation import (SIM_MODES, PathIndex, simulate, simulate_all, validate, required_osnr,
+                        cache as propagation_cache)
+from elements import (TopomapIcon, TopomapConnect, ConnectionLayer,
+                      GRoadm, GEdfa, GTransceiver, GFiber, GFused)
 
 
 '''
@@ -60,6 +73,29 @@ class Application(App):
     json_path = StringProperty()
     project_path = StringProperty()
     colortheme = ListProperty()
+    virtual_map = BooleanProperty(False)
+    _equipment = None
+
+    # returns GNpy equipment library from json_path folder, it is loaded on first use
+    def _get_equipment(self):
+        if self._equipment is None:
+            self._set_equipment(load_equipment(self.json_path + 'eqpt_config.json', self.user_data_dir))
+        return self._equipment
+
+    def _set_equipment(self, value):
+        self._equipment = value
+        # readiness rules of topology model depend on equipment library
+        if self.root:
+            self.root.ids['topomap']._equipment_changed(value)
+        return True
+
+    equipment = AliasProperty(_get_equipment, _set_equipment)
+
+    # returns lookup index of equipment library
+    def _get_equipment_index(self):
+        return index_equipment(self.equipment)
+
+    equipment_index = AliasProperty(_get_equipment_index, None, bind=['equipment'])
 
     def build(self):
         global app
@@ -70,6 +106,7 @@ class Application(App):
         self.project_path = self.config.get('DefaultPath', 'project_path')
         colortheme = [float(i) for i in self.config.get('ColorTheme', 'color').split()]
         self.colortheme = colortheme if len(colortheme) == 4 else [0.2, 0.2, 0.2, 1] # ensures correct color format
+        self.virtual_map = self.config.getboolean('Performance', 'virtual_map')
         self.title = 'GUI'
         self.use_kivy_settings = False # disables Kivy configuration section
         self.settings_cls = SettingsWithSidebar # Kivy panel style
@@ -77,6 +114,25 @@ class Application(App):
         mainwindow = Builder.load_file('./kv/main.kv')
         return mainwindow
 
+    def on_start(self):
+        # heavy libraries are loaded after the first frame is shown
+        Window.bind(on_flip=self._preload)
+
+    # loads networkx, GNpy and equipment library while user looks at the main window
+    def _preload(self, *args):
+        Window.unbind(on_flip=self._preload)
+        import networkx as nx
+
+        topomap = self.root.ids['topomap']
+        if topomap.topology is None:
+            topomap.topology = nx.DiGraph()
+        self._get_equipment()
+        self.root.check_autosave()
+
+    def on_stop(self):
+        # unsaved changes are kept in autosave journal until the next start
+        self.root.stop_autosave()
+
     def build_config(self, config):
         # sets .ini file format
         for cfg in cfg_defaults:
@@ -95,22 +151,75 @@ class Application(App):
                 app.root.open_info(title='Info', msg='Change will take effect only after application restart')
             elif pair == ('DefaultPath', 'json_path'):
                 self.json_path = os.path.join(value, '')
+                try:
+                    self.equipment = load_equipment(self.json_path + 'eqpt_config.json', self.user_data_dir)
+                except (OSError, ValueError, KeyError, TypeError) as err:
+                    app.root.open_info(title='Error', msg=f'Equipment library is not changed:\n{err}')
+                else:
+                    # cached amplifier outputs are identified only by type variety
+                    propagation_cache.clear()
             elif pair == ('DefaultPath', 'project_path'):
                 self.project_path = value
+                app.root.autosave.set_path(os.path.join(value, AUTOSAVE_FILE))
             elif pair == ('ColorTheme', 'color'):
                 colortheme = [float(i) for i in value.split()]
                 self.colortheme = colortheme if len(colortheme) == 4 else [0.2, 0.2, 0.2, 1]
+            elif pair == ('Performance', 'virtual_map'):
+                self.virtual_map = value == '1'
+
 
+# time in seconds per frame used to create elements of opened project
+LOAD_FRAME_BUDGET = 1 / 120
+# max number of not ready elements listed in error message
+LISTED_ELEMENTS = 10
+# simulation worker processes are forked only on Linux, spawned or forkserver process would
+# import main.py and open one more application window, and macOS system frameworks are not
+# fork safe, elsewhere paths are simulated in one thread
+SIM_WORKERS = None if sys.platform.startswith('linux') else 0
+# delay in seconds after the last element change, when affected paths are simulated again
+RESIMULATE_DELAY = 0.5
 
 '''
 Main application Window
 '''
 class MainWindow(BoxLayout):
 
+    project_file = StringProperty('') # file of opened or saved project
+
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         # workaround to get all MainWindow ids
         app.root = self
+        self._loading = None # scheduled project loading event
+        self._simulation = None # cancel event of running simulation
+        self._sim_events = deque() # simulation events, passed from worker thread
+        self._sim_drain = None # scheduled simulation events processing
+        self.sim_paths = {} # (source uid, destination uid) -> destination transceiver result
+        self.sim_elements = {} # uid -> element result of the last simulated path
+        self.sim_index = PathIndex() # simulated paths by elements they traverse
+        self._sim_path = '' # description of currently simulated path
+        self._sim_mode = None # simulation mode of results
+        self._sim_incremental = False # running simulation updates only some paths
+        self._changed = set() # uids of elements changed after simulation
+        self._retry_failed = False # connections changed, pairs without path are simulated again
+        self._trigger_resimulate = Clock.create_trigger(self._resimulate, RESIMULATE_DELAY)
+        self._saved_version = 0 # model version of opened or saved topology
+        self._autosaved_version = 0 # model version written to autosave journal
+        self.autosave = Autosave(os.path.join(app.project_path, AUTOSAVE_FILE))
+        self.export_cache = ExportCache() # GNpy json of not changed elements
+        Clock.schedule_interval(self._autosave, AUTOSAVE_INTERVAL)
+        Window.bind(on_key_down=self._on_key_down)
+
+    # handles keyboard shortcuts, text inputs keep their own undo
+    def _on_key_down(self, window, key, scancode, codepoint, modifiers):
+        if 'ctrl' not in modifiers or codepoint not in ('z', 'y'):
+            return False
+        if any(widget.focus for root in (self.ids['tabspanel'], self.ids['statusbar'])
+               for widget in root.walk() if isinstance(widget, TextInput)):
+            return False
+        topomap = self.ids['topomap']
+        topomap.redo() if codepoint == 'y' or 'shift' in modifiers else topomap.undo()
+        return True
 
     # closes popup window
     def close_popup(self):
@@ -141,24 +250,106 @@ class MainWindow(BoxLayout):
 
     # clears topology for new Project
     def create_new(self):
-        if app.root.ids['topomap'].topology:
-            #TODO: add test - do topology already saved?
-            def _clear_topology():
-                # clears topology and graphical representation
-                app.root.ids['topomap'].topology.clear()
-                app.root.ids['topomap'].clear_widgets()
-                # clears TabbedPanel tabs Content
-                app.root.ids['paramtab'].content = None
-                app.root.ids['topomap']._refresh_paramtab()
-                app.root.ids['basictabcontent']._clear_form()
-                # closes Popup
-                self._popup.dismiss()
-            def _open_save():
-                self._popup.dismiss()
-                self.open_save()
-
-            self.open_question_multi(msg='Do you want to save changes?\nIf you proceed all changes will be lost!',
-                               func1=_open_save, func2=_clear_topology)
+        if not self.is_modified():
+            self._clear_project()
+            self.project_file = ''
+            return
+
+        def _clear_topology():
+            self._clear_project()
+            self.project_file = ''
+            self.autosave.discard()
+            # closes Popup
+            self._popup.dismiss()
+        def _open_save():
+            self._popup.dismiss()
+            self.open_save()
+
+        self.open_question_multi(msg='Do you want to save changes?\nIf you proceed all changes will be lost!',
+                           func1=_open_save, func2=_clear_topology)
+
+    # returns True if topology is changed after it was opened or saved
+    def is_modified(self):
+        return app.root.ids['topomap'].model.version != self._saved_version
+
+    # marks current topology as saved, only later changes are written to autosave journal
+    def _mark_saved(self):
+        model = app.root.ids['topomap'].model
+        model.take_changes()
+        self._saved_version = self._autosaved_version = model.version
+
+    # writes changes of topology to autosave journal, model is copied in the main thread
+    # and written by background thread, whole journal is rewritten when it grows too much
+    def _autosave(self, *args):
+        model = app.root.ids['topomap'].model
+        if self._loading or model.version == self._autosaved_version:
+            return
+        changed, changed_links = model.take_changes()
+        self._autosaved_version = model.version
+        if self.autosave.needs_snapshot(len(model) + len(model.links), len(changed) + len(changed_links)):
+            future = self.autosave.compact(model.snapshot(), self.project_file)
+        else:
+            # only changed elements are copied, the whole model is copied for compaction
+            future = self.autosave.append(model.snapshot(changed, changed_links), changed, changed_links)
+        future.add_done_callback(partial(self._written, 'autosave', None))
+
+    # writes the last changes and waits for all background writes
+    def stop_autosave(self):
+        if self.is_modified():
+            self._autosave()
+        self.autosave.shutdown()
+
+    # handles finished background write in the main thread, kind is 'autosave', 'project' or 'export'
+    def _written(self, kind, filepath, future):
+        Clock.schedule_once(lambda dt: self._write_result(kind, filepath, future.exception()))
+
+    # reports result of background write, err is None if file is written
+    def _write_result(self, kind, filepath, err):
+        if kind == 'autosave':
+            if err is not None:
+                # the next autosave writes whole journal again
+                self.autosave.started = False
+                self._autosaved_version = -1
+                self.ids['statusbar'].state = f'Autosave failed: {err}'
+        elif err is not None:
+            if kind == 'project':
+                # topology stays not saved, the next autosave writes whole journal again
+                self._saved_version = self._autosaved_version = -1
+            self.open_info(title='Error', msg=f'File can not be saved:\n{err}')
+        else:
+            if kind == 'project':
+                self.project_file = filepath
+            self.ids['statusbar'].state = f'Saved {os.path.basename(filepath)}'
+
+    # offers recovery of topology from autosave journal, which is left by previous session
+    def check_autosave(self):
+        if not os.path.exists(self.autosave.path):
+            return
+
+        def _recover():
+            self._popup.dismiss()
+            self.recover_autosave()
+        def _discard():
+            self._popup.dismiss()
+            self.autosave.discard()
+
+        self.open_question_multi(title='Recovery', msg='Topology of previous session was not saved.\n'
+                                 'Do you want to recover it?', btn=['Recover', 'Discard', 'Later'],
+                                 func1=_recover, func2=_discard)
+
+    # opens topology from autosave journal, it stays not saved
+    def recover_autosave(self):
+        try:
+            header, records = read_journal(self.autosave.path)
+        except (OSError, ValueError, KeyError, TypeError) as err:
+            self.open_info(title='Error', msg=f'Topology can not be recovered:\n{err}')
+            return
+
+        self._clear_project()
+        self.project_file = header.get('project_file', '')
+        # recovered topology is written as a new journal, the old one may end with cut line
+        self.autosave.started = False
+        self._run_steps(self._load_steps(records, saved=False))
 
     # opens Open Project popup window
     def open_open(self):
@@ -175,17 +366,380 @@ class MainWindow(BoxLayout):
                             auto_dismiss=False, content=content)
         self._popup.open()
 
-    # opens project from file and adds elements to the topology map
+    # clears topology, graphical representation and TabbedPanel tabs Content
+    def _clear_project(self):
+        if self._loading:
+            # stops loading of previously opened project
+            self._loading.cancel()
+            self._loading = None
+        self.stop_simulation()
+        self.sim_paths.clear()
+        self.sim_elements.clear()
+        self.sim_index.clear()
+        self._changed.clear()
+        self._retry_failed = False
+        app.root.ids['topomap'].topology.clear()
+        app.root.ids['topomap'].model.clear()
+        app.root.ids['topomap'].el_widgets.clear()
+        app.root.ids['topomap'].conn_layer.clear()
+        app.root.ids['topomap'].clear_widgets()
+        app.root.ids['topomap'].group.clear()
+        app.root.ids['topomap'].history.clear()
+        self.export_cache.clear()
+        app.root.ids['topomap']._trigger_counts()
+        app.root.ids['paramtab'].content = None
+        app.root.ids['topomap']._refresh_paramtab()
+        app.root.ids['basictabcontent']._clear_form()
+        self._mark_saved()
+
+    # opens project from file and adds elements to the topology map,
+    # GNpy network json or Excel workbook is imported as a new not saved topology
     def open_project(self, filepath):
-        #TODO: open topology from file
         self.close_popup()
-        print('topology opened:', filepath)
-
-    # saves active topology to the file
+        if not filepath:
+            return
+
+        self._clear_project()
+        self.autosave.discard()
+        # project is processed in batches across frames, UI stays responsive
+        if is_project_file(filepath):
+            self.project_file = filepath
+            self._run_steps(self._load_steps(iter_project(filepath)))
+        else:
+            self.project_file = ''
+            self._run_steps(self._load_steps(iter_import(filepath), saved=False, arrange=True))
+
+    # executes generator steps in batches across frames
+    def _run_steps(self, steps):
+        if self._loading:
+            self._loading.cancel()
+        self._loading = Clock.schedule_interval(partial(self._load_batch, steps), 0)
+
+    # reads project records into the model, then creates topology map widgets,
+    # saved is False for topology which is not saved in project file yet,
+    # arrange puts elements according to their geographic location
+    def _load_steps(self, records, saved=True, arrange=False):
+        topomap = app.root.ids['topomap']
+        # connections are added after elements are arranged, so they are indexed only once
+        connections = []
+        for kind, record in records:
+            if arrange and kind == 'connection':
+                connections.append(record)
+            else:
+                topomap.model.add_record(kind, record)
+            yield
+        if arrange:
+            positions = geo_positions(topomap.model, ((r['from_node'], r['to_node']) for r in connections))
+            yield
+            for uid, (x, y) in (positions or {}).items():
+                topomap.model.move_element(uid, x, y)
+                yield
+            for record in connections:
+                topomap.model.add_record('connection', record)
+                yield
+        if saved:
+            self._mark_saved()
+        topomap._fit_size()
+        topomap._trigger_counts()
+        if topomap.virtual:
+            topomap._refresh_viewport()
+        else:
+            yield from topomap._materialise_all()
+
+    # executes loading steps until frame time budget is spent
+    def _load_batch(self, steps, dt):
+        deadline = time.perf_counter() + LOAD_FRAME_BUDGET
+        try:
+            for step in steps:
+                if time.perf_counter() > deadline:
+                    # continues in the next frame
+                    return True
+        except (OSError, ValueError, KeyError, TypeError, ImportError) as err:
+            self._loading = None
+            self._clear_project()
+            self.project_file = ''
+            self.open_info(title='Error', msg=f'Project can not be opened:\n{err}')
+            return False
+
+        self._loading = None
+        return False
+
+    # saves active topology to the file, file is written by background thread
     def save_project(self, filepath):
-        #TODO: save topology to file
         self.close_popup()
-        print('topology saved:', filepath)
+        if not filepath:
+            return
+        if not filepath.endswith('.json'):
+            filepath += '.json'
+
+        model = app.root.ids['topomap'].model
+        future = self.autosave.save_project(filepath, model.snapshot())
+        # autosave journal is removed with the written project
+        self._mark_saved()
+        future.add_done_callback(partial(self._written, 'project', filepath))
+
+    # opens Export popup window for GNpy network json
+    def open_export(self):
+        content = SaveProject(_save=self.export_network, _cancel=self.close_popup)
+        self._popup = Popup(title='Export GNpy network', size_hint=(None, None), size=(550, 500),
+                            auto_dismiss=False, content=content)
+        self._popup.open()
+
+    # exports topology to GNpy network json in current simulation mode, Advanced if not selected,
+    # only changed elements are converted and serialised, file is written by background thread
+    def export_network(self, filepath):
+        self.close_popup()
+        if not filepath:
+            return
+        if not filepath.endswith('.json'):
+            filepath += '.json'
+
+        simmode = app.simmode.text if app.simmode.text in SIM_MODES else 'Advanced'
+        json_data = network_json(app.root.ids['topomap'].model, simmode, app.equipment,
+                                 name=os.path.splitext(os.path.basename(filepath))[0], cache=self.export_cache)
+        future = self.autosave.write_lines(filepath, network_lines(json_data, self.export_cache))
+        future.add_done_callback(partial(self._written, 'export', filepath))
+
+    # starts simulation of paths from selected transceiver, GNpy runs in worker thread
+    def run_simulation(self):
+        source = app.root.ids['topomap'].selected
+        if not self._can_simulate():
+            return
+        if not isinstance(source, GTransceiver):
+            self.open_info(title='Error', msg='Select source transceiver on topology map')
+            return
+
+        json_data = self._simulation_json(app.simmode.text)
+        if json_data:
+            self._start_simulation(simulate(json_data, app.equipment, app.simmode.text, source.el_uid))
+
+    # starts simulation of paths between all transceivers, sources are shared among processes
+    def run_all_demands(self):
+        if not self._can_simulate():
+            return
+
+        json_data = self._simulation_json(app.simmode.text)
+        if json_data:
+            self._start_simulation(simulate_all(json_data, app.equipment, app.simmode.text,
+                                                *self._sim_workers()))
+
+    # returns number of worker processes and their multiprocessing context
+    def _sim_workers(self):
+        return SIM_WORKERS, multiprocessing.get_context('fork') if SIM_WORKERS is None else None
+
+    # marks simulated paths traversing changed or removed elements as outdated,
+    # they are simulated again after a short delay; relinked is True if connections
+    # of elements are changed, then pairs without path are simulated again as well
+    def resimulate(self, uids, relinked=False):
+        # paths traversing changed connection may be simulated by running simulation
+        uids = [uid for uid in uids if relinked or uid in self.sim_index.elements]
+        self._changed.update(uids)
+        self._retry_failed |= relinked and bool(self.sim_paths)
+        if uids or self._retry_failed:
+            self._trigger_resimulate()
+
+    # marks simulated paths as outdated after connection between u and v is added, removed
+    # or its direction is changed, results of paths which may use the connection are dropped
+    def relink(self, u, v):
+        for pair in self.sim_index.traversing((u, v)):
+            self.sim_index.remove(pair)
+            self.sim_paths[pair] = {'error': 'Outdated'}
+        self.resimulate((u, v), relinked=True)
+
+    # simulates again only paths traversing changed elements, other results are kept
+    def _resimulate(self, dt):
+        if self._simulation:
+            # changes are collected until running simulation ends
+            self._trigger_resimulate()
+            return
+
+        model = app.root.ids['topomap'].model
+        pairs = self.sim_index.affected(self._changed)
+        if self._retry_failed:
+            # changed connection may link pairs without path
+            pairs.update(pair for pair, result in self.sim_paths.items() if 'error' in result)
+        self._changed.clear()
+        self._retry_failed = False
+        # paths of removed transceivers are dropped
+        for pair in [pair for pair in pairs if pair[0] not in model or pair[1] not in model]:
+            pairs.discard(pair)
+            self.sim_index.remove(pair)
+            del self.sim_paths[pair]
+        if not pairs:
+            return
+
+        json_data, errors = self._simulation_errors(self._sim_mode)
+        if errors:
+            # results are outdated, but user is not interrupted while editing
+            for pair in pairs:
+                self.sim_index.remove(pair)
+                self.sim_paths[pair] = {'error': 'Outdated'}
+            reason = errors[0].replace('\n', ' ')
+            app.root.ids['statusbar'].state = f'Simulation results are outdated: {reason}'
+            return
+        self._start_simulation(simulate_all(json_data, app.equipment, self._sim_mode,
+                                            *self._sim_workers(), pairs=pairs), incremental=True)
+
+    # verifies that simulation can be started
+    def _can_simulate(self):
+        if self._simulation:
+            self.open_info(title='Error', msg='Simulation is already running')
+            return False
+        if app.simmode.text not in SIM_MODES:
+            self.open_info(title='Error', msg='Simulation mode is not selected')
+            return False
+        return True
+
+    # returns GNpy network json of topology, or None if topology is not ready for simulation
+    def _simulation_json(self, simmode):
+        json_data, errors = self._simulation_errors(simmode)
+        if errors:
+            self.open_info(title='Error', msg='\n'.join(errors))
+            return None
+        return json_data
+
+    # returns GNpy network json of topology and reasons why it can not be simulated
+    def _simulation_errors(self, simmode):
+        model = app.root.ids['topomap'].model
+        # in Automatic mode missing configuration is provided by GNpy
+        not_ready = model.not_ready(simmode) if simmode != 'Automatic' else ()
+        if not_ready:
+            names = ', '.join(self._el_name(uid) for uid in not_ready[:LISTED_ELEMENTS])
+            return None, [f'Elements are not ready:\n{names}' +
+                          (' ...' if len(not_ready) > LISTED_ELEMENTS else '')]
+        json_data = network_json(model, simmode, app.equipment, cache=self.export_cache)
+        return json_data, validate(json_data, app.equipment)[:LISTED_ELEMENTS]
+
+    # runs simulation events generator in worker thread,
+    # incremental simulation updates only its paths in existing results
+    def _start_simulation(self, events, incremental=False):
+        if not incremental:
+            self.sim_paths.clear()
+            self.sim_elements.clear()
+            self.sim_index.clear()
+            self._changed.clear()
+            self._retry_failed = False
+            self._sim_mode = app.simmode.text
+        self._sim_incremental = incremental
+        self._sim_events.clear()
+        self._simulation = threading.Event()
+        threading.Thread(target=self._simulation_worker, args=(events, self._simulation),
+                         daemon=True).start()
+        self._sim_drain = Clock.schedule_interval(self._drain_simulation, 0)
+        app.root.ids['statusbar'].state = 'Simulation started'
+
+    # stops running simulation, already received results are kept
+    def stop_simulation(self):
+        if self._simulation:
+            self._simulation.set()
+            self._simulation = None
+            self._sim_drain.cancel()
+            self._sim_events.clear()
+            app.root.ids['statusbar'].state = 'Simulation stopped'
+
+    # runs in worker thread, queues simulation events for UI thread
+    def _simulation_worker(self, events, cancel):
+        queue = self._sim_events
+        try:
+            for event in events:
+                if cancel.is_set():
+                    # closes generator, so its worker processes are shut down
+                    events.close()
+                    return
+                queue.append((cancel, event))
+        except Exception as err:
+            # any GNpy failure is reported to user instead of silently ending the thread
+            queue.append((cancel, ('error', f'{type(err).__name__}: {err}')))
+        else:
+            queue.append((cancel, ('done',)))
+
+    # processes queued simulation events until frame time budget is spent
+    def _drain_simulation(self, dt):
+        deadline = time.perf_counter() + LOAD_FRAME_BUDGET
+        queue = self._sim_events
+        while queue and time.perf_counter() < deadline:
+            cancel, event = queue.popleft()
+            # events of stopped simulation are dropped
+            if cancel is self._simulation:
+                self._sim_event(*event)
+
+    # applies simulation event to results and statusbar
+    def _sim_event(self, kind, *args):
+        statusbar = app.root.ids['statusbar']
+        if kind == 'path':
+            index, total, source, destination = args
+            self._sim_path = f'path {index + 1}/{total} to {self._el_name(destination)}'
+            statusbar.state = f'Simulation: {self._sim_path}'
+        elif kind == 'element':
+            uid, gnpy_uid, result = args
+            if uid is not None:
+                self.sim_elements[uid] = result
+            statusbar.state = (f'Simulation: {self._sim_path}, '
+                               f'{self._el_name(uid) if uid is not None else gnpy_uid} '
+                               f'{result["pout_dbm"]:.2f} dBm')
+        elif kind == 'result':
+            source, destination, result = args
+            self.sim_paths[(source, destination)] = result
+            self.sim_index.add((source, destination), result['path'])
+        elif kind == 'failed':
+            source, destination, message = args
+            self.sim_paths[(source, destination)] = {'error': message}
+            if (source, destination) in self.sim_index.paths:
+                self.sim_index.remove((source, destination))
+        elif kind == 'progress':
+            done, total = args
+            statusbar.state = f'Simulation: {done}/{total} source transceivers, {len(self.sim_paths)} paths'
+        else:
+            self._simulation = None
+            self._sim_drain.cancel()
+            if kind == 'error':
+                statusbar.state = 'Simulation failed'
+                self.open_info(title='Error', msg=f'Simulation failed:\n{args[0]}')
+            elif self._sim_incremental:
+                statusbar.state = f'Simulation updated: {len(self.sim_paths)} paths'
+            else:
+                statusbar.state = f'Simulation finished: {len(self.sim_paths)} paths'
+                self.open_results()
+            if self._changed or self._retry_failed:
+                # elements changed while simulation was running
+                self._trigger_resimulate()
+
+    # returns element el_id, or uid if el_id is empty or element is removed
+    def _el_name(self, uid):
+        model = app.root.ids['topomap'].model
+        return (uid in model and model.element(uid).info[0]) or str(uid)
+
+    # opens table of simulated paths
+    def open_results(self):
+        content = SimResults(_close=self.close_popup, _rows=self._sim_rows())
+        self._popup = Popup(title='Simulation results', size_hint=(None, None), size=(700, 500),
+                            auto_dismiss=False, content=content)
+        self._popup.open()
+
+    # returns table rows of simulated paths, feasibility is verified against source transceiver mode
+    def _sim_rows(self):
+        model = app.root.ids['topomap'].model
+        rows = []
+        for (source, destination), result in sorted(self.sim_paths.items()):
+            # every key is set, as row views are reused by RecycleView
+            row = {'source': self._el_name(source), 'destination': self._el_name(destination),
+                   'snr': '', 'osnr': '', 'required': '', 'feasible': ''}
+            if 'error' in result:
+                row['feasible'] = result['error']
+                rows.append(row)
+                continue
+            required = None
+            if source in model and model.element(source).el_type == 'GTransceiver':
+                required = required_osnr(app.equipment, *model.element(source).params)
+            # GNpy does not compute SNR of signal without noise power
+            snr, osnr = result.get('snr_01nm'), result.get('osnr_ase_01nm')
+            row.update(snr='-' if snr is None else f'{snr:.2f}',
+                       osnr='-' if osnr is None else f'{osnr:.2f}',
+                       required='' if required is None else f'{required:.2f}',
+                       feasible='' if required is None else '-' if snr is None else
+                                'yes' if snr >= required else 'no')
+            rows.append(row)
+        return rows
 
 
 MenuDescr = namedtuple('MenuDescr', 'title func')
@@ -201,15 +755,31 @@ class Menubar(BoxLayout):
                                 FuncDescr('Open', 'Open topology', lambda: app.root.open_open()),
                                 FuncDescr('Save', 'Save topology', lambda: app.root.open_save()),
                                 FuncDescr('Save As', 'Save As topology', lambda: app.root.open_save()),
+                                FuncDescr('Export', 'Export topology to GNpy network json',
+                                          lambda: app.root.open_export()),
                                 FuncDescr('Exit', 'Close application', lambda: app.stop())
                                 )
                        ),
-             MenuDescr('Edit', (FuncDescr('Settings', 'Application settings', lambda: app.open_settings()),
+             MenuDescr('Edit', (FuncDescr('Undo', 'Undo the last change (Ctrl+Z)',
+                                          lambda: app.root.ids['topomap'].undo()),
+                                FuncDescr('Redo', 'Redo the last undone change (Ctrl+Y)',
+                                          lambda: app.root.ids['topomap'].redo()),
+                                FuncDescr('Settings', 'Application settings', lambda: app.open_settings()),
                                 )
                        ),
              MenuDescr('View', (FuncDescr('Fullscreen', 'Fullscreen', Window.maximize),
                                 )
                        ),
+             MenuDescr('Simulation', (FuncDescr('Run', 'Simulate paths from selected transceiver',
+                                                lambda: app.root.run_simulation()),
+                                      FuncDescr('All demands', 'Simulate paths between all transceivers',
+                                                lambda: app.root.run_all_demands()),
+                                      FuncDescr('Stop', 'Stop running simulation',
+                                                lambda: app.root.stop_simulation()),
+                                      FuncDescr('Results', 'Results of the last simulation',
+                                                lambda: app.root.open_results())
+                                      )
+                       ),
              MenuDescr('Help', (FuncDescr('About', 'About application', lambda: app.root.open_info()),
                                 )
                        )
@@ -260,7 +830,7 @@ class MenuButton(Button):
 
 
 ToolIconDescr = namedtuple('ToolIconDescr', 'down normal descr clb')
-SimMode = namedtuple('SimMode', 'name descr clb')
+SimMode = namedtuple('SimMode', 'name descr')
 
 '''
 Main toolbar for Menubar function shortcuts
@@ -284,13 +854,10 @@ class Toolbar(BoxLayout):
                            lambda: app.root.open_info()),
     )
 
-    # simulation modes, changes TopomapIcon.ready state
-    modes = (SimMode('Advanced', 'Advanced simulation mode - uses only provided configuration',
-                     print),
-             SimMode('Mixed', 'Mixed simulation mode - mix of auto and advanced simulation modes',
-                     print),
-             SimMode('Automatic', 'Automatic simulation mode - uses automatically provided configuration',
-                     print)
+    # simulation modes, selected mode changes TopomapIcon.ready state (ToolbarSpinner on_text)
+    modes = (SimMode('Advanced', 'Advanced simulation mode - uses only provided configuration'),
+             SimMode('Mixed', 'Mixed simulation mode - mix of auto and advanced simulation modes'),
+             SimMode('Automatic', 'Automatic simulation mode - uses automatically provided configuration'),
     )
 
     def __init__(self, **kwargs):
@@ -365,6 +932,13 @@ class Sidebar(BoxLayout):
             self.add_widget(SidebarIcon(icon))
         self.add_widget(Widget())
 
+    # returns sidebar icon of element type
+    def get_icon(self, el_type):
+        for icon in self.children:
+            if getattr(icon, 'el_type', None) == el_type:
+                return icon
+        raise KeyError(f'Unknown element type {el_type}')
+
 
 '''
 Sidebar element object
@@ -390,6 +964,20 @@ class SidebarIcon(ToggleButtonBehavior, Image):
             app.root.ids['topomap'].connectable_el = []
 
 
+# distance from visible part of topology map, where elements are created in virtual mode
+VIRTUAL_MARGIN = 100
+# element type -> class of 'parameters' tab content
+PARAM_CONTENTS = {'GRoadm': 'RoadmTabContent',
+                  'GEdfa': 'EdfaTabContent',
+                  'GTransceiver': 'TrxTabContent',
+                  'GFiber': 'FiberTabContent',
+                  'GFused': 'FusedTabContent',
+}
+# min number of connections, which Line coordinates are calculated at once by NumPy
+BULK_CONNECTIONS = 32
+GROUP_COLOR = (0.6, 0.8, 1, 1) # tint of topomap icons selected by rubber band
+BAND_COLOR = (1, 1, 1, 0.7) # rubber band frame color
+
 # BUG: solve ScrollView bug 'RecursionError: maximum recursion depth exceeded in comparison'
 #       sometimes arises when Splitter size is changed
 #       Workaround from kivy/kivy Issue #5638 (app not crushes, but topology map floats):
@@ -404,22 +992,444 @@ class TopologyMap(RelativeLayout):
 
     active_icon = ObjectProperty(None, allownone=True) # active sidebar icon
     connectable_el = ListProperty() # list to store elements for connection
-    topology = ObjectProperty(nx.DiGraph()) # graphical representation topology
+    topology = ObjectProperty(None, allownone=True) # graphical representation topology, networkx DiGraph
+    model = ObjectProperty(None) # headless topology model, viewed by widgets
+    el_widgets = ObjectProperty(None) # model uid -> TopomapIcon object
     selected = ObjectProperty() # topology map selected element, for params
+    virtual = BooleanProperty(False) # creates widgets only for visible elements
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        # property defaults would be shared by all instances
+        self.model = TopologyModel()
+        self.el_widgets = {}
+        self._pool = {} # released topomap icons per element type
+        self._trigger_viewport = Clock.create_trigger(self._refresh_viewport)
+        # connections are drawn by one layer under all topomap icons
+        self.conn_layer = ConnectionLayer()
+        self.canvas.insert(0, self.conn_layer.canvas)
+        self._moved = set() # moved topomap icons, not yet flushed
+        self._trigger_moved = Clock.create_trigger(self._flush_moved)
+        self._trigger_counts = Clock.create_trigger(self._update_counts)
+        self._param_contents = {} # element type -> 'parameters' tab content
+        self.group = set() # uids of elements selected by rubber band
+        self._group_batch = False # group parameters are applied to model at once
+        self._band = None # rubber band (start point, InstructionGroup, Line)
+        self.history = History() # undo/redo journal of model changes
 
     def on_touch_down(self, touch):
         if self.active_icon and self.collide_point(*touch.pos):
             if not self.active_icon.el_type in ['REMOVE', 'CONNECTION']:
-                cls = globals()[self.active_icon.el_type]
-                new_element = cls(self.active_icon,
-                                  pos=self.to_local(*(i - 25 for i in touch.pos))
-                                  )
-                self.topology.add_node(new_element)
-                self.add_widget(new_element)
+                self._add_element(self.active_icon.el_type,
+                                  self.to_local(*(i - 25 for i in touch.pos)))
 
                 return True
 
-        return super().on_touch_down(touch)
+        # only element or connection under the touch receives it, found by spatial index
+        if self.collide_point(*touch.pos):
+            target = self._hit(*self.to_local(*touch.pos))
+            el_type = getattr(self.active_icon, 'el_type', None)
+            # empty place starts rubber band selection
+            if target is None and el_type is None:
+                self._start_band(*self.to_local(*touch.pos))
+                touch.ud['topomap_band'] = True
+                return True
+            # element of group moves or removes whole group
+            if getattr(target, 'el_uid', None) in self.group and len(self.group) > 1:
+                if el_type is None:
+                    self.selected = target
+                    touch.ud['topomap_group'] = self.to_local(*touch.pos)
+                    return True
+                elif el_type == 'REMOVE':
+                    self._remove_elements([self.el_widgets[uid] for uid in self.group])
+                    return True
+            if target is not None:
+                if isinstance(target, TopomapIcon) and el_type is None:
+                    self._set_group(())
+                touch.ud['topomap_target'] = target
+                return self._dispatch_to(target, 'on_touch_down', touch)
+
+        return False
+
+    def on_touch_move(self, touch):
+        if touch.ud.get('topomap_band') and self._band:
+            self._draw_band(*self.to_local(*touch.pos))
+            return True
+
+        last = touch.ud.get('topomap_group')
+        if last is not None:
+            x, y = self.to_local(*touch.pos)
+            dx, dy = self._move_group(x - last[0], y - last[1])
+            touch.ud['topomap_group'] = (last[0] + dx, last[1] + dy)
+            return True
+
+        target = touch.ud.get('topomap_target')
+        if target is not None and target.parent is self:
+            return self._dispatch_to(target, 'on_touch_move', touch)
+
+        return False
+
+    def on_touch_up(self, touch):
+        if touch.ud.get('topomap_band') and self._band:
+            self._end_band(*self.to_local(*touch.pos))
+            return True
+
+        if touch.ud.get('topomap_group') is not None:
+            return True
+
+        target = touch.ud.get('topomap_target')
+        if target is not None and target.parent is self:
+            return self._dispatch_to(target, 'on_touch_up', touch)
+
+        return False
+
+    # draws rubber band frame from the point
+    def _start_band(self, x, y):
+        group = InstructionGroup()
+        group.add(Color(*BAND_COLOR))
+        line = Line(rectangle=(x, y, 0, 0), width=1)
+        group.add(line)
+        self.canvas.after.add(group)
+        self._band = ((x, y), group, line)
+
+    # stretches rubber band frame to the point
+    def _draw_band(self, x, y):
+        (x0, y0), group, line = self._band
+        line.rectangle = (min(x0, x), min(y0, y), abs(x - x0), abs(y - y0))
+
+    # selects elements inside rubber band frame as group
+    def _end_band(self, x, y):
+        (x0, y0), group, line = self._band
+        self.canvas.after.remove(group)
+        self._band = None
+        x0, x = sorted((x0, x))
+        y0, y = sorted((y0, y))
+        table = self.model.elements
+        uids = [uid for uid in self.model.elements_in(x0, y0, x, y)
+                if x0 <= table.xs[table.rows[uid]] and table.xs[table.rows[uid]] + EL_SIDE <= x
+                and y0 <= table.ys[table.rows[uid]] and table.ys[table.rows[uid]] + EL_SIDE <= y]
+        self._set_group(uids)
+
+    # changes group of selected elements, group elements have topomap icons
+    def _set_group(self, uids):
+        for uid in self.group:
+            if uid in self.el_widgets:
+                self.el_widgets[uid].color = (1, 1, 1, 1)
+        self.group = set(uids)
+        created = [self._materialise(uid).el_uid for uid in self.group if uid not in self.el_widgets]
+        self._materialise_links(created)
+        for uid in self.group:
+            self.el_widgets[uid].color = GROUP_COLOR
+
+    # moves group inside topology map, returns applied shift
+    def _move_group(self, dx, dy):
+        elements = [self.el_widgets[uid] for uid in self.group]
+        # group is shifted as whole, the outermost elements limit the shift
+        dx = max(-min(el.x for el in elements), min(dx, self.width - max(el.right for el in elements)))
+        dy = max(-min(el.y for el in elements), min(dy, self.height - max(el.top for el in elements)))
+        for element in elements:
+            element.pos = (element.x + dx, element.y + dy)
+
+        return dx, dy
+
+    # removes topomap icons with all their connections from map, topology graph and model at once
+    def _remove_elements(self, elements):
+        # set ensures that connection is removed once
+        connections = set()
+        for element in elements:
+            for edges in (self.topology.in_edges(element, data='obj'),
+                          self.topology.out_edges(element, data='obj')):
+                connections.update(c for u, v, c in edges)
+        for connection in connections:
+            self._remove_connection(connection)
+
+        # clears TabbedPanel tabs Content
+        if self.selected in elements:
+            app.root.ids['paramtab'].content = None
+            self._refresh_paramtab()
+            app.root.ids['basictabcontent']._clear_form()
+
+        # related DiGraph edges are removed automatically
+        self.topology.remove_nodes_from(elements)
+        uids = [element.el_uid for element in elements]
+        states = [element_state(self.model, uid) for uid in uids]
+        # connections are restored after all elements by undo
+        self.history.record([('link', (min(u, v), max(u, v)), ((u, v), conn_dir), None)
+                             for u, v, conn_dir in self.model.remove_elements(uids)] +
+                            [('element', uid, state, None) for uid, state in zip(uids, states)])
+        for element in elements:
+            del self.el_widgets[element.el_uid]
+            self.group.discard(element.el_uid)
+            self.remove_widget(element)
+        if app.root:
+            app.root.resimulate(uids)
+        self._trigger_counts()
+
+    # sets parameter of group elements, which have type of selected element
+    def _set_group_param(self, param_name, value):
+        el_type = self.selected.el_type
+        elements = [self.el_widgets[uid] for uid in self.group if self.el_widgets[uid].el_type == el_type]
+        self._group_batch = True
+        try:
+            for element in elements:
+                setattr(element, param_name, value)
+        finally:
+            self._group_batch = False
+
+        deltas = []
+        for element in elements:
+            deltas.append(('params', element.el_uid, self.model.element(element.el_uid).params,
+                           tuple(element.params)))
+            self.model.set_params(element.el_uid, element.params)
+        self.history.record(deltas, key=('params', frozenset(self.group)))
+        self._update_ready(element.el_uid for element in elements)
+        if app.root:
+            app.root.resimulate([element.el_uid for element in elements])
+
+    # dispatches touch event to child widget, touch is transformed to local coordinates
+    def _dispatch_to(self, widget, event, touch):
+        touch.push()
+        touch.apply_transform_2d(self.to_local)
+        try:
+            return widget.dispatch(event, touch)
+        finally:
+            touch.pop()
+
+    # returns topomap icon or connection at local coordinates, icons are on top
+    def _hit(self, x, y):
+        uid = self.model.element_at(x, y)
+        if uid in self.el_widgets:
+            return self.el_widgets[uid]
+
+        key = self.model.link_at(x, y)
+        if key is not None and key[0] in self.el_widgets and key[1] in self.el_widgets:
+            A, B = self.el_widgets[key[0]], self.el_widgets[key[1]]
+            edge = self.topology.get_edge_data(A, B) or self.topology.get_edge_data(B, A)
+            if edge:
+                return edge['obj']
+
+        return None
+
+    # creates element of given type and adds it to the model and topology map
+    def _add_element(self, el_type, pos):
+        cls = globals()[el_type]
+        new_element = cls(app.root.ids['sidebar'].get_icon(el_type), pos=pos)
+        new_element.el_id = self.model.new_el_id()
+        new_element.el_uid = self.model.add_element(el_type, new_element.pos, new_element.params,
+                                                    new_element.info)
+        self._attach(new_element)
+        new_element.ready = self.model.is_ready(new_element.el_uid)
+        self.history.record([('element', new_element.el_uid, None,
+                              element_state(self.model, new_element.el_uid))])
+        self._trigger_counts()
+
+        return new_element
+
+    # creates topomap icon for already existing model element, released icons are reused
+    def _materialise(self, uid):
+        record = self.model.element(uid)
+        pool = self._pool.get(record.el_type)
+        if pool:
+            element = pool.pop()
+            element.pos = (record.x, record.y)
+            element.source = element.img
+        else:
+            cls = globals()[record.el_type]
+            element = cls(app.root.ids['sidebar'].get_icon(record.el_type), pos=(record.x, record.y))
+        element.el_uid = uid
+        # values are applied before element is attached, so model is not updated back
+        element.info = record.info
+        element.params = record.params
+        self._attach(element)
+        # readiness depends on simulation mode, reused icon may keep previous state
+        element.ready = record.ready
+
+        return element
+
+    # creates connections between elements and other already created topomap icons,
+    # Line coordinates of all new connections are calculated at once
+    def _materialise_links(self, uids):
+        keys = set()
+        for uid in uids:
+            element = self.el_widgets[uid]
+            for n in self.model.adjacency[uid]:
+                if n in self.el_widgets and not self.topology.has_edge(element, self.el_widgets[n]) \
+                        and not self.topology.has_edge(self.el_widgets[n], element):
+                    keys.add(self.model.link_key(uid, n))
+        keys = list(keys)
+        for (u, v), coord in zip(keys, self._link_coords(keys)):
+            self._add_connection(self.el_widgets[u], self.el_widgets[v], self.model.links[(u, v)],
+                                 coord.tolist())
+
+    # creates topomap icons and connections for all model elements, by chunks
+    def _materialise_all(self, chunk=16):
+        uids = list(self.model.elements)
+        for i in range(0, len(uids), chunk):
+            created = [self._materialise(uid).el_uid for uid in uids[i:i + chunk]
+                       if uid not in self.el_widgets]
+            self._materialise_links(created)
+            yield
+
+    # returns Line coordinates of connections given by node pair keys, from model positions
+    def _link_coords(self, keys):
+        table = self.model.elements
+        rows_A = [table.rows[u] for u, v in keys]
+        rows_B = [table.rows[v] for u, v in keys]
+        return TopomapConnect.get_coords([table.xs[r] for r in rows_A], [table.ys[r] for r in rows_A],
+                                         [table.xs[r] for r in rows_B], [table.ys[r] for r in rows_B])
+
+    # recalculates Line coordinates of connections, many of them at once
+    def _update_connections(self, connections):
+        if len(connections) < BULK_CONNECTIONS:
+            for connection in connections:
+                connection._update(*connection.el_pair)
+        else:
+            connections = list(connections)
+            coords = self._link_coords([(c.el_pair[0].el_uid, c.el_pair[1].el_uid) for c in connections])
+            for connection, coord in zip(connections, coords.tolist()):
+                connection._set_coord(coord)
+
+    # removes topomap icon and its connections from the map, model stays unchanged
+    def _release(self, uid):
+        element = self.el_widgets.pop(uid)
+        for connection in {c for u, v, c in self.topology.in_edges(element, data='obj')} | \
+                {c for u, v, c in self.topology.out_edges(element, data='obj')}:
+            self._remove_connection(connection)
+        self.topology.remove_node(element)
+        self.remove_widget(element)
+        self._pool.setdefault(element.el_type, []).append(element)
+
+    # marks topomap icon as moved, its connections are updated in the next frame
+    def _element_moved(self, element):
+        self._moved.add(element)
+        self._trigger_moved()
+
+    # updates model and connection lines of moved topomap icons,
+    # connection between two moved icons is updated once
+    def _flush_moved(self, *args):
+        moved, self._moved = self._moved, set()
+        # element can be removed or released before flush
+        moved = [element for element in moved
+                 if element.parent is self and self.el_widgets.get(element.el_uid) is element]
+        table = self.model.elements
+        positions = {element.el_uid: tuple(element.pos) for element in moved}
+        # drag move is one undo entry
+        self.history.record([('pos', uid, (table.xs[table.rows[uid]], table.ys[table.rows[uid]]), pos)
+                             for uid, pos in positions.items()], key=('pos', frozenset(positions)))
+        self.model.move_elements(positions)
+        connections = set()
+        for element in moved:
+            for edges in (self.topology.in_edges(element, data='obj'),
+                          self.topology.out_edges(element, data='obj')):
+                connections.update(c for u, v, c in edges)
+        self._update_connections(connections)
+
+    # simulated paths traversing changed or removed element are outdated
+    def _element_changed(self, uid):
+        if app.root:
+            app.root.resimulate([uid])
+
+    # reverts the last change
+    def undo(self):
+        uids = self.history.undo(self.model)
+        if uids is not None:
+            self._sync(uids)
+
+    # applies the last reverted change again
+    def redo(self):
+        uids = self.history.redo(self.model)
+        if uids is not None:
+            self._sync(uids)
+
+    # creates topomap icons of changed model elements again, other icons stay unchanged
+    def _sync(self, uids):
+        self._set_group(())
+        self.connectable_el = []
+        selected = self.selected.el_uid if self.selected is not None else None
+        for uid in uids:
+            if uid in self.el_widgets:
+                self._release(uid)
+        created = [self._materialise(uid).el_uid for uid in uids if uid in self.model]
+        self._materialise_links(created)
+
+        if selected in uids and selected in self.el_widgets:
+            # released icon can be reused for the same element, tabs show its new values anyway
+            if self.selected is self.el_widgets[selected]:
+                self.property('selected').dispatch(self)
+            else:
+                self.selected = self.el_widgets[selected]
+        elif selected in uids:
+            # clears TabbedPanel tabs Content of removed element
+            app.root.ids['paramtab'].content = None
+            self._refresh_paramtab()
+            app.root.ids['basictabcontent']._clear_form()
+        if app.root:
+            # reverted change may be connection change
+            app.root.resimulate(list(uids), relinked=True)
+        self._trigger_counts()
+
+    # scrolls topology map to element and selects it
+    def _jump_to(self, uid):
+        view = self.parent
+        if isinstance(view, ScrollView):
+            x, y = self.model.center(uid)
+            view.scroll_x = min(max((x - view.width / 2) / max(self.width - view.width, 1), 0), 1)
+            view.scroll_y = min(max((y - view.height / 2) / max(self.height - view.height, 1), 0), 1)
+        if uid not in self.el_widgets:
+            self._materialise_links([self._materialise(uid).el_uid])
+        self.selected = self.el_widgets[uid]
+
+    # stops drawing connection, topology and model are not changed
+    def _remove_connection(self, connection):
+        self.conn_layer.remove(connection)
+        connection.parent = None
+
+    # adds topomap icon to the topology map
+    def _attach(self, element):
+        self.el_widgets[element.el_uid] = element
+        self.topology.add_node(element)
+        self.add_widget(element)
+
+    # enlarges topology map to contain all model elements
+    def _fit_size(self):
+        table = self.model.elements
+        if len(table):
+            self.width = max(self.width, max(table.xs) + 2 * EL_SIDE)
+            self.height = max(self.height, max(table.ys) + 2 * EL_SIDE)
+
+    # returns visible part of topology map (x0, y0, x1, y1) in local coordinates
+    def _visible_rect(self, margin=0):
+        view = self.parent
+        x = max(self.width - view.width, 0) * view.scroll_x
+        y = max(self.height - view.height, 0) * view.scroll_y
+        return x - margin, y - margin, x + view.width + margin, y + view.height + margin
+
+    def on_virtual(self, instance, value):
+        if value:
+            self._refresh_viewport()
+        elif app.root:
+            app.root._run_steps(self._materialise_all())
+
+    # in virtual mode creates topomap icons only for elements in visible part of the map
+    def _refresh_viewport(self, *args):
+        if not (self.virtual and isinstance(self.parent, ScrollView)):
+            return
+
+        x0, y0, x1, y1 = self._visible_rect(VIRTUAL_MARGIN)
+        visible = set(self.model.elements_in(x0, y0, x1, y1))
+        # connection crossing visible part requires both of its elements
+        for u, v in self.model.links_in(x0, y0, x1, y1):
+            visible.add(u)
+            visible.add(v)
+
+        # selected and connectable elements are kept, as they are referenced by GUI
+        keep = visible | self.group | {el.el_uid for el in self.connectable_el}
+        if self.selected is not None:
+            keep.add(self.selected.el_uid)
+        for uid in [uid for uid in self.el_widgets if uid not in keep]:
+            self._release(uid)
+        created = [self._materialise(uid).el_uid for uid in visible if uid not in self.el_widgets]
+        self._materialise_links(created)
 
     # connects topomap icons based on accumulated connectable_el objects
     def _connect_el(self):
@@ -429,44 +1439,48 @@ class TopologyMap(RelativeLayout):
         if not (self.topology.has_edge(*self.connectable_el) or
                 self.topology.has_edge(*self.connectable_el[::-1])
                 ):
-            coord = TopomapConnect.get_coord(*self.connectable_el)
-
-            # adds graphical representation
-            # TODO: find the reason of unexpected keyword argument 'canvas'
-            #       workaround at least for my installation
-            connection = TopomapConnect(coord)
-            if platform.system() == 'Windows':
-                self.add_widget(connection)
-            else:
-                self.add_widget(connection, canvas='before')
-            # updates topology, two edges as conn_dir = 'bidir'
-            self.topology.add_edge(*self.connectable_el, obj=connection)
-            self.topology.add_edge(*self.connectable_el[::-1], obj=connection)
+            A, B = self.connectable_el
+            self._add_connection(A, B)
+            target, state = link_state(self.model, A.el_uid, B.el_uid)
+            self.history.record([('link', target, None, state)])
+            app.root.relink(A.el_uid, B.el_uid)
 
         # unselects sidebar icon, active_icon and connectable_el are dropped in on_state event
         self.active_icon.state = 'normal'
 
+    # creates connection between two topomap icons, for 'unidir' A is the source
+    def _add_connection(self, A, B, conn_dir='bidir', coord=None):
+        if coord is None:
+            coord = TopomapConnect.get_coord(A, B)
+
+        # adds graphical representation
+        connection = TopomapConnect(coord)
+        connection.parent = self
+        self.conn_layer.add(connection)
+        # updates topology, two edges as conn_dir = 'bidir'
+        connection.el_pair = (A, B)
+        self.topology.add_edge(A, B, obj=connection)
+        self.topology.add_edge(B, A, obj=connection)
+        self.model.set_link(A.el_uid, B.el_uid, conn_dir)
+
+        # A stays the source of 'unidir' connection
+        connection.conn_dir = conn_dir
+
+        return connection
+
     def on_selected(self, instance, value):
+        if value is None:
+            return
         # updates BasicTabContent
-        app.root.ids['basictab'].content._update(value)
-
-        # changes 'parameters' TabContent
-        if isinstance(value, GRoadm):
-            param_content = RoadmTabContent()
-            app.root.ids['paramtab'].content = param_content
-        elif isinstance(value, GFiber):
-            param_content = FiberTabContent()
-            app.root.ids['paramtab'].content = param_content
-        elif isinstance(value, GFused):
-            param_content = FusedTabContent()
-            app.root.ids['paramtab'].content = param_content
-        elif isinstance(value, GEdfa):
-            param_content = EdfaTabContent()
-            app.root.ids['paramtab'].content = param_content
-        elif isinstance(value, GTransceiver):
-            param_content = TrxTabContent()
-            app.root.ids['paramtab'].content = param_content
-        param_content._update(value)
+        app.root.ids['basictab'].content.rebind(value)
+
+        # changes 'parameters' TabContent, one content per element type is reused
+        param_content = self._param_contents.get(value.el_type)
+        if param_content is None:
+            param_content = globals()[PARAM_CONTENTS[value.el_type]]()
+            self._param_contents[value.el_type] = param_content
+        app.root.ids['paramtab'].content = param_content
+        param_content.rebind(value)
 
         self._refresh_paramtab()
 
@@ -476,29 +1490,67 @@ class TopologyMap(RelativeLayout):
         if selected_tab.text == 'Parameters':
             app.root.ids['tabspanel'].switch_to(selected_tab)
 
-    # changes TopomapIcon subclassed elements readiness state
+    # changes TopomapIcon subclassed elements readiness state,
+    # only elements which readiness differs between modes are updated
     def _refresh_ready(self, mode):
-        if self.children:
-            for child in self.children:
-                try:
-                    # finds elements with .ready attribute
-                    getattr(child, 'ready')
-                except AttributeError:
-                    pass
+        self._update_ready(self.model.set_simmode(mode))
+
+    # evaluates readiness of all elements again with changed equipment library
+    def _equipment_changed(self, equipment):
+        self._update_ready(self.model.set_equipment(equipment))
+
+    # updates readiness of topomap icons from model
+    def _update_ready(self, uids):
+        for uid in uids:
+            element = self.el_widgets.get(uid)
+            if element is not None:
+                element.ready = self.model.is_ready(uid)
+        self._trigger_counts()
+
+    # shows numbers of ready elements in statusbar
+    def _update_counts(self, *args):
+        counts = self.model.readiness.counts(self.model.simmode)
+        ready = sum(n for n, total in counts.values())
+        total = sum(total for n, total in counts.values())
+        types = ', '.join(f'{el_type[1:]} {n}/{el_total}' for el_type, (n, el_total) in counts.items()
+                          if el_total)
+        app.root.ids['statusbar'].counts = f'Ready {ready}/{total}' + (f': {types}' if types else '')
+
+
+'''
+Base of tab contents, form is rebound to selected element
+'''
+class ParamTabContent(GridLayout):
+
+    _rebinding = False # form shows values of element, changes are not written back
+
+    # shows element values in form, reused content is not recreated for every element
+    def rebind(self, element):
+        self._rebinding = True
+        try:
+            self._update(element)
+        finally:
+            self._rebinding = False
+
+    # updates element info when form value change occurs
+    def _update_el(self, param_name, param_type, readonly, value):
+        if not readonly and not self._rebinding:
+            topomap = app.root.ids['topomap']
+            element = topomap.selected
+            # updates element attributes
+            if element and not getattr(element, param_name) == value:
+                value = value if not param_type == 'float' else float(value) if value else 0
+                # parameters are changed for all group elements of the same type
+                if element.el_uid in topomap.group and param_name in element.param_names:
+                    topomap._set_group_param(param_name, value)
                 else:
-                    # changes .ready attribute according to simulation mode
-                    if mode == 'Automatic':
-                        if not child.ready:
-                            child.ready = True
-                    elif mode in ('Advanced', 'Mixed', '-- select --'):
-                        if child.ready:
-                            child.ready = False
+                    setattr(element, param_name, value)
 
 
 '''
 Tab content to display basic element info
 '''
-class BasicTabContent(GridLayout):
+class BasicTabContent(ParamTabContent):
 
     # updates form info when element is selected
     def _update(self, element):
@@ -507,25 +1559,20 @@ class BasicTabContent(GridLayout):
             value = getattr(element, ptinput.param)
             ptinput.text = value if isinstance(value, str) else str(value)
 
-    # updates element info when form value change occurs
-    def _update_el(self, param_name, param_type, readonly, value):
-        if not readonly:
-            element = app.root.ids['topomap'].selected
-            # updates element attributes
-            if element and not getattr(element, param_name) == value:
-                setattr(element, param_name, value
-                        if not param_type == 'float' else float(value) if value else 0)
-
-    # clears form values
+    # clears form values, element is not changed
     def _clear_form(self):
-        for ptinput in (i for i in self.children if isinstance(i, Factory.PTInput)):
-            ptinput.text = '' if not ptinput.input_filter == 'float' else '0'
+        self._rebinding = True
+        try:
+            for ptinput in (i for i in self.children if isinstance(i, Factory.PTInput)):
+                ptinput.text = '' if not ptinput.input_filter == 'float' else '0'
+        finally:
+            self._rebinding = False
 
 
 '''
 Tab content to display Roadm element parameters
 '''
-class RoadmTabContent(GridLayout):
+class RoadmTabContent(ParamTabContent):
 
     # updates form info when element is selected
     def _update(self, element):
@@ -540,20 +1587,11 @@ class RoadmTabContent(GridLayout):
                 else:
                     child.disabled = True
 
-    # updates element info when form value change occurs
-    def _update_el(self, param_name, param_type, readonly, value):
-        if not readonly:
-            element = app.root.ids['topomap'].selected
-            # updates element attributes
-            if element and not getattr(element, param_name) == value:
-                setattr(element, param_name, value
-                        if not param_type == 'float' else float(value) if value else 0)
-
 
 '''
 Tab content to display Fused element parameters
 '''
-class FusedTabContent(GridLayout):
+class FusedTabContent(ParamTabContent):
 
     # updates form info when element is selected
     def _update(self, element):
@@ -569,20 +1607,10 @@ class FusedTabContent(GridLayout):
                     child.disabled = True
 
 
-    # updates element info when form value change occurs
-    def _update_el(self, param_name, param_type, readonly, value):
-        if not readonly:
-            element = app.root.ids['topomap'].selected
-            # updates element attributes
-            if element and not getattr(element, param_name) == value:
-                setattr(element, param_name, value
-                        if not param_type == 'float' else float(value) if value else 0)
-
-
 '''
 Tab content to display Fiber element parameters
 '''
-class FiberTabContent(GridLayout):
+class FiberTabContent(ParamTabContent):
 
     # updates form info when element is selected
     def _update(self, element):
@@ -600,15 +1628,6 @@ class FiberTabContent(GridLayout):
                 else:
                     child.disabled = True
 
-    # updates element info when form value change occurs
-    def _update_el(self, param_name, param_type, readonly, value):
-        if not readonly:
-            element = app.root.ids['topomap'].selected
-            # updates element attributes
-            if element and not getattr(element, param_name) == value:
-                setattr(element, param_name, value
-                        if not param_type == 'float' else float(value) if value else 0)
-
     # displays equipment values from equipment.json
     def _update_eqpt(self, variety, fiber_disp, fiber_gamma):
         if not variety in ('-- select --'):
@@ -622,7 +1641,7 @@ class FiberTabContent(GridLayout):
 '''
 Tab content to display Edfa element parameters
 '''
-class EdfaTabContent(GridLayout):
+class EdfaTabContent(ParamTabContent):
 
     # updates form info when element is selected
     def _update(self, element):
@@ -640,20 +1659,10 @@ class EdfaTabContent(GridLayout):
                 else:
                     child.disabled = True
 
-    # updates element info when form value change occurs
-    def _update_el(self, param_name, param_type, readonly, value):
-        if not readonly:
-            element = app.root.ids['topomap'].selected
-            # updates element attributes
-            if element and not getattr(element, param_name) == value:
-                setattr(element, param_name, value
-                        if not param_type == 'float' else float(value) if value else 0)
-
     # displays equipment values from equipment.json
     def _update_eqpt(self, variety, edfa_gmin, edfa_gmax, edfa_pmax):
         if not variety in ('-- select --'):
-            edfa_gmin.text = str(self.type_varieties[variety].gain_min)
-            edfa_gmax.text = str(self.type_varieties[variety].gain_flatmax)
+            edfa_gmin.text, edfa_gmax.text = (str(gain) for gain in self.eqpt_index.gain_ranges[variety])
             edfa_pmax.text = str(self.type_varieties[variety].p_max)
         else:
             edfa_gmin.text = ''
@@ -664,7 +1673,7 @@ class EdfaTabContent(GridLayout):
 '''
 Tab content to display Transceiver element parameters
 '''
-class TrxTabContent(GridLayout):
+class TrxTabContent(ParamTabContent):
 
     # updates form info when element is selected
     def _update(self, element):
@@ -683,32 +1692,18 @@ class TrxTabContent(GridLayout):
                 else:
                     child.disabled = True
 
-    # updates element info when form value change occurs
-    def _update_el(self, param_name, param_type, readonly, value):
-        if not readonly:
-            element = app.root.ids['topomap'].selected
-            # updates element attributes
-            if element and not getattr(element, param_name) == value:
-                setattr(element, param_name, value
-                        if not param_type == 'float' else float(value) if value else 0)
-
     # updates format values when type_varieties seleted
-    def _update_format(self, value, format_spinner, type_varieties):
-        if value != '-- select --':
-            format_spinner.text = '-- select --'
-            format_spinner.values = ['-- select --'] + [i['format'] for i in type_varieties[value].mode]
-        else:
-            format_spinner.text = '-- select --'
-            format_spinner.values = ['-- select --']
+    def _update_format(self, value, format_spinner):
+        format_spinner.text = '-- select --'
+        format_spinner.values = self.eqpt_index.trx_formats.get(value, ('-- select --',))
 
     # displays equipment values from equipment.json
     def _update_eqpt(self, trx_type, trx_variety, trx_baudrate, trx_osnr, trx_bitrate):
-        if not trx_variety in ('-- select --'):
-            trx_modes = self.type_varieties[trx_type].mode
-            trx_mode = [m for m in trx_modes if m['format'] == trx_variety]
-            trx_baudrate.text = str(trx_mode[0]['baudrate']/1e9)
-            trx_osnr.text = str(trx_mode[0]['OSNR'])
-            trx_bitrate.text = str(trx_mode[0]['bit_rate']/1e9)
+        trx_mode = self.eqpt_index.trx_mode(trx_type, trx_variety)
+        if trx_mode:
+            trx_baudrate.text = str(trx_mode['baudrate']/1e9)
+            trx_osnr.text = str(trx_mode['OSNR'])
+            trx_bitrate.text = str(trx_mode['bit_rate']/1e9)
         else:
             trx_baudrate.text = ''
             trx_osnr.text = ''
@@ -716,11 +1711,41 @@ class TrxTabContent(GridLayout):
 
 
 '''
-Displays some mouseover info and application states
+Displays some mouseover info and application states, finds elements
 '''
 class Statusbar(BoxLayout):
-    # TODO: add mouseover info and application states
-    pass
+    # TODO: add mouseover info
+
+    state = StringProperty('') # application state, e.g. simulation progress
+    counts = StringProperty('') # numbers of ready elements
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._matches = [] # uids of elements found by search
+        self._match = -1 # index of shown element in _matches
+
+    # finds elements by el_id, site, region or type variety and shows the first one
+    def search(self, text):
+        self._matches = app.root.ids['topomap'].model.search(text) if text.strip() else []
+        self._match = -1
+        if self._matches:
+            self.next_match()
+        elif text.strip():
+            self.state = f'Search: {text.strip()} not found'
+
+    # shows next found element
+    def next_match(self):
+        topomap = app.root.ids['topomap']
+        # found elements can be removed meanwhile
+        self._matches = [uid for uid in self._matches if uid in topomap.model]
+        if not self._matches:
+            return
+        self._match = (self._match + 1) % len(self._matches)
+        uid = self._matches[self._match]
+        topomap._jump_to(uid)
+        more = '+' if len(self._matches) >= SEARCH_LIMIT else ''
+        self.state = (f'Search: {self._match + 1}/{len(self._matches)}{more} '
+                      f'{topomap.model.element(uid).info[0]}')
 
 
 if __name__ == '__main__':
@@ -0,0 +1,561 @@
+'''
+Describes headless topology model, part of main.py
+
+Model keeps topology elements and connections in compact tables without any
+Kivy objects, topology map widgets only view it. It can be used without GUI.
+'''
+from array import array
+from collections import namedtuple
+
+from equipment import index_equipment
+from search import SearchIndex, SEARCH_LIMIT, element_terms
+from spatial import GridIndex, TOUCH_DISTANCE
+
+EL_SIDE = 50 # size of element square side on topology map
+
+# element types with parameters and their default values,
+# order is the same as in TopomapIcon subclass .params
+ELEMENT_PARAMS = {'GRoadm': (('loss', 17),
+                             ),
+                  'GEdfa': (('gain_target', 0),
+                            ('tilt_target', 0),
+                            ('type_variety', '-- select --'),
+                            ),
+                  'GTransceiver': (('type_variety', '-- select --'),
+                                   ('trx_format', '-- select --'),
+                                   ),
+                  'GFiber': (('length', 0),
+                             ('loss_coef', 0.2),
+                             ('type_variety', '-- select --'),
+                             ),
+                  'GFused': (('loss', 0.5),
+                             ),
+}
+ELEMENT_TYPES = tuple(ELEMENT_PARAMS)
+PARAM_NAMES = {el_type: tuple(name for name, default in params)
+               for el_type, params in ELEMENT_PARAMS.items()}
+PARAM_DEFAULTS = {el_type: tuple(default for name, default in params)
+                  for el_type, params in ELEMENT_PARAMS.items()}
+# basic element info, order is the same as in ElementRecord.info
+INFO_NAMES = ('el_id', 'el_site', 'el_region', 'el_latitude', 'el_longitude')
+ID_PREFIX = 'ID' # prefix of allocated element ids, followed by a number
+# simulation modes of readiness rules, NO_MODE is used until mode is selected
+NO_MODE = '-- select --'
+READY_MODES = (NO_MODE, 'Advanced', 'Mixed', 'Automatic')
+
+ElementRecord = namedtuple('ElementRecord', 'uid el_type x y params info ready')
+
+
+# verifies that all required ROADM parameters are entered
+def _roadm_ready(params, simmode, equipment):
+    # any attenuation value allowed
+    return True
+
+# verifies that all required EDFA parameters are entered correctly
+def _edfa_ready(params, simmode, equipment):
+    gain_target, tilt_target, type_variety = params
+    if simmode == 'Automatic' and type_variety != '-- select --':
+        return True
+    elif simmode in ('Advanced', 'Mixed') and type_variety != '-- select --' and equipment is not None:
+        gain_range = index_equipment(equipment).gain_ranges.get(type_variety)
+        return gain_range is not None and gain_range[1] >= gain_target >= gain_range[0]
+    return False
+
+# verifies that all required Transceiver parameters are entered
+def _trx_ready(params, simmode, equipment):
+    type_variety, trx_format = params
+    return type_variety != '-- select --' and trx_format != '-- select --'
+
+# verifies that all required Fiber parameters are entered
+def _fiber_ready(params, simmode, equipment):
+    length, loss_coef, type_variety = params
+    return length > 0
+
+READY_RULES = {'GRoadm': _roadm_ready,
+               'GEdfa': _edfa_ready,
+               'GTransceiver': _trx_ready,
+               'GFiber': _fiber_ready,
+               'GFused': _roadm_ready,
+}
+
+
+# returns element readiness according to its parameters and simulation mode
+def is_ready(el_type, params, simmode, equipment=None):
+    return READY_RULES[el_type](tuple(params), simmode, equipment)
+
+
+'''
+Not ready elements per simulation mode and element type, element readiness is
+evaluated for all modes when it changes, so mode switch only compares sets
+'''
+class ReadinessIndex:
+
+    __slots__ = ('not_ready', 'totals')
+
+    def __init__(self):
+        # simulation mode -> element type -> set of not ready uids
+        self.not_ready = {mode: {el_type: set() for el_type in ELEMENT_TYPES} for mode in READY_MODES}
+        self.totals = dict.fromkeys(ELEMENT_TYPES, 0) # element type -> number of elements
+
+    def clear(self):
+        self.__init__()
+
+    # returns not ready sets of simulation mode, unknown mode is the same as not selected one
+    def _sets(self, simmode):
+        return self.not_ready.get(simmode) or self.not_ready[NO_MODE]
+
+    def add(self, uid, el_type, params, equipment=None):
+        self.totals[el_type] += 1
+        self.update(uid, el_type, params, equipment)
+
+    # evaluates element readiness in all simulation modes
+    def update(self, uid, el_type, params, equipment=None):
+        rule = READY_RULES[el_type]
+        for simmode in READY_MODES:
+            if rule(params, simmode, equipment):
+                self.not_ready[simmode][el_type].discard(uid)
+            else:
+                self.not_ready[simmode][el_type].add(uid)
+
+    def remove(self, uid, el_type):
+        self.totals[el_type] -= 1
+        for simmode in READY_MODES:
+            self.not_ready[simmode][el_type].discard(uid)
+
+    def is_ready(self, uid, el_type, simmode):
+        return uid not in self._sets(simmode)[el_type]
+
+    # returns uids of not ready elements
+    def uids(self, simmode):
+        return [uid for uids in self._sets(simmode).values() for uid in uids]
+
+    # returns element type -> (number of ready elements, number of all elements)
+    def counts(self, simmode):
+        return {el_type: (self.totals[el_type] - len(uids), self.totals[el_type])
+                for el_type, uids in self._sets(simmode).items()}
+
+    # returns uids of elements, which readiness differs between simulation modes
+    def changed(self, simmode_a, simmode_b):
+        sets_a, sets_b = self._sets(simmode_a), self._sets(simmode_b)
+        return [uid for el_type in ELEMENT_TYPES for uid in sets_a[el_type] ^ sets_b[el_type]]
+
+
+'''
+Array backed element table, row per element
+'''
+class ElementTable:
+
+    __slots__ = ('uids', 'types', 'xs', 'ys', 'params', 'info', 'rows')
+
+    def __init__(self):
+        self.uids = array('q')
+        self.types = array('B') # index in ELEMENT_TYPES
+        self.xs = array('d')
+        self.ys = array('d')
+        self.params = [] # tuples, ordered as PARAM_NAMES
+        self.info = [] # tuples, ordered as INFO_NAMES
+        self.rows = {} # uid -> row index
+
+    def __len__(self):
+        return len(self.uids)
+
+    def __contains__(self, uid):
+        return uid in self.rows
+
+    def __iter__(self):
+        return iter(self.uids)
+
+    def add(self, uid, el_type, x, y, params, info):
+        if uid in self.rows:
+            raise KeyError(f'Element {uid} already exists')
+        self.rows[uid] = len(self.uids)
+        self.uids.append(uid)
+        self.types.append(ELEMENT_TYPES.index(el_type))
+        self.xs.append(x)
+        self.ys.append(y)
+        self.params.append(tuple(params))
+        self.info.append(tuple(info))
+
+    # removes row, the last row takes its place
+    def remove(self, uid):
+        row = self.rows.pop(uid)
+        last = len(self.uids) - 1
+        if row != last:
+            for column in (self.uids, self.types, self.xs, self.ys, self.params, self.info):
+                column[row] = column[last]
+            self.rows[self.uids[row]] = row
+        for column in (self.uids, self.types, self.xs, self.ys, self.params, self.info):
+            column.pop()
+
+    def clear(self):
+        self.__init__()
+
+    # returns copy of the table, rows keep their order, or copy of only given elements
+    def copy(self, uids=None):
+        table = ElementTable()
+        if uids is not None:
+            for uid in uids:
+                if uid in self.rows:
+                    row = self.rows[uid]
+                    table.add(uid, ELEMENT_TYPES[self.types[row]], self.xs[row], self.ys[row],
+                              self.params[row], self.info[row])
+            return table
+        table.uids = array('q', self.uids)
+        table.types = array('B', self.types)
+        table.xs = array('d', self.xs)
+        table.ys = array('d', self.ys)
+        table.params = list(self.params) # tuples are shared, they are never changed in place
+        table.info = list(self.info)
+        table.rows = dict(self.rows)
+        return table
+
+
+# returns records of element table in project file format, all rows if not provided
+def element_records(table, rows=None):
+    for row in range(len(table)) if rows is None else rows:
+        el_type = ELEMENT_TYPES[table.types[row]]
+        record = {'uid': table.uids[row], 'el_type': el_type, 'pos': [table.xs[row], table.ys[row]]}
+        record.update(zip(INFO_NAMES, table.info[row]))
+        record['params'] = dict(zip(PARAM_NAMES[el_type], table.params[row]))
+        yield record
+
+
+# returns connection records in project file format
+def link_records(links):
+    for (u, v), conn_dir in links.items():
+        yield {'from_node': u, 'to_node': v, 'conn_dir': conn_dir}
+
+
+'''
+Headless topology model: elements and connections between them
+'''
+class TopologyModel:
+
+    __slots__ = ('elements', 'links', 'adjacency', 'el_index', 'link_index', 'readiness',
+                 'simmode', 'equipment', 'ids', 'search_index', 'version', 'changed', 'changed_links',
+                 '_next_uid', '_next_id')
+
+    def __init__(self):
+        self.elements = ElementTable()
+        # connection per node pair: (u, v) -> conn_dir,
+        # for 'unidir' connection u is the source
+        self.links = {}
+        self.adjacency = {} # uid -> set of connected uids
+        # spatial indexes: uid -> element square, (u, v) -> line between element centers
+        self.el_index = GridIndex()
+        self.link_index = GridIndex()
+        self.readiness = ReadinessIndex()
+        self.simmode = NO_MODE # current simulation mode
+        self.equipment = None # equipment library used by readiness rules
+        self.ids = {} # el_id -> set of uids, el_id entered by user may be not unique
+        self.search_index = SearchIndex()
+        # changes tracking: version is increased by every change of elements or connections,
+        # changed uids and node pairs (u < v) are kept until they are taken
+        self.version = 0
+        self.changed = set()
+        self.changed_links = set()
+        self._next_uid = 0
+        self._next_id = 1 # number of the next allocated el_id
+
+    def __len__(self):
+        return len(self.elements)
+
+    def __contains__(self, uid):
+        return uid in self.elements
+
+    def clear(self):
+        self.elements.clear()
+        self.links.clear()
+        self.adjacency.clear()
+        self.el_index.clear()
+        self.link_index.clear()
+        self.readiness.clear()
+        self.ids.clear()
+        self.search_index.clear()
+        self.changed.clear()
+        self.changed_links.clear()
+        self.version += 1
+        self._next_uid = 0
+        self._next_id = 1
+
+    # marks element as changed
+    def _touch(self, uid):
+        self.changed.add(uid)
+        self.version += 1
+
+    # marks connection between u and v as changed
+    def _touch_link(self, u, v):
+        self.changed_links.add((min(u, v), max(u, v)))
+        self.version += 1
+
+    # returns changed uids and node pairs since the previous call, and forgets them
+    def take_changes(self):
+        changed, changed_links = self.changed, self.changed_links
+        self.changed, self.changed_links = set(), set()
+        return changed, changed_links
+
+    # adds element and returns its uid, uid is assigned if not provided
+    def add_element(self, el_type, pos, params=None, info=None, uid=None):
+        if uid is None:
+            uid = self._next_uid
+        self._next_uid = max(self._next_uid, uid + 1)
+        if params is None:
+            params = PARAM_DEFAULTS[el_type]
+        if info is None:
+            info = (self.new_el_id(), '', '', 0, 0)
+        self.elements.add(uid, el_type, pos[0], pos[1], params, info)
+        self._index_id(uid, info[0])
+        self.search_index.update(uid, element_terms(info, params, PARAM_NAMES[el_type]))
+        self.readiness.add(uid, el_type, tuple(params), self.equipment)
+        self.adjacency[uid] = set()
+        self.el_index.insert_box(uid, pos[0], pos[1], pos[0] + EL_SIDE, pos[1] + EL_SIDE)
+        self._touch(uid)
+
+        return uid
+
+    # removes element with all its connections, returns removed connections
+    def remove_element(self, uid):
+        removed = [(u, v, self.links.pop((u, v)))
+                   for u, v in [self.link_key(uid, n) for n in self.adjacency[uid]]]
+        for u, v, conn_dir in removed:
+            self.link_index.remove((u, v))
+            self._touch_link(u, v)
+        for n in self.adjacency.pop(uid):
+            self.adjacency[n].discard(uid)
+        row = self.elements.rows[uid]
+        self.readiness.remove(uid, ELEMENT_TYPES[self.elements.types[row]])
+        self._unindex_id(uid, self.elements.info[row][0])
+        self.search_index.remove(uid)
+        self.elements.remove(uid)
+        self.el_index.remove(uid)
+        self._touch(uid)
+
+        return removed
+
+    # removes group of elements, returns removed connections
+    def remove_elements(self, uids):
+        removed = []
+        for uid in uids:
+            removed.extend(self.remove_element(uid))
+
+        return removed
+
+    def move_element(self, uid, x, y):
+        self.move_elements({uid: (x, y)})
+
+    # moves group of elements, positions: uid -> (x, y),
+    # connection between two moved elements is indexed once
+    def move_elements(self, positions):
+        table = self.elements
+        keys = set()
+        for uid, (x, y) in positions.items():
+            row = table.rows[uid]
+            table.xs[row] = x
+            table.ys[row] = y
+            self.el_index.insert_box(uid, x, y, x + EL_SIDE, y + EL_SIDE)
+            keys.update(self.link_key(uid, n) for n in self.adjacency[uid])
+            self._touch(uid)
+        for key in keys:
+            self._index_link(key)
+
+    def set_params(self, uid, params):
+        row = self.elements.rows[uid]
+        self.elements.params[row] = tuple(params)
+        self.readiness.update(uid, ELEMENT_TYPES[self.elements.types[row]], tuple(params), self.equipment)
+        self._index_terms(row)
+        self._touch(uid)
+
+    def set_info(self, uid, info):
+        row = self.elements.rows[uid]
+        self._unindex_id(uid, self.elements.info[row][0])
+        self.elements.info[row] = tuple(info)
+        self._index_id(uid, info[0])
+        self._index_terms(row)
+        self._touch(uid)
+
+    # returns new el_id, which is not used by any element, numbers are never reused
+    def new_el_id(self):
+        while f'{ID_PREFIX}{self._next_id:03d}' in self.ids:
+            self._next_id += 1
+        el_id = f'{ID_PREFIX}{self._next_id:03d}'
+        self._next_id += 1
+
+        return el_id
+
+    # returns uids of elements, which el_id, site, region or type variety contains text
+    def search(self, text, limit=SEARCH_LIMIT):
+        return self.search_index.search(text, limit)
+
+    # updates search terms of element in the table row
+    def _index_terms(self, row):
+        table = self.elements
+        self.search_index.update(table.uids[row], element_terms(table.info[row], table.params[row],
+                                                                 PARAM_NAMES[ELEMENT_TYPES[table.types[row]]]))
+
+    # returns uid of element with el_id, or None
+    def find_id(self, el_id):
+        uids = self.ids.get(el_id)
+        return min(uids) if uids else None
+
+    def _index_id(self, uid, el_id):
+        if not el_id:
+            return
+        self.ids.setdefault(el_id, set()).add(uid)
+        # allocation continues after the highest number of added el_id
+        number = el_id[len(ID_PREFIX):]
+        if el_id.startswith(ID_PREFIX) and number.isdigit():
+            self._next_id = max(self._next_id, int(number) + 1)
+
+    def _unindex_id(self, uid, el_id):
+        uids = self.ids.get(el_id)
+        if uids:
+            uids.discard(uid)
+            if not uids:
+                del self.ids[el_id]
+
+    # returns element record
+    def element(self, uid):
+        table = self.elements
+        row = table.rows[uid]
+
+        el_type = ELEMENT_TYPES[table.types[row]]
+        return ElementRecord(uid, el_type, table.xs[row], table.ys[row], table.params[row],
+                             table.info[row], self.readiness.is_ready(uid, el_type, self.simmode))
+
+    # returns node pair key of existing connection between u and v, or None
+    def link_key(self, u, v):
+        if (u, v) in self.links:
+            return (u, v)
+        elif (v, u) in self.links:
+            return (v, u)
+        return None
+
+    # adds or replaces connection between u and v, for 'unidir' u is the source
+    def set_link(self, u, v, conn_dir='bidir'):
+        if self.links.get((u, v)) == conn_dir:
+            # not changed, e.g. widget of existing connection is created
+            return
+        key = self.link_key(u, v)
+        if key:
+            del self.links[key]
+            self.link_index.remove(key)
+        self.links[(u, v)] = conn_dir
+        self.adjacency[u].add(v)
+        self.adjacency[v].add(u)
+        self._index_link((u, v))
+        self._touch_link(u, v)
+
+    def remove_link(self, u, v):
+        key = self.link_key(u, v)
+        del self.links[key]
+        self.link_index.remove(key)
+        self.adjacency[u].discard(v)
+        self.adjacency[v].discard(u)
+        self._touch_link(u, v)
+
+    # returns center of element on topology map
+    def center(self, uid):
+        row = self.elements.rows[uid]
+        return self.elements.xs[row] + EL_SIDE / 2, self.elements.ys[row] + EL_SIDE / 2
+
+    # puts connection line between element centers to spatial index
+    def _index_link(self, key):
+        self.link_index.insert_segment(key, *self.center(key[0]), *self.center(key[1]))
+
+    # returns uids of elements intersecting rectangle
+    def elements_in(self, x0, y0, x1, y1):
+        return self.el_index.query(x0, y0, x1, y1)
+
+    # returns node pair keys of connections which bounding box intersects rectangle
+    def links_in(self, x0, y0, x1, y1):
+        return self.link_index.query(x0, y0, x1, y1)
+
+    # returns uid of element under the point, or None
+    def element_at(self, x, y):
+        return self.el_index.box_at(x, y)
+
+    # returns node pair key of connection near the point, or None
+    def link_at(self, x, y, distance=TOUCH_DISTANCE):
+        return self.link_index.segment_at(x, y, distance)
+
+    # returns directed edges (u, v) of all connections
+    def edges(self):
+        for (u, v), conn_dir in self.links.items():
+            yield u, v
+            if conn_dir == 'bidir':
+                yield v, u
+
+    # returns directed graph of element uids
+    def to_digraph(self):
+        import networkx as nx
+
+        graph = nx.DiGraph()
+        graph.add_nodes_from(self.elements)
+        graph.add_edges_from(self.edges())
+
+        return graph
+
+    # returns element readiness in current simulation mode
+    def is_ready(self, uid):
+        return self.readiness.is_ready(uid, ELEMENT_TYPES[self.elements.types[self.elements.rows[uid]]],
+                                       self.simmode)
+
+    # returns uids of elements which parameters are not sufficient for simulation mode
+    def not_ready(self, simmode=None):
+        return self.readiness.uids(self.simmode if simmode is None else simmode)
+
+    # changes current simulation mode, returns uids of elements which readiness is changed
+    def set_simmode(self, simmode):
+        changed = self.readiness.changed(self.simmode, simmode)
+        self.simmode = simmode
+        return changed
+
+    # changes equipment library and evaluates readiness of all elements again,
+    # returns uids of elements which readiness is changed in current simulation mode
+    def set_equipment(self, equipment):
+        before = set(self.readiness.uids(self.simmode))
+        self.equipment = equipment
+        table = self.elements
+        for row in range(len(table)):
+            self.readiness.update(table.uids[row], ELEMENT_TYPES[table.types[row]], table.params[row],
+                                  equipment)
+        return list(before.symmetric_difference(self.readiness.uids(self.simmode)))
+
+    # returns element records in project file format, of all elements if uids are not provided
+    def element_records(self, uids=None):
+        rows = None if uids is None else (self.elements.rows[uid] for uid in uids)
+        return element_records(self.elements, rows)
+
+    # returns connection records in project file format
+    def link_records(self):
+        return link_records(self.links)
+
+    # returns copy of element table and connections, which can be written by other thread,
+    # or copy of only given elements and connections between given node pairs
+    def snapshot(self, uids=None, pairs=None):
+        if uids is None:
+            return self.elements.copy(), dict(self.links)
+        links = {}
+        for u, v in pairs:
+            key = self.link_key(u, v)
+            if key:
+                links[key] = self.links[key]
+        return self.elements.copy(uids), links
+
+    # adds element or connection from project file record
+    def add_record(self, kind, record):
+        if kind == 'element':
+            el_type = record['el_type']
+            params = dict(ELEMENT_PARAMS[el_type])
+            params.update(record.get('params', {}))
+            info = tuple(record.get(name, default) for name, default
+                         in zip(INFO_NAMES, ('', '', '', 0, 0)))
+            return self.add_element(el_type, record['pos'],
+                                    tuple(params[name] for name in PARAM_NAMES[el_type]),
+                                    info, uid=record['uid'])
+        else:
+            u, v = record['from_node'], record['to_node']
+            if u not in self.elements or v not in self.elements:
+                raise KeyError(f'Connection {u} - {v} refers to unknown element')
+            self.set_link(u, v, record.get('conn_dir', 'bidir'))
+            return (u, v)
@@ -52,3 +52,12 @@ class SaveProject(BoxLayout):
 
     _save = ObjectProperty(None)
     _cancel = ObjectProperty(None)
+
+
+'''
+Simulation results popup content
+'''
+class SimResults(BoxLayout):
+
+    _rows = ListProperty([]) # RecycleView data, dict per path
+    _close = ObjectProperty(None)
@@ -0,0 +1,94 @@
+'''
+Describes project file format with streaming reader and writer, part of main.py
+'''
+import json
+import os
+import re
+
+PROJECT_FORMAT = 'gui-project'
+PROJECT_VERSION = 1
+
+# project file is a valid JSON document, but every element and connection
+# record is written on its own line, so it can be written and read as a stream:
+#
+#   {"project": {"format": "gui-project", "version": 1},
+#   "elements": [
+#   {"uid": 0, "el_type": "GRoadm", "pos": [100, 100], ...},
+#   ...
+#   ],
+#   "connections": [
+#   {"from_node": 0, "to_node": 1, "conn_dir": "bidir"},
+#   ...
+#   ]}
+_HEADER = '{"project": '
+_SECTIONS = {'"elements": [': 'element', '"connections": [': 'connection'}
+
+
+# writes element and connection records (any iterables of dicts) to the file
+def write_project(filepath, elements, connections):
+    # writes to temporary file first, so failed save do not destroy previous project
+    tmp_path = filepath + '.tmp'
+    with open(tmp_path, 'w') as f:
+        header = {'format': PROJECT_FORMAT, 'version': PROJECT_VERSION}
+        f.write(_HEADER + json.dumps(header) + ',\n')
+        for section, records in (('elements', elements), ('connections', connections)):
+            f.write(f'"{section}": [')
+            sep = '\n'
+            for record in records:
+                f.write(sep + json.dumps(record))
+                sep = ',\n'
+            f.write('\n]' + (',\n' if section == 'elements' else '}\n'))
+    os.replace(tmp_path, filepath)
+
+
+# returns True if file starts as project file, other json files are imported as GNpy networks
+def is_project_file(filepath):
+    try:
+        with open(filepath) as f:
+            start = f.read(len(_HEADER) + 100)
+    except (OSError, UnicodeDecodeError):
+        return False
+    return re.match(r'\{\s*"project"\s*:', start) is not None
+
+
+# reads project file lazily, yields ('element', record) and ('connection', record) pairs
+def iter_project(filepath):
+    with open(filepath) as f:
+        first = f.readline()
+        if not first.startswith(_HEADER):
+            # not streamed layout (e.g. reformatted by other tool), reads it at once
+            f.seek(0)
+            yield from _iter_document(json.load(f))
+            return
+
+        _check_header(json.loads(first.strip()[len(_HEADER):].rstrip(',')))
+        section = None
+        for line in f:
+            line = line.strip()
+            if line in _SECTIONS:
+                section = _SECTIONS[line]
+            elif line.startswith('{'):
+                if section is None:
+                    raise ValueError(f'Unexpected record outside of section: {line[:50]}')
+                yield section, json.loads(line.rstrip(','))
+            elif line.startswith(']'):
+                section = None
+            elif line:
+                raise ValueError(f'Unexpected line in project file: {line[:50]}')
+
+
+# yields records of already parsed project document
+def _iter_document(document):
+    _check_header(document.get('project', {}))
+    for record in document.get('elements', ()):
+        yield 'element', record
+    for record in document.get('connections', ()):
+        yield 'connection', record
+
+
+# verifies that file is supported project file
+def _check_header(header):
+    if header.get('format') != PROJECT_FORMAT:
+        raise ValueError('File is not a project file')
+    if header.get('version', 0) > PROJECT_VERSION:
+        raise ValueError(f'Project file version {header["version"]} is not supported')
@@ -0,0 +1,128 @@
+'''
+Describes search index of topology elements, part of main.py
+
+Element is found by el_id, site, region or type variety. Index keeps distinct
+lowercase terms only: term -> uids postings, sorted terms for prefix search and
+trigram -> terms for substring search, so many elements of the same site or
+type variety cost one term.
+'''
+from bisect import bisect_left, insort
+from heapq import nsmallest
+
+NOT_SELECTED = '-- select --'
+SEARCH_LIMIT = 100 # max number of returned elements
+GRAM = 3 # length of indexed substrings, shorter queries match only prefixes
+
+
+# returns lowercase search terms of element info and params
+def element_terms(info, params, param_names):
+    terms = {str(value).lower() for value in info[:3] if value}
+    if 'type_variety' in param_names:
+        type_variety = params[param_names.index('type_variety')]
+        if type_variety != NOT_SELECTED:
+            terms.add(type_variety.lower())
+
+    return terms
+
+
+# returns substrings of term, which have GRAM length
+def _grams(term):
+    return {term[i:i + GRAM] for i in range(len(term) - GRAM + 1)}
+
+
+'''
+Prefix and trigram index of element terms
+'''
+class SearchIndex:
+
+    __slots__ = ('terms', 'postings', 'sorted_terms', 'grams')
+
+    def __init__(self):
+        self.terms = {} # uid -> set of terms
+        self.postings = {} # term -> set of uids
+        self.sorted_terms = [] # all terms in sorted order
+        self.grams = {} # trigram -> set of terms
+
+    def __len__(self):
+        return len(self.terms)
+
+    def clear(self):
+        self.terms.clear()
+        self.postings.clear()
+        self.sorted_terms.clear()
+        self.grams.clear()
+
+    # adds or replaces terms of element
+    def update(self, uid, terms):
+        old = self.terms.get(uid, set())
+        for term in old - terms:
+            self._remove_term(uid, term)
+        for term in terms - old:
+            self._add_term(uid, term)
+        self.terms[uid] = terms
+
+    def remove(self, uid):
+        for term in self.terms.pop(uid, ()):
+            self._remove_term(uid, term)
+
+    def _add_term(self, uid, term):
+        uids = self.postings.get(term)
+        if uids:
+            uids.add(uid)
+            return
+        # new term
+        self.postings[term] = {uid}
+        insort(self.sorted_terms, term)
+        for gram in _grams(term):
+            self.grams.setdefault(gram, set()).add(term)
+
+    def _remove_term(self, uid, term):
+        uids = self.postings[term]
+        uids.discard(uid)
+        if uids:
+            return
+        # term is not used any more
+        del self.postings[term]
+        del self.sorted_terms[bisect_left(self.sorted_terms, term)]
+        for gram in _grams(term):
+            terms = self.grams[gram]
+            terms.discard(term)
+            if not terms:
+                del self.grams[gram]
+
+    # yields terms starting with text in sorted order, the exact term is the first one
+    def _prefix_terms(self, text):
+        terms = self.sorted_terms
+        for i in range(bisect_left(terms, text), len(terms)):
+            if not terms[i].startswith(text):
+                return
+            yield terms[i]
+
+    # yields up to limit sorted terms containing text not at the start
+    def _inner_terms(self, text, limit):
+        if len(text) < GRAM:
+            return
+        grams = sorted((self.grams.get(gram, set()) for gram in _grams(text)), key=len)
+        # trigrams can be found in other order, so term is verified
+        terms = (term for term in grams[0].intersection(*grams[1:])
+                 if text in term and not term.startswith(text))
+        yield from nsmallest(limit, terms)
+
+    # returns uids of elements matching text: exact term, then term prefix, then substring,
+    # elements of equally matched terms are ordered by uid
+    def search(self, text, limit=SEARCH_LIMIT):
+        text = text.strip().lower()
+        if not text:
+            return []
+
+        uids, seen = [], set()
+        # substrings are searched only if prefixes do not fill the limit, generators are lazy
+        for terms in (self._prefix_terms(text), self._inner_terms(text, limit)):
+            for term in terms:
+                for uid in sorted(self.postings[term] - seen):
+                    uids.append(uid)
+                    if len(uids) >= limit:
+                        return uids
+                seen.update(self.postings[term])
+
+        return uids
@@ -0,0 +1,380 @@
+'''
+Describes GNpy simulation of topology paths, part of main.py
+
+Simulation gets GNpy network json instead of the topology model, so it can run
+in other thread or process while the topology map is edited. Progress is
+reported as a stream of events:
+    ('path', index, total, source, destination) - propagation of the next path is started
+    ('element', uid, gnpy_uid, result) - element on the path is passed, uid is None
+                                         for elements added by GNpy
+    ('result', source, destination, result) - signal reached destination transceiver
+    ('failed', source, destination, message) - destination is not reachable
+    ('progress', done, total) - all paths of done source transceivers are simulated
+'''
+import hashlib
+from array import array
+from collections import OrderedDict
+from copy import deepcopy
+from statistics import mean
+
+from equipment import index_equipment
+
+SIM_MODES = ('Advanced', 'Mixed', 'Automatic')
+CACHE_BYTES = 64 * 2**20 # memory limit of propagation cache
+CARRIER_BYTES = 400 # estimated memory of one carrier in cached spectral information
+TRX_METRICS = ('snr', 'osnr_ase', 'osnr_ase_01nm', 'osnr_nli') # transceiver results in dB
+
+
+# returns descriptions of network json elements, which are unknown to equipment library
+def validate(json_data, equipment):
+    errors = []
+    for element in json_data['elements']:
+        if element['type'] in ('Fiber', 'Edfa') and \
+                element.get('type_variety') not in equipment[element['type']]:
+            errors.append(f"{element['name']}: unknown {element['type']} type variety")
+
+    return errors
+
+
+# returns GNpy network from network json, missing amplifiers are added except in Advanced mode
+def build_network(json_data, equipment, simmode='Advanced'):
+    from gnpy.core.network import network_from_json, build_network as add_amplifiers
+
+    # network_from_json changes json data
+    network = network_from_json(deepcopy(json_data), equipment)
+    if simmode != 'Advanced':
+        add_amplifiers(network, equipment)
+
+    return network
+
+
+# returns initial gain targets of network amplifiers, GNpy lowers them to saturation during propagation
+def gain_targets(network):
+    return {element: element.operational.gain_target for element in network
+            if type(element).__name__ == 'Edfa'}
+
+
+# restores state of path elements, which GNpy changes during propagation, so paths simulated
+# in the same network do not depend on each other; destination metrics are set only if computed
+def reset_path(path, gains):
+    for element in path:
+        if element in gains:
+            element.operational.gain_target = gains[element]
+    for name in TRX_METRICS:
+        setattr(path[-1], name, None)
+
+
+# returns spectral information of transceiver output from equipment library
+def input_si(equipment):
+    from gnpy.core.info import create_input_spectral_information
+
+    si = equipment['SI']['default']
+    return create_input_spectral_information(si.f_min, si.roll_off, si.baud_rate,
+                                             si.power, si.spacing, si.Nch)
+
+
+# returns model uid of GNpy element, or None if element is added by GNpy,
+# spans of split fiber and reverse direction elements keep its uid before '_'
+def model_uid(gnpy_uid):
+    head = gnpy_uid.split('_', 1)[0]
+    return int(head) if head.isdigit() else None
+
+
+# returns signature of spectral information, equal for equal signals
+def si_signature(si):
+    values = array('d')
+    for carrier in si.carriers:
+        power = carrier.power
+        values.extend((carrier.frequency, carrier.baud_rate, carrier.roll_off,
+                       power.signal, power.nli, power.ase))
+    return hashlib.blake2b(values.tobytes(), digest_size=16).digest()
+
+
+# returns cache key of element parameters, or None if element output is not cached,
+# amplifier equipment is identified by its type variety
+def element_key(element):
+    el_type = type(element).__name__
+    if el_type == 'Edfa':
+        return (element.uid, el_type, element.params.type_variety,
+                element.operational.gain_target, element.operational.tilt_target)
+    elif el_type in ('Fiber', 'Roadm', 'Fused'):
+        return (element.uid, el_type, tuple(element.params))
+    return None
+
+
+'''
+LRU cache of element outputs, bounded by estimated memory of stored signals
+'''
+class PropagationCache:
+
+    __slots__ = ('max_bytes', 'size', 'entries', 'hits', 'misses')
+
+    def __init__(self, max_bytes=CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.entries = OrderedDict() # (element key, input signature) -> (si, result, size)
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
+
+    # returns (si, result) of element output, or None
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[:2]
+
+    # stores element output, the least recently used outputs are evicted
+    def put(self, key, si, result):
+        size = len(si.carriers) * CARRIER_BYTES
+        if key in self.entries:
+            self.size -= self.entries.pop(key)[2]
+        self.entries[key] = (si, result, size)
+        self.size += size
+        while self.size > self.max_bytes and self.entries:
+            self.size -= self.entries.popitem(last=False)[1][2]
+
+
+cache = PropagationCache() # propagation cache of this process
+
+
+# propagates spectral information along path, yields every element with its output and result,
+# source transceiver does not change the signal; passive elements, fibers and amplifiers
+# are not called again for the same parameters and input signal
+def propagate(path, si, cache=cache):
+    for element in path[1:]:
+        key = element_key(element)
+        if key is not None:
+            key += (si_signature(si),)
+            entry = cache.get(key)
+            if entry is not None:
+                si, result = entry
+                yield element, si, result
+                continue
+        si = element(si)
+        result = element_result(element, si)
+        if key is not None:
+            cache.put(key, si, result)
+        yield element, si, result
+
+
+# returns summary of element state after propagation
+def element_result(element, si):
+    el_type = type(element).__name__
+    result = {'type': el_type, 'pout_dbm': float(si.ptot_dbm())}
+    if el_type == 'Fiber':
+        result.update(length=element.length / 1000, loss=float(element.loss))
+    elif el_type == 'Edfa':
+        result.update(gain=float(element.operational.gain_target), nf=float(mean(element.nf)),
+                      pin_dbm=float(element.pin_db), type_variety=element.params.type_variety)
+    elif el_type in ('Roadm', 'Fused'):
+        result.update(loss=float(element.loss))
+    elif el_type == 'Transceiver':
+        # GNpy does not compute ratio of negligible noise, e.g. ASE of path without amplifiers,
+        # so every metric is reported only if it is computed
+        for name in TRX_METRICS:
+            values = getattr(element, name)
+            if values is not None:
+                result[name] = float(mean(values))
+        if 'snr' in result and 'osnr_ase' in result:
+            # total SNR in 0.1 nm bandwidth, comparable with transceiver mode OSNR
+            result['snr_01nm'] = result['snr'] - result['osnr_ase'] + result['osnr_ase_01nm']
+
+    return result
+
+
+# returns OSNR required by transceiver mode, or None if mode is unknown
+def required_osnr(equipment, type_variety, trx_format):
+    mode = index_equipment(equipment).trx_mode(type_variety, trx_format)
+    return mode['OSNR'] if mode else None
+
+
+# returns path result from result of destination transceiver
+def _path_result(path, result):
+    return dict(result, path=[element.uid for element in path])
+
+
+# returns description of path simulation failure
+def _failure(err):
+    return f'{type(err).__name__}: {err}'
+
+
+# simulates paths from source transceiver to destinations (all other transceivers by default),
+# yields progress events
+def simulate(json_data, equipment, simmode, source, destinations=None):
+    from networkx import dijkstra_path, NetworkXNoPath
+    from gnpy.core.elements import Transceiver
+
+    network = build_network(json_data, equipment, simmode)
+    gains = gain_targets(network)
+    nodes = {element.uid: element for element in network}
+    src = nodes[str(source)]
+    if destinations is None:
+        dsts = [element for element in network if isinstance(element, Transceiver) and element is not src]
+    else:
+        dsts = [nodes[str(uid)] for uid in destinations]
+
+    for index, dst in enumerate(dsts):
+        destination = model_uid(dst.uid)
+        yield ('path', index, len(dsts), source, destination)
+        try:
+            path = dijkstra_path(network, src, dst)
+        except NetworkXNoPath:
+            yield ('failed', source, destination, 'No path')
+            continue
+
+        reset_path(path, gains)
+        try:
+            for element, si, result in propagate(path, input_si(equipment)):
+                yield ('element', model_uid(element.uid), element.uid, result)
+        except Exception as err:
+            # GNpy failure of one path does not stop simulation of the others
+            yield ('failed', source, destination, _failure(err))
+            continue
+        yield ('result', source, destination, _path_result(path, result))
+
+
+_worker = None # (GNpy network, its gain targets, equipment) of worker process
+
+
+# builds network once per worker process
+def _init_worker(json_data, equipment, simmode):
+    global _worker
+    network = build_network(json_data, equipment, simmode)
+    _worker = (network, gain_targets(network), equipment)
+
+
+# returns transceivers of GNpy network
+def _transceivers(network):
+    from gnpy.core.elements import Transceiver
+
+    return [element for element in network if isinstance(element, Transceiver)]
+
+
+# simulates paths from source to destinations (all other transceivers by default) of worker network,
+# returns 'result' and 'failed' events
+def _simulate_source(source, destinations=None):
+    from networkx import single_source_dijkstra_path
+
+    network, gains, equipment = _worker
+    src = next(element for element in network if element.uid == str(source))
+    paths = single_source_dijkstra_path(network, src)
+    if destinations is None:
+        dsts = [element for element in _transceivers(network) if element is not src]
+    else:
+        dsts = [element for element in _transceivers(network) if model_uid(element.uid) in destinations]
+    events = []
+    for dst in dsts:
+        path = paths.get(dst)
+        if path is None:
+            events.append(('failed', source, model_uid(dst.uid), 'No path'))
+            continue
+        reset_path(path, gains)
+        try:
+            for element, si, result in propagate(path, input_si(equipment)):
+                pass
+        except Exception as err:
+            events.append(('failed', source, model_uid(dst.uid), _failure(err)))
+            continue
+        events.append(('result', source, model_uid(dst.uid), _path_result(path, result)))
+
+    return events
+
+
+# simulates paths between transceiver pairs (all pairs by default), sources are distributed
+# among worker processes, workers=0 simulates in calling thread;
+# yields 'progress', 'result' and 'failed' events
+def simulate_all(json_data, equipment, simmode, workers=None, mp_context=None, pairs=None):
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    # network is built here as well, so its errors are reported with original exception
+    network = build_network(json_data, equipment, simmode)
+    if pairs is None:
+        tasks = [(model_uid(element.uid), None) for element in _transceivers(network)]
+    else:
+        destinations = {}
+        for source, destination in pairs:
+            destinations.setdefault(source, set()).add(destination)
+        tasks = list(destinations.items())
+    total = len(tasks)
+    yield ('progress', 0, total)
+
+    # one source is not worth of worker process start
+    if workers == 0 or total < 2:
+        _init_worker(json_data, equipment, simmode)
+        for done, task in enumerate(tasks, 1):
+            yield from _simulate_source(*task)
+            yield ('progress', done, total)
+        return
+
+    executor = ProcessPoolExecutor(workers, mp_context, initializer=_init_worker,
+                                   initargs=(json_data, equipment, simmode))
+    futures = []
+    try:
+        for task in tasks:
+            futures.append(executor.submit(_simulate_source, *task))
+        for done, future in enumerate(as_completed(futures), 1):
+            yield from future.result()
+            yield ('progress', done, total)
+    finally:
+        # stopped simulation does not wait for remaining sources, not started ones are cancelled
+        # (shutdown cancel_futures argument requires Python 3.9)
+        for future in futures:
+            future.cancel()
+        executor.shutdown(wait=False)
+
+
+'''
+Index of simulated paths by topology elements they traverse
+'''
+class PathIndex:
+
+    __slots__ = ('paths', 'elements')
+
+    def __init__(self):
+        self.paths = {} # (source, destination) -> model uids on path
+        self.elements = {} # model uid -> set of (source, destination)
+
+    def __len__(self):
+        return len(self.paths)
+
+    def clear(self):
+        self.paths.clear()
+        self.elements.clear()
+
+    # adds or replaces path given by GNpy uids
+    def add(self, pair, path):
+        if pair in self.paths:
+            self.remove(pair)
+        uids = {model_uid(gnpy_uid) for gnpy_uid in path}
+        uids.discard(None)
+        self.paths[pair] = uids
+        for uid in uids:
+            self.elements.setdefault(uid, set()).add(pair)
+
+    def remove(self, pair):
+        for uid in self.paths.pop(pair):
+            pairs = self.elements[uid]
+            pairs.discard(pair)
+            if not pairs:
+                del self.elements[uid]
+
+    # returns pairs of paths traversing any of elements
+    def affected(self, uids):
+        pairs = set()
+        for uid in uids:
+            pairs.update(self.elements.get(uid, ()))
+        return pairs
+
+    # returns pairs of paths traversing all of elements
+    def traversing(self, uids):
+        return set.intersection(*(self.elements.get(uid, set()) for uid in uids))
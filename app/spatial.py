@@ -0,0 +1,148 @@
+'''
+Describes spatial index for topology map hit-testing, part of main.py
+'''
+from math import inf
+
+GRID_CELL = 200 # size of grid cell side
+TOUCH_DISTANCE = 2 # max distance from connection line to be touched
+
+
+# returns distance from point P to line segment AB
+def segment_distance(px, py, ax, ay, bx, by):
+    dx, dy = bx - ax, by - ay
+    length2 = dx * dx + dy * dy
+    if length2:
+        # projection of P on AB, limited to segment ends
+        t = max(0, min(1, ((px - ax) * dx + (py - ay) * dy) / length2))
+        ax += t * dx
+        ay += t * dy
+
+    return ((px - ax) ** 2 + (py - ay) ** 2) ** 0.5
+
+
+'''
+Uniform grid index of rectangles and line segments
+'''
+class GridIndex:
+
+    __slots__ = ('size', 'cells', 'items')
+
+    def __init__(self, size=GRID_CELL):
+        self.size = size
+        self.cells = {} # (i, j) -> set of keys
+        self.items = {} # key -> (geometry, occupied cells)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, key):
+        return key in self.items
+
+    def clear(self):
+        self.cells.clear()
+        self.items.clear()
+
+    # returns cells covered by rectangle
+    def _box_cells(self, x0, y0, x1, y1):
+        size = self.size
+        return tuple((i, j) for i in range(int(x0 // size), int(x1 // size) + 1)
+                            for j in range(int(y0 // size), int(y1 // size) + 1))
+
+    # returns cells crossed by segment (grid traversal, not whole bounding box)
+    def _segment_cells(self, ax, ay, bx, by):
+        size = self.size
+        i, j = int(ax // size), int(ay // size)
+        i_end, j_end = int(bx // size), int(by // size)
+        dx, dy = bx - ax, by - ay
+        step_i = 1 if dx > 0 else -1
+        step_j = 1 if dy > 0 else -1
+        # distance (as part of segment) to next cell border and between borders
+        t_x = ((i + (step_i > 0)) * size - ax) / dx if dx else inf
+        t_y = ((j + (step_j > 0)) * size - ay) / dy if dy else inf
+        dt_x = size / abs(dx) if dx else inf
+        dt_y = size / abs(dy) if dy else inf
+
+        cells = [(i, j)]
+        while (i, j) != (i_end, j_end) and min(t_x, t_y) <= 1:
+            if t_x < t_y:
+                i += step_i
+                t_x += dt_x
+            else:
+                j += step_j
+                t_y += dt_y
+            cells.append((i, j))
+
+        return tuple(cells)
+
+    def _insert(self, key, geometry, cells):
+        if key in self.items:
+            self.remove(key)
+        self.items[key] = (geometry, cells)
+        for cell in cells:
+            if cell in self.cells:
+                self.cells[cell].add(key)
+            else:
+                self.cells[cell] = {key}
+
+    # adds or moves rectangle (x0, y0, x1, y1)
+    def insert_box(self, key, x0, y0, x1, y1):
+        cells = self._box_cells(x0, y0, x1, y1)
+        item = self.items.get(key)
+        if item and item[1] == cells:
+            # still in the same cells
+            self.items[key] = ((x0, y0, x1, y1), cells)
+        else:
+            self._insert(key, (x0, y0, x1, y1), cells)
+
+    # adds or moves line segment (ax, ay, bx, by)
+    def insert_segment(self, key, ax, ay, bx, by):
+        self._insert(key, (ax, ay, bx, by), self._segment_cells(ax, ay, bx, by))
+
+    def remove(self, key):
+        geometry, cells = self.items.pop(key)
+        for cell in cells:
+            keys = self.cells[cell]
+            keys.discard(key)
+            if not keys:
+                del self.cells[cell]
+
+    def geometry(self, key):
+        return self.items[key][0]
+
+    # returns keys which geometry bounding box intersects rectangle
+    def query(self, x0, y0, x1, y1):
+        found = set()
+        for cell in self._box_cells(x0, y0, x1, y1):
+            keys = self.cells.get(cell)
+            if keys:
+                found.update(keys)
+
+        items = self.items
+        result = []
+        for key in found:
+            ax, ay, bx, by = items[key][0]
+            if min(ax, bx) <= x1 and max(ax, bx) >= x0 and min(ay, by) <= y1 and max(ay, by) >= y0:
+                result.append(key)
+
+        return result
+
+    # returns key of rectangle containing point, the nearest by center
+    def box_at(self, x, y):
+        best, best_dist = None, inf
+        for key in self.query(x, y, x, y):
+            x0, y0, x1, y1 = self.items[key][0]
+            dist = abs(x - (x0 + x1) / 2) + abs(y - (y0 + y1) / 2)
+            if dist < best_dist:
+                best, best_dist = key, dist
+
+        return best
+
+    # returns key of the nearest segment not farther than distance from point
+    def segment_at(self, x, y, distance=TOUCH_DISTANCE):
+        best, best_dist = None, distance
+        for key in self.query(x - distance, y - distance, x + distance, y + distance):
+            dist = segment_distance(x, y, *self.items[key][0])
+            if dist <= best_dist:
+                best, best_dist = key, dist
+
+        return best
@@ -0,0 +1,111 @@
+'''
+Measures import of synthetic GNpy network json into topology model
+
+usage: python benchmarks/gnpy_import.py [nodes]
+
+Network has ROADM nodes with transceivers on a grid of cities, neighbor cities
+are linked by fibers in both directions, as in GNpy json. Phases: reading of
+records from file, loading elements into the model, their geographic layout and
+arrangement, and loading connections between arranged elements.
+Memory is peak of traced allocations, compared with json.load of the file.
+'''
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+APP_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), os.pardir, 'app')
+sys.path.insert(0, APP_PATH)
+
+from gnpyio import iter_network, geo_positions
+from model import TopologyModel
+
+
+# writes GNpy network json with nodes cities to the file
+def write_network(filepath, nodes):
+    side = int(nodes ** 0.5)
+    elements, connections = [], []
+    for i in range(nodes):
+        location = {'city': f'city {i}', 'region': f'region {i // 100}',
+                    'latitude': 40 + i // side * 0.05, 'longitude': -100 + i % side * 0.05}
+        elements.append({'uid': f'trx {i}', 'type': 'Transceiver', 'metadata': {'location': location}})
+        elements.append({'uid': f'roadm {i}', 'type': 'Roadm', 'params': {'loss': 17},
+                         'metadata': {'location': location}})
+        connections.append({'from_node': f'trx {i}', 'to_node': f'roadm {i}'})
+        connections.append({'from_node': f'roadm {i}', 'to_node': f'trx {i}'})
+        for j in (i + 1, i + side):
+            if j >= nodes or (j == i + 1 and j % side == 0):
+                continue
+            for a, b in ((i, j), (j, i)):
+                uid = f'fiber ({a} → {b})'
+                elements.append({'uid': uid, 'type': 'Fiber', 'type_variety': 'SSMF',
+                                 'params': {'length': 80, 'loss_coef': 0.2, 'length_units': 'km'},
+                                 'metadata': {'location': location}})
+                connections.append({'from_node': f'roadm {a}', 'to_node': uid})
+                connections.append({'from_node': uid, 'to_node': f'roadm {b}'})
+    with open(filepath, 'w') as f:
+        json.dump({'elements': elements, 'connections': connections}, f, indent=2, ensure_ascii=False)
+    return len(elements), len(connections)
+
+
+# reads the whole file with json.load, as reference of memory use
+def load_json(filepath):
+    with open(filepath) as f:
+        return json.load(f)
+
+
+def main(nodes=10000):
+    with tempfile.TemporaryDirectory() as folder:
+        filepath = os.path.join(folder, 'network.json')
+        elements, connections = write_network(filepath, nodes)
+        print(f'{nodes} nodes: {elements} elements, {connections} connections, '
+              f'{os.path.getsize(filepath) / 1e6:.1f} MB')
+
+        start = time.perf_counter()
+        records = sum(1 for record in iter_network(filepath))
+        read = time.perf_counter() - start
+
+        # the same order as in application: elements, arrangement, connections
+        model = TopologyModel()
+        connections = []
+        start = time.perf_counter()
+        for kind, record in iter_network(filepath):
+            if kind == 'connection':
+                connections.append(record)
+            else:
+                model.add_record(kind, record)
+        load = time.perf_counter() - start
+        start = time.perf_counter()
+        positions = geo_positions(model, ((r['from_node'], r['to_node']) for r in connections))
+        layout = time.perf_counter() - start
+        start = time.perf_counter()
+        model.move_elements(positions)
+        arrange = time.perf_counter() - start
+        start = time.perf_counter()
+        slowest = 0
+        for record in connections:
+            step = time.perf_counter()
+            model.add_record('connection', record)
+            slowest = max(slowest, time.perf_counter() - step)
+        connect = time.perf_counter() - start
+
+        print(f'{"read":>12}: {read:7.3f} s  ({records} records)')
+        print(f'{"elements":>12}: {load:7.3f} s')
+        print(f'{"layout":>12}: {layout:7.3f} s')
+        print(f'{"arrange":>12}: {arrange:7.3f} s')
+        print(f'{"connections":>12}: {connect:7.3f} s  (slowest {slowest * 1000:.2f} ms)')
+        print(f'{"model":>12}: {len(model)} elements, {len(model.links)} connections')
+
+        for name, read_all in (('stream', lambda: sum(1 for record in iter_network(filepath))),
+                               ('json.load', lambda: load_json(filepath))):
+            tracemalloc.start()
+            read_all()
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print(f'{name:>12}: {peak / 1e6:7.1f} MB peak memory')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
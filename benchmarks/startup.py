@@ -0,0 +1,74 @@
+'''
+Measures application startup time, every run in a new interpreter
+
+usage: python benchmarks/startup.py [runs]
+
+Phases are measured from interpreter start: import of main.py, built main
+window, first drawn frame and loaded equipment library.
+'''
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+APP_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), os.pardir, 'app')
+PHASES = ('import', 'build', 'first_frame', 'equipment')
+
+# runs application once and reports time of every phase as json line
+_RUN = '''
+import time
+start = time.perf_counter()
+import os, sys, json
+sys.path.insert(0, os.getcwd())
+times = {}
+import main
+times['import'] = time.perf_counter() - start
+from kivy.clock import Clock
+from kivy.core.window import Window
+
+app = main.Application()
+
+def report(*args):
+    if getattr(app, '_equipment', True) is None:
+        Clock.schedule_once(report, 0.01)
+        return
+    times['equipment'] = time.perf_counter() - start
+    print('STARTUP ' + json.dumps(times), flush=True)
+    app.stop()
+
+def first_frame(*args):
+    Window.unbind(on_flip=first_frame)
+    times['first_frame'] = time.perf_counter() - start
+    Clock.schedule_once(report)
+
+def on_start(*args):
+    times['build'] = time.perf_counter() - start
+    # bound after Application.on_start, so it is called before the application handler
+    Clock.schedule_once(lambda dt: Window.bind(on_flip=first_frame))
+
+app.bind(on_start=on_start)
+app.run()
+'''
+
+
+def run_once():
+    env = dict(os.environ, KIVY_NO_ARGS='1', KIVY_NO_FILELOG='1', KIVY_NO_CONSOLELOG='1')
+    result = subprocess.run([sys.executable, '-c', _RUN], cwd=APP_PATH, env=env,
+                            stdout=subprocess.PIPE, universal_newlines=True)
+    for line in result.stdout.splitlines():
+        if line.startswith('STARTUP '):
+            return json.loads(line[len('STARTUP '):])
+    raise RuntimeError(f'Application did not start, exit code {result.returncode}')
+
+
+def main(runs=5):
+    results = [run_once() for i in range(runs)]
+    print(f'startup time, seconds, median of {runs} runs')
+    for phase in PHASES:
+        values = [r[phase] for r in results]
+        print(f'{phase:>12}: {statistics.median(values):7.3f}  (min {min(values):.3f}, max {max(values):.3f})')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
@@ -0,0 +1,8 @@
+'''
+Test configuration, application modules are imported from app folder as in main.py
+'''
+import os
+import sys
+
+APP_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), os.pardir, 'app')
+sys.path.insert(0, APP_PATH)
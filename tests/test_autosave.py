@@ -0,0 +1,61 @@
+'''
+Tests of autosave journal of topology model changes
+'''
+import os
+
+from autosave import Autosave, read_journal
+from model import TopologyModel
+
+
+# returns model loaded from records of the journal
+def recovered(path):
+    model = TopologyModel()
+    for kind, record in read_journal(path)[1]:
+        model.add_record(kind, record)
+    return model
+
+
+# returns comparable state of whole model
+def model_state(model):
+    return {uid: model.element(uid)[:6] for uid in model.elements}, dict(model.links)
+
+
+# journal starts with snapshot and appends only changes, which are recovered in order
+def test_snapshot_and_changes(tmpdir):
+    path = str(tmpdir.join('autosave.journal'))
+    autosave = Autosave(path)
+    model = TopologyModel()
+    a = model.add_element('GRoadm', (0, 0))
+    b = model.add_element('GFiber', (100, 0))
+    c = model.add_element('GEdfa', (200, 0))
+    model.set_link(a, b)
+    model.set_link(b, c, 'unidir')
+    model.take_changes()
+    assert autosave.needs_snapshot(len(model), 5)
+    autosave.compact(model.snapshot(), 'project.json').result()
+
+    model.set_params(b, (40, 0.2, 'SSMF'))
+    model.remove_element(c)
+    model.set_link(b, a, 'unidir')
+    changed, changed_links = model.take_changes()
+    assert not autosave.needs_snapshot(len(model), len(changed) + len(changed_links))
+    autosave.append(model.snapshot(changed, changed_links), changed, changed_links).result()
+
+    assert read_journal(path)[0]['project_file'] == 'project.json'
+    assert model_state(recovered(path)) == model_state(model)
+    autosave.discard().result()
+    assert not os.path.exists(path)
+    autosave.shutdown()
+
+
+# the last line cut by crash is ignored
+def test_cut_line(tmpdir):
+    path = str(tmpdir.join('autosave.journal'))
+    autosave = Autosave(path)
+    model = TopologyModel()
+    model.add_element('GRoadm', (0, 0))
+    autosave.compact(model.snapshot()).result()
+    autosave.shutdown()
+    with open(path, 'a') as f:
+        f.write('{"element": {"uid": 1, "el_ty')
+    assert sorted(recovered(path).elements) == [0]
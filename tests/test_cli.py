@@ -0,0 +1,56 @@
+'''
+Tests of headless batch mode, simulation is skipped without GNpy
+'''
+import json
+import subprocess
+import sys
+
+import pytest
+
+import cli
+from conftest import APP_PATH
+from model import TopologyModel
+from project import write_project
+
+
+# writes project of two transceivers connected by amplified line
+def write_line(filepath, ready=True):
+    model = TopologyModel()
+    trx = ('vendorA_trx-type1', 'PS_SP64_1') if ready else None
+    uids = [model.add_element('GTransceiver', (0, 0), trx),
+            model.add_element('GRoadm', (100, 0)),
+            model.add_element('GFiber', (200, 0), (80, 0.2, 'SSMF')),
+            model.add_element('GEdfa', (300, 0), (16, 0, 'std_medium_gain')),
+            model.add_element('GRoadm', (400, 0)),
+            model.add_element('GTransceiver', (500, 0), trx)]
+    for u, v in zip(uids, uids[1:]):
+        model.set_link(u, v, 'unidir')
+    write_project(filepath, model.element_records(), model.link_records())
+
+
+# batch mode does not load Kivy, it is verified in new interpreter independently of other tests
+def test_no_kivy():
+    subprocess.check_call([sys.executable, '-c', "import cli, sys; assert 'kivy' not in sys.modules"],
+                          cwd=APP_PATH)
+
+
+# not ready, broken and missing projects are reported, results of others are written,
+# reverse path of unidirectional line is not found
+def test_batch(tmpdir, capsys):
+    pytest.importorskip('gnpy')
+    line, not_ready = str(tmpdir.join('line.json')), str(tmpdir.join('not_ready.json'))
+    write_line(line)
+    write_line(not_ready, ready=False)
+    output = tmpdir.join('results')
+
+    status = cli.main(['--jobs', '1', '--output', str(output), line, not_ready, str(tmpdir.join('missing.json'))])
+    assert status == 1
+    out, err = capsys.readouterr()
+    assert 'line.json: 2 paths, 1 feasible, 1 failed' in out
+    assert 'Elements are not ready: ID001, ID006' in err and 'FileNotFoundError' in err
+
+    rows = [json.loads(line) for line in output.join('line' + cli.RESULTS_SUFFIX).readlines()]
+    assert [(row['source'], row['destination'], row.get('feasible')) for row in rows] == \
+           [('ID001', 'ID006', 'yes'), ('ID006', 'ID001', None)]
+    assert rows[1]['error'] == 'No path'
+    assert not output.join('not_ready' + cli.RESULTS_SUFFIX).exists()
@@ -0,0 +1,176 @@
+'''
+Tests of GNpy network json import and export of topology model
+'''
+import json
+import os
+
+import pytest
+
+import gnpyio
+from conftest import APP_PATH
+from gnpyio import iter_network, iter_import, geo_positions
+from model import TopologyModel
+
+NETWORK = {
+    'network_name': 'test',
+    'elements': [
+        {'uid': 'trx a', 'type': 'Transceiver', 'metadata': {'location': {'city': 'A', 'latitude': 56.9,
+                                                                          'longitude': 24.1}}},
+        {'uid': 'roadm a', 'type': 'Roadm', 'params': {'loss': 18}},
+        {'uid': 'fiber a-b', 'type': 'Fiber', 'type_variety': 'SSMF',
+         'params': {'length': 80000, 'loss_coef': 0.2, 'length_units': 'm'}},
+        {'uid': 'edfa b', 'type': 'Edfa', 'type_variety': 'std_medium_gain',
+         'operational': {'gain_target': None, 'tilt_target': 0}},
+    ],
+    'connections': [
+        {'from_node': 'trx a', 'to_node': 'roadm a'},
+        {'from_node': 'roadm a', 'to_node': 'trx a'},
+        {'from_node': 'roadm a', 'to_node': 'fiber a-b'},
+        {'from_node': 'fiber a-b', 'to_node': 'edfa b'},
+        # connection of element, which is not read yet
+        {'from_node': 'edfa b', 'to_node': 'fused c'},
+    ],
+}
+
+
+# returns model of imported file
+def imported(filepath):
+    model = TopologyModel()
+    for kind, record in iter_import(filepath):
+        model.add_record(kind, record)
+    return model
+
+
+# elements and connections are read by small chunks, connections in both directions become bidir
+def test_import_network(tmpdir, monkeypatch):
+    network = dict(NETWORK, elements=NETWORK['elements'] + [{'uid': 'fused c', 'type': 'Fused'}])
+    filepath = tmpdir.join('network.json')
+    # arrays are not the first top level values
+    filepath.write(json.dumps({'network_name': 'test', 'connections': network['connections'],
+                               'elements': network['elements']}, indent=2))
+    monkeypatch.setattr(gnpyio, 'CHUNK_SIZE', 7)
+
+    model = imported(str(filepath))
+    assert len(model) == 5
+    ids = {model.element(uid).info[0]: uid for uid in model.elements}
+    assert model.links[model.link_key(ids['trx a'], ids['roadm a'])] == 'bidir'
+    assert model.links[(ids['roadm a'], ids['fiber a-b'])] == 'unidir'
+    assert model.links[(ids['edfa b'], ids['fused c'])] == 'unidir'
+    assert model.element(ids['roadm a']).params == (18,)
+    assert model.element(ids['fiber a-b']).params == (80, 0.2, 'SSMF')
+    # null gain target is replaced by default
+    assert model.element(ids['edfa b']).params == (0, 0, 'std_medium_gain')
+    assert model.element(ids['trx a']).info[1:] == ('A', '', 56.9, 24.1)
+
+    # elements without location are put next to connected located element
+    positions = geo_positions(model)
+    assert set(positions) == set(model.elements)
+
+
+# connection to unknown element and unknown element type are reported
+def test_import_errors(tmpdir):
+    filepath = tmpdir.join('network.json')
+    filepath.write(json.dumps(NETWORK))
+    with pytest.raises(KeyError):
+        imported(str(filepath))
+    filepath.write(json.dumps({'elements': [{'uid': 'x', 'type': 'Unknown'}]}))
+    with pytest.raises(ValueError):
+        imported(str(filepath))
+    filepath.write('{"elements": [{"uid": "x", "type": "Fused"},')
+    with pytest.raises(ValueError):
+        imported(str(filepath))
+
+
+# returns model of roadm - bidirectional fiber - roadm line with transceivers
+def line_model():
+    model = TopologyModel()
+    trx_a = model.add_element('GTransceiver', (0, 0), ('vendorA_trx-type1', 'PS_SP64_1'))
+    roadm_a = model.add_element('GRoadm', (0, 100))
+    fiber = model.add_element('GFiber', (100, 100), (80, 0.2, 'SSMF'))
+    roadm_b = model.add_element('GRoadm', (200, 100))
+    trx_b = model.add_element('GTransceiver', (200, 0), ('vendorA_trx-type1', 'PS_SP64_1'))
+    for u, v in ((trx_a, roadm_a), (roadm_a, fiber), (fiber, roadm_b), (roadm_b, trx_b)):
+        model.set_link(u, v)
+    return model
+
+
+# bidirectional fiber gets GNpy element for reverse direction
+def test_export_directions():
+    json_data = gnpyio.network_json(line_model())
+    uids = [element['uid'] for element in json_data['elements']]
+    assert uids == ['0', '1', '2', '3', '4', '2_r']
+    edges = {(c['from_node'], c['to_node']) for c in json_data['connections']}
+    assert ('1', '2') in edges and ('2', '3') in edges
+    assert ('3', '2_r') in edges and ('2_r', '1') in edges
+    assert ('3', '2') not in edges and ('2', '1') not in edges
+    fiber = json_data['elements'][2]
+    assert fiber['type'] == 'Fiber' and fiber['params']['length'] == 80
+
+
+# bidirectional fiber - amplifier - fiber line is duplicated as a whole,
+# reverse direction goes only through duplicates and has the same SNR as forward one
+def test_export_bidir_line():
+    model = TopologyModel()
+    trx = ('vendorA_trx-type1', 'PS_SP64_1')
+    uids = [model.add_element('GTransceiver', (0, 0), trx),
+            model.add_element('GRoadm', (0, 100)),
+            model.add_element('GFiber', (100, 100), (80, 0.2, 'SSMF')),
+            model.add_element('GEdfa', (200, 100), (16, 0, 'std_medium_gain')),
+            model.add_element('GFiber', (300, 100), (80, 0.2, 'SSMF')),
+            model.add_element('GRoadm', (400, 100)),
+            model.add_element('GTransceiver', (400, 0), trx)]
+    for u, v in zip(uids, uids[1:]):
+        model.set_link(u, v)
+
+    json_data = gnpyio.network_json(model)
+    edges = {(c['from_node'], c['to_node']) for c in json_data['connections']}
+    assert edges == {('0', '1'), ('1', '0'), ('1', '2'), ('2', '3'), ('3', '4'), ('4', '5'),
+                     ('5', '4_r'), ('4_r', '3_r'), ('3_r', '2_r'), ('2_r', '1'),
+                     ('5', '6'), ('6', '5')}
+
+    pytest.importorskip('gnpy')
+    from equipment import load_equipment
+    from simulation import simulate_all
+    equipment = load_equipment(os.path.join(APP_PATH, 'json', 'eqpt_config.json'))
+    model.set_equipment(equipment)
+    json_data = gnpyio.network_json(model, 'Advanced', equipment)
+    results = {(event[1], event[2]): event[3]
+               for event in simulate_all(json_data, equipment, 'Advanced', workers=0) if event[0] == 'result'}
+    forward, backward = results[(uids[0], uids[-1])], results[(uids[-1], uids[0])]
+    assert backward['path'] == ['6', '5', '4_r', '3_r', '2_r', '1', '0']
+    assert backward['snr'] == pytest.approx(forward['snr'])
+
+
+# cached export is equal to uncached one, only changed elements are converted again
+def test_export_cache():
+    model = line_model()
+    cache = gnpyio.ExportCache()
+    first = gnpyio.network_json(model, cache=cache)
+    gnpyio.network_lines(first, cache)
+    model.move_element(2, 500, 500)
+    model.set_params(3, (10,))
+    second = gnpyio.network_json(model, cache=cache)
+    assert second == gnpyio.network_json(model)
+    assert gnpyio.network_lines(second, cache) == gnpyio.network_lines(second)
+    # position does not change GNpy json, parameters do
+    assert second['elements'][2] is first['elements'][2]
+    assert second['elements'][3] is not first['elements'][3]
+    model.remove_element(4)
+    gnpyio.network_json(model, cache=cache)
+    assert 4 not in cache.elements and '4' not in cache.texts
+
+
+# exported file is imported as the same topology
+def test_export_import(tmpdir):
+    model = line_model()
+    filepath = str(tmpdir.join('export.json'))
+    json_data = gnpyio.network_json(model)
+    gnpyio.write_lines(filepath, gnpyio.network_lines(json_data))
+    with open(filepath) as f:
+        assert json.load(f) == json_data
+
+    loaded = imported(filepath)
+    # reverse direction element is imported as one more fiber
+    assert len(loaded) == len(model) + 1
+    assert sorted(loaded.element(uid).el_type for uid in loaded.elements) == \
+           ['GFiber', 'GFiber', 'GRoadm', 'GRoadm', 'GTransceiver', 'GTransceiver']
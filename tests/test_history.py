@@ -0,0 +1,73 @@
+'''
+Tests of undo/redo history of topology model deltas
+'''
+from history import History, element_state, link_state
+from model import TopologyModel
+
+
+# returns comparable state of whole model
+def model_state(model):
+    return {uid: model.element(uid)[:6] for uid in model.elements}, dict(model.links)
+
+
+# adds element and records it, as topology map does
+def add(model, history, el_type, pos):
+    uid = model.add_element(el_type, pos)
+    history.record([('element', uid, None, element_state(model, uid))])
+    return uid
+
+
+# every change is reverted by undo and applied again by redo
+def test_undo_redo():
+    model, history = TopologyModel(), History()
+    states = [model_state(model)]
+    a = add(model, history, 'GRoadm', (0, 0)); states.append(model_state(model))
+    b = add(model, history, 'GFiber', (200, 0)); states.append(model_state(model))
+    model.set_link(a, b)
+    target, state = link_state(model, a, b)
+    history.record([('link', target, None, state)]); states.append(model_state(model))
+    old = model.element(b).params
+    model.set_params(b, (40, 0.2, 'SSMF'))
+    history.record([('params', b, old, model.element(b).params)]); states.append(model_state(model))
+    # removed element is restored with its connections
+    target, state = link_state(model, a, b)
+    removed = element_state(model, b)
+    model.remove_element(b)
+    history.record([('link', target, state, None), ('element', b, removed, None)]); states.append(model_state(model))
+
+    for expected in reversed(states[:-1]):
+        assert history.undo(model) is not None
+        assert model_state(model) == expected
+    assert history.undo(model) is None
+    for expected in states[1:]:
+        assert history.redo(model) is not None
+        assert model_state(model) == expected
+    assert history.redo(model) is None
+
+
+# changes with the same key merge into one entry, a new change drops redo entries
+def test_coalesce():
+    model, history = TopologyModel(), History()
+    uid = add(model, history, 'GRoadm', (0, 0))
+    for x in (10, 20, 30):
+        old = model.element(uid)[2:4]
+        model.move_element(uid, x, 0)
+        history.record([('pos', uid, old, (x, 0))], key=('pos', uid))
+    assert len(history.undo_entries) == 2
+    history.undo(model)
+    assert model.element(uid)[2:4] == (0, 0)
+    assert history.redo_entries
+    add(model, history, 'GFused', (100, 0))
+    assert not history.redo_entries
+
+
+# history is bounded, deltas without change are not recorded
+def test_bounded():
+    model, history = TopologyModel(), History(size=3)
+    for i in range(5):
+        add(model, history, 'GRoadm', (i * 100, 0))
+    history.record([('pos', 0, (0, 0), (0, 0))])
+    assert len(history.undo_entries) == 3
+    for i in range(3):
+        history.undo(model)
+    assert sorted(model.elements) == [0, 1]
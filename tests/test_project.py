@@ -0,0 +1,68 @@
+'''
+Tests of project file streaming writer and reader
+'''
+import json
+import os
+
+import pytest
+
+from model import TopologyModel
+from project import write_project, iter_project, is_project_file
+
+
+# returns model with connected roadm, fiber and transceiver
+def small_model():
+    model = TopologyModel()
+    roadm = model.add_element('GRoadm', (100, 100), (18,), ('R1', 'Riga', 'LV', 56.9, 24.1))
+    fiber = model.add_element('GFiber', (300, 100), (80, 0.2, 'SSMF'))
+    trx = model.add_element('GTransceiver', (100, 300), ('vendorA_trx-type1', 'PS_SP64_1'))
+    model.set_link(roadm, fiber)
+    model.set_link(trx, roadm, 'unidir')
+    return model
+
+
+# model loaded from saved project has the same elements and connections
+def test_round_trip(tmpdir):
+    filepath = str(tmpdir.join('project.json'))
+    model = small_model()
+    write_project(filepath, model.element_records(), model.link_records())
+
+    loaded = TopologyModel()
+    for kind, record in iter_project(filepath):
+        loaded.add_record(kind, record)
+    assert [loaded.element(uid) for uid in loaded.elements] == [model.element(uid) for uid in model.elements]
+    assert loaded.links == model.links
+    assert is_project_file(filepath)
+    # streamed file is still a valid JSON document
+    with open(filepath) as f:
+        assert len(json.load(f)['elements']) == 3
+    assert not os.path.exists(filepath + '.tmp')
+
+
+# project reformatted by other tool is read at once
+def test_reformatted_project(tmpdir):
+    filepath = str(tmpdir.join('project.json'))
+    model = small_model()
+    document = {'project': {'format': 'gui-project', 'version': 1},
+                'elements': list(model.element_records()),
+                'connections': list(model.link_records())}
+    with open(filepath, 'w') as f:
+        json.dump(document, f, indent=4)
+
+    records = list(iter_project(filepath))
+    assert [kind for kind, record in records] == ['element'] * 3 + ['connection'] * 2
+    assert is_project_file(filepath)
+
+
+# other json files and newer project versions are not read as projects
+def test_not_project(tmpdir):
+    network = tmpdir.join('network.json')
+    network.write('{"elements": [], "connections": []}')
+    assert not is_project_file(str(network))
+    with pytest.raises(ValueError):
+        list(iter_project(str(network)))
+
+    newer = tmpdir.join('newer.json')
+    newer.write('{"project": {"format": "gui-project", "version": 99},\n"elements": [\n]}\n')
+    with pytest.raises(ValueError, match='not supported'):
+        list(iter_project(str(newer)))
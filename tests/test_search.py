@@ -0,0 +1,63 @@
+'''
+Tests of element search index and element id lookup of topology model
+'''
+from model import TopologyModel
+from search import SearchIndex, element_terms
+
+
+# returns index of a few elements with site names
+def sites_index():
+    index = SearchIndex()
+    index.update(1, {'riga', 'roadm-1'})
+    index.update(2, {'rigas jurmala'})
+    index.update(3, {'tallinn', 'ssmf'})
+    index.update(4, {'strigaini'})
+    return index
+
+
+# exact term comes first, then terms with the prefix, then terms containing the text
+def test_match_order():
+    index = sites_index()
+    assert index.search('riga') == [1, 2, 4]
+    assert index.search(' RIGA ') == [1, 2, 4]
+    assert index.search('rig', limit=2) == [1, 2]
+    # short text matches only prefixes
+    assert index.search('ga') == []
+    assert index.search('llin') == [3]
+    assert index.search('') == []
+
+
+# replaced and removed terms are not found, unused terms are dropped from index
+def test_update_and_remove():
+    index = sites_index()
+    index.update(3, {'tartu'})
+    assert index.search('tallinn') == []
+    assert index.search('tart') == [3]
+    index.remove(4)
+    assert index.search('riga') == [1, 2]
+    assert 'strigaini' not in index.sorted_terms and 'str' not in index.grams
+    assert len(index) == 3
+
+
+# terms are element id, site and region, and selected type variety
+def test_element_terms():
+    assert element_terms(('ID1', 'Riga', '', 0, 0), (80, 0.2, 'SSMF'),
+                         ('length', 'loss_coef', 'type_variety')) == {'id1', 'riga', 'ssmf'}
+    assert element_terms(('ID1', '', '', 0, 0), ('-- select --', '-- select --'),
+                         ('type_variety', 'trx_format')) == {'id1'}
+
+
+# model searches edited info, element id which is not unique finds the first element
+def test_model_search():
+    model = TopologyModel()
+    a = model.add_element('GRoadm', (0, 0), info=('ID1', 'Riga', '', 0, 0))
+    b = model.add_element('GRoadm', (100, 0), info=('ID1', 'Valmiera', '', 0, 0))
+    assert model.search('riga') == [a]
+    assert model.find_id('ID1') == a
+    model.set_info(a, ('ID7', 'Cesis', '', 0, 0))
+    assert model.search('riga') == []
+    assert model.search('ces') == [a]
+    assert model.find_id('ID1') == b
+    assert model.find_id('ID2') is None
+    # new element id is allocated after the highest one
+    assert model.new_el_id() == 'ID008'
@@ -0,0 +1,98 @@
+'''
+Tests of GNpy path simulation, they are skipped without GNpy
+'''
+import os
+
+import pytest
+
+pytest.importorskip('gnpy')
+pytest.importorskip('networkx')
+
+from conftest import APP_PATH
+from equipment import load_equipment
+from gnpyio import network_json
+from model import TopologyModel
+from simulation import simulate, simulate_all, PathIndex, model_uid
+
+
+# equipment library of application json folder
+@pytest.fixture(scope='module')
+def equipment():
+    return load_equipment(os.path.join(APP_PATH, 'json', 'eqpt_config.json'))
+
+
+# returns model of transceivers connected by elements between them, and uids of transceivers
+def path_model(equipment, *elements):
+    model = TopologyModel()
+    model.set_equipment(equipment)
+    trx = ('vendorA_trx-type1', 'PS_SP64_1')
+    uids = [model.add_element('GTransceiver', (0, 0), trx)]
+    uids += [model.add_element(el_type, (0, 0), params) for el_type, params in elements]
+    uids.append(model.add_element('GTransceiver', (0, 0), trx))
+    for u, v in zip(uids, uids[1:]):
+        model.set_link(u, v, 'unidir')
+    return model, uids[0], uids[-1]
+
+
+# returns destination events of all pairs simulation
+def results(model, equipment):
+    events = simulate_all(network_json(model, 'Advanced', equipment), equipment, 'Advanced', workers=0)
+    return {(event[1], event[2]): event[3] for event in events if event[0] in ('result', 'failed')}
+
+
+# path without amplifiers has no ASE noise, GNpy does not compute OSNR of it
+def test_path_without_amplifiers(equipment):
+    model, source, destination = path_model(equipment, ('GRoadm', None), ('GFiber', (80, 0.2, 'SSMF')),
+                                            ('GRoadm', None))
+    assert not model.not_ready('Advanced')
+    result = results(model, equipment)[(source, destination)]
+    assert 'osnr_ase' not in result and 'snr_01nm' not in result
+    assert result['osnr_nli'] > 0
+
+    # path without fiber has no noise at all
+    model, source, destination = path_model(equipment, ('GRoadm', None))
+    result = results(model, equipment)[(source, destination)]
+    assert set(result) == {'type', 'pout_dbm', 'path'}
+
+
+# amplified path has all metrics, every element result is reported
+def test_amplified_path(equipment):
+    model, source, destination = path_model(equipment, ('GRoadm', None), ('GFiber', (80, 0.2, 'SSMF')),
+                                            ('GEdfa', (16, 0, 'std_medium_gain')), ('GRoadm', None))
+    assert not model.not_ready('Advanced')
+    events = list(simulate(network_json(model, 'Advanced', equipment), equipment, 'Advanced', source))
+    result = next(event[3] for event in events if event[0] == 'result')
+    assert 0 < result['snr_01nm'] < result['osnr_ase_01nm']
+    assert result['path'] == [str(uid) for uid in range(6)]
+    elements = [event[1] for event in events if event[0] == 'element']
+    assert elements == [1, 2, 3, 4, 5]
+
+
+# paths simulated in the same network do not get metrics of previously simulated paths
+def test_paths_independent(equipment):
+    model, source, destination = path_model(equipment, ('GRoadm', None), ('GFiber', (80, 0.2, 'SSMF')),
+                                            ('GEdfa', (16, 0, 'std_medium_gain')), ('GRoadm', None))
+    # transceiver connected to the last roadm has path without noise to the same destination
+    other = model.add_element('GTransceiver', (0, 0), ('vendorA_trx-type1', 'PS_SP64_1'))
+    model.set_link(other, destination - 1, 'unidir')
+    json_data = network_json(model, 'Advanced', equipment)
+
+    all_pairs = results(model, equipment)
+    assert 'snr' in all_pairs[(source, destination)]
+    events = simulate_all(json_data, equipment, 'Advanced', workers=0, pairs=[(other, destination)])
+    alone = next(event[3] for event in events if event[0] == 'result')
+    assert alone == all_pairs[(other, destination)]
+    assert 'snr' not in alone
+
+
+# paths are indexed by model elements they traverse
+def test_path_index():
+    index = PathIndex()
+    index.add((0, 5), ['0', '1', '2', '2_r', 'Edfa0_1', '5'])
+    index.add((5, 0), ['5', '3', '0'])
+    assert model_uid('2_r') == 2 and model_uid('Edfa0_1') is None
+    assert index.affected([2]) == {(0, 5)}
+    assert index.affected([0]) == {(0, 5), (5, 0)}
+    assert index.traversing([0, 3]) == {(5, 0)}
+    index.remove((5, 0))
+    assert 3 not in index.elements
@@ -0,0 +1,44 @@
+'''
+Tests of grid spatial index of topology map elements and connections
+'''
+from spatial import GridIndex, segment_distance
+
+
+# boxes are found by rectangles crossing grid cells and by points inside them
+def test_boxes():
+    index = GridIndex(size=100)
+    index.insert_box('a', 0, 0, 50, 50)
+    index.insert_box('b', 180, 180, 230, 230) # spans four cells
+    index.insert_box('c', 1000, 1000, 1050, 1050)
+
+    assert sorted(index.query(0, 0, 200, 200)) == ['a', 'b']
+    assert index.query(60, 60, 170, 170) == []
+    assert index.box_at(25, 25) == 'a'
+    assert index.box_at(220, 220) == 'b'
+    assert index.box_at(500, 500) is None
+
+    index.remove('b')
+    assert 'b' not in index and len(index) == 2
+    assert index.box_at(220, 220) is None
+    # empty cells are dropped
+    assert all(index.cells.values())
+
+
+# the nearest segment within distance is found, segments crossing many cells are indexed in all of them
+def test_segments():
+    index = GridIndex(size=100)
+    index.insert_segment(('a', 'b'), 0, 0, 1000, 1000)
+    index.insert_segment(('c', 'd'), 0, 10, 1000, 10)
+
+    assert index.segment_at(500, 501, distance=2) == ('a', 'b')
+    assert index.segment_at(800, 11, distance=2) == ('c', 'd')
+    assert index.segment_at(800, 20, distance=2) is None
+    # diagonal segment is not indexed in cells far from it
+    assert ('a', 'b') not in index.query(900, 0, 950, 50)
+
+
+# distance from point to segment is measured to its nearest end outside of it
+def test_segment_distance():
+    assert segment_distance(5, 5, 0, 0, 10, 0) == 5
+    assert segment_distance(-3, 4, 0, 0, 10, 0) == 5
+    assert segment_distance(2, 2, 2, 2, 2, 2) == 0